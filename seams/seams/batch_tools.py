@@ -0,0 +1,332 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Callable
+from seams.bgs_tools import create_subdirectory
+from seams.datastorage import DataStore
+from seams.video_tools import get_video_info, convert_codec, extract_frames, sample_frame_numbers, \
+    plan_codec_conversion, get_converted_video_filename, is_url, oversample_frame_numbers, select_distinct_video_frames
+from seams.metadata_cache import VideoInfoCache
+
+
+def get_max_workers(max_workers:int = None, n_tasks:int = None)->int:
+    """Size of the process pool. By default one worker per CPU, leaving one CPU for the app.
+
+    Args:
+        max_workers (int, optional): upper bound of workers, `None` or 0 to size it to the machine. Defaults to None.
+        n_tasks (int, optional): number of tasks, no more workers than tasks are started. Defaults to None.
+
+    Returns:
+        int: number of workers
+    """
+    if not max_workers:
+        max_workers = max(1, (os.cpu_count() or 2) - 1)
+    if n_tasks:
+        max_workers = min(max_workers, n_tasks)
+    return max(1, max_workers)
+
+
+def get_video_filepath(video_path:str, videos_dirpath:str)->str:
+    """Path of a survey video in `videos_dirpath`, urls of videos on HTTP(S) servers are kept as they are."""
+    video_path = str(video_path)
+    if is_url(video_path):
+        return video_path
+    return os.path.join(videos_dirpath, os.path.basename(video_path))
+
+
+def probe_video(video_filepath:str, video_info_cache:VideoInfoCache = None)->dict:
+    """Checks that a video exists and can be decoded, and reads its codec and duration.
+
+    Args:
+        video_filepath (str): path to the video file or url of the video.
+        video_info_cache (VideoInfoCache, optional): metadata cache to read from and warm. Defaults to None.
+
+    Returns:
+        dict: `exists`, `readable`, `codec`, `duration`, `fps`, `frame_count` and `error`.
+    """
+    probe = {
+        'video_filepath': video_filepath,
+        'exists': os.path.isfile(video_filepath) or is_url(video_filepath),
+        'readable': False,
+        'codec': None,
+        'duration': None,
+        'fps': None,
+        'frame_count': None,
+        'error': None
+        }
+    if not probe['exists']:
+        probe['error'] = 'missing file'
+        return probe
+
+    try:
+        if video_info_cache is not None:
+            video_info = video_info_cache.get_video_info(video_path=video_filepath)
+        else:
+            video_info = get_video_info(video_path=video_filepath)
+    except Exception as e:
+        probe['error'] = str(e)
+    else:
+        probe.update({k: video_info.get(k) for k in ('codec', 'duration', 'fps', 'frame_count')})
+        probe['readable'] = video_info.get('readable', True)
+        if not probe['readable']:
+            probe['error'] = 'the first frame cannot be decoded'
+    return probe
+
+
+def probe_survey_videos(
+    videos_dict:dict, 
+    videos_dirpath:str, 
+    video_info_cache:VideoInfoCache = None, 
+    max_workers:int = None)->dict:
+    """Probes in a thread pool every video referenced by the survey.
+
+    Args:
+        videos_dict (dict): videos per station as returned by `get_videos_per_station`.
+        videos_dirpath (str): directory with the survey videos.
+        video_info_cache (VideoInfoCache, optional): metadata cache to read from and warm. Defaults to None.
+        max_workers (int, optional): maximum number of threads. Defaults to None.
+
+    Returns:
+        dict: probes per station and video name, see `probe_video`.
+    """
+    probes = {station: {} for station in videos_dict}
+    videos = [
+        (station, video_name, get_video_filepath(video_path, videos_dirpath))
+        for station, station_videos in videos_dict.items()
+        for video_name, video_path in station_videos.items()]
+    if not videos:
+        return probes
+
+    # probing waits on I/O and native code, threads are enough
+    with ThreadPoolExecutor(max_workers=get_max_workers(max_workers, len(videos))) as executor:
+        futures = {
+            executor.submit(probe_video, video_filepath, video_info_cache): (station, video_name)
+            for station, video_name, video_filepath in videos}
+        for future in as_completed(futures):
+            station, video_name = futures[future]
+            probes[station][video_name] = future.result()
+    return probes
+
+
+def list_survey_videos(survey_data:dict, surveyID:str, videos_dirpath:str)->list:
+    """Lists every station video of a survey in `survey.yaml` as a preprocessing task.
+
+    Videos already converted by SEAMS (`SEAMS__` prefix) are used instead of their original.
+
+    Args:
+        survey_data (dict): data of the `survey.yaml` file.
+        surveyID (str): survey identifier.
+        videos_dirpath (str): directory with the survey videos.
+
+    Returns:
+        list: list of dictionaries with the `station`, `video_name` and `video_filepath`.
+    """
+    tasks = []
+    stations = survey_data['surveys'][surveyID]['stations']
+    for station_name, station in stations.items():
+        videos = (station.get('media') or {}).get('video') or {}
+        for video_name, video_path in videos.items():
+            if get_converted_video_filename(video_name) in videos:
+                continue
+            tasks.append({
+                'station': station_name,
+                'video_name': video_name,
+                'video_filepath': get_video_filepath(video_path, videos_dirpath)
+                })
+    return tasks
+
+
+def preprocess_video(task:dict)->dict:
+    """Probes a video, converts its codec to H.264 if required and extracts the sampled frames.
+
+    Runs in a worker process of `run_batch_preprocessing`, errors are returned instead of raised.
+
+    Args:
+        task (dict): `station`, `video_name`, `video_filepath`, `frames_dirpath`, `convert`,
+            `conversion_options`, `num_frames`, `n_seconds`, `strategy`, `seed`, `image_format`, `quality`, `decoder_backend`,
+            `remote_cache_dirpath`, `skip_low_quality`, `min_hamming_distance` and `oversample`. 
+            Videos given as url are read with range requests and never converted.
+
+    Returns:
+        dict: the task with the `video_info`, `converted_video`, `frames` and `error` results.
+    """
+    result = dict(task, video_info=None, converted_video=None, frames={}, error=None)
+    video_filepath = task['video_filepath']
+    video_name = task['video_name']
+    try:
+        if not os.path.isfile(video_filepath) and not is_url(video_filepath):
+            raise FileNotFoundError(f'Video file {video_filepath} does not exist')
+
+        video_info = get_video_info(video_path=video_filepath)
+
+        conversion_method = 'none'
+        if task.get('convert') and not is_url(video_filepath):
+            conversion_method = plan_codec_conversion(video_path=video_filepath)
+        if conversion_method != 'none':
+            converted_video_name = get_converted_video_filename(video_name)
+            converted_video_filepath = os.path.join(os.path.dirname(video_filepath), converted_video_name)
+            if not convert_codec(
+                input_file=video_filepath, 
+                output_file=converted_video_filepath, 
+                method=conversion_method, 
+                **(task.get('conversion_options') or {})):
+                raise RuntimeError(f'Video codec conversion failed for {video_filepath}')
+            result['converted_video'] = {converted_video_name: converted_video_filepath}
+            video_filepath = converted_video_filepath
+            video_name = converted_video_name
+            video_info = get_video_info(video_path=video_filepath)
+
+        result['video_info'] = {k: video_info[k] for k in ('fps', 'duration', 'frame_count', 'size', 'codec')}
+
+        frame_numbers = sample_frame_numbers(
+            total_frames=video_info['frame_count'],
+            fps=video_info['fps'],
+            num_frames=task.get('num_frames', 10),
+            strategy=task.get('strategy', 'uniform'),
+            n_seconds=task.get('n_seconds', 5),
+            seed=task.get('seed'))
+        min_hamming_distance = task.get('min_hamming_distance', 0)
+        if min_hamming_distance:
+            frame_numbers = oversample_frame_numbers(
+                frame_numbers=frame_numbers,
+                total_frames=video_info['frame_count'],
+                fps=video_info['fps'],
+                n_seconds=task.get('n_seconds', 5),
+                oversample=task.get('oversample', 3),
+                seed=task.get('seed'))
+
+        frames_dirpath = create_subdirectory(task['frames_dirpath'], video_name)
+        result['frames'] = extract_frames(
+            video_filepath=video_filepath,
+            frames_dirpath=frames_dirpath,
+            frame_numbers=frame_numbers,
+            image_format=task.get('image_format', 'png'),
+            quality=task.get('quality', 90),
+            decoder_backend=task.get('decoder_backend', 'ffmpeg'),
+            remote_cache_dirpath=task.get('remote_cache_dirpath'),
+            skip_low_quality=task.get('skip_low_quality', False)) or {}
+        if min_hamming_distance:
+            # the frames rejected by the quality flags are replaced in place, see `replace_rejected_frames`
+            result['frames'] = select_distinct_video_frames(
+                frames=result['frames'], 
+                frame_numbers=list(result['frames']), 
+                num_frames=task.get('num_frames', 10), 
+                min_hamming_distance=min_hamming_distance)
+    except Exception as e:
+        result['error'] = str(e)
+
+    return result
+
+
+def record_preprocessing_result(ds_survey:DataStore, surveyID:str, result:dict):
+    """Stores the result of `preprocess_video` in the station media of the survey.
+
+    The sampled frames become the station `frames` only if the station has no frames selected yet.
+    """
+    data = ds_survey.storage_strategy.data
+    media = data['surveys'][surveyID]['stations'][result['station']]['media']
+
+    if result['converted_video']:
+        media['video'].update(result['converted_video'])
+
+    media.setdefault('preprocessing', {})[result['video_name']] = {
+        'video_info': result['video_info'],
+        'frames': result['frames'],
+        'error': result['error'],
+        }
+
+    if result['frames'] and not media.get('frames'):
+        media['frames'] = result['frames']
+
+    ds_survey.store_data(data=data)
+
+
+def run_batch_preprocessing(
+    ds_survey:DataStore,
+    surveyID:str,
+    videos_dirpath:str,
+    frames_dirpath:str,
+    convert:bool = False,
+    conversion_options:dict = None,
+    num_frames:int = 10,
+    n_seconds:int = 5,
+    strategy:str = 'uniform',
+    seed:int = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    decoder_backend:str = 'ffmpeg',
+    remote_cache_dirpath:str = None,
+    skip_low_quality:bool = False,
+    min_hamming_distance:int = 0,
+    oversample:int = 3,
+    max_workers:int = None,
+    progress_callback:Callable = None)->list:
+    """Preprocesses every station video of a survey across a bounded process pool.
+
+    Each result is recorded in the datastore as soon as its video is done.
+
+    Args:
+        ds_survey (DataStore): survey datastore.
+        surveyID (str): survey identifier.
+        videos_dirpath (str): directory with the survey videos.
+        frames_dirpath (str): directory where a frames subdirectory is created per video.
+        convert (bool, optional): convert to H.264 mp4 the videos that are not, see `plan_codec_conversion`. Defaults to False.
+        conversion_options (dict, optional): `preset`, `crf` and `threads` of `convert_codec`. Defaults to None.
+        num_frames (int, optional): number of frames sampled per video. Defaults to 10.
+        n_seconds (int, optional): interval in seconds between candidate frames. Defaults to 5.
+        strategy (str, optional): frame sampling strategy. Defaults to 'uniform'.
+        seed (int, optional): seed of the frame sampling. Defaults to None.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        decoder_backend (str, optional): decoder of the sampled frames, see `decoders.DECODERS`. Defaults to 'ffmpeg'.
+        remote_cache_dirpath (str, optional): chunk cache of the videos read from urls. Defaults to None.
+        skip_low_quality (bool, optional): leave out the frames raising quality flags, see `frame_quality`. Defaults to False.
+        min_hamming_distance (int, optional): reject near duplicate frames closer than this Hamming distance of their dHash, 
+            0 disables the rejection, see `select_distinct_video_frames`. Defaults to 0.
+        oversample (int, optional): candidate frames extracted per sampled frame for the near duplicate rejection. Defaults to 3.
+        max_workers (int, optional): maximum number of worker processes. Defaults to None.
+        progress_callback (Callable, optional): called as `progress_callback(n_done, n_total, result)`. Defaults to None.
+
+    Returns:
+        list: results of `preprocess_video`
+    """
+    tasks = list_survey_videos(
+        survey_data=ds_survey.storage_strategy.data,
+        surveyID=surveyID,
+        videos_dirpath=videos_dirpath)
+
+    for task in tasks:
+        task.update({
+            'frames_dirpath': frames_dirpath,
+            'convert': convert,
+            'conversion_options': conversion_options,
+            'num_frames': num_frames,
+            'n_seconds': n_seconds,
+            'strategy': strategy,
+            'seed': seed,
+            'image_format': image_format,
+            'quality': quality,
+            'decoder_backend': decoder_backend,
+            'remote_cache_dirpath': remote_cache_dirpath,
+            'skip_low_quality': skip_low_quality,
+            'min_hamming_distance': min_hamming_distance,
+            'oversample': oversample,
+            })
+
+    results = []
+    if not tasks:
+        return results
+
+    with ProcessPoolExecutor(max_workers=get_max_workers(max_workers, len(tasks))) as executor:
+        futures = {executor.submit(preprocess_video, task): task for task in tasks}
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = dict(futures[future], video_info=None, converted_video=None, frames={}, error=str(e))
+
+            record_preprocessing_result(ds_survey=ds_survey, surveyID=surveyID, result=result)
+            results.append(result)
+            if progress_callback is not None:
+                progress_callback(n_done, len(tasks), result)
+
+    return results
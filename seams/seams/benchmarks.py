@@ -0,0 +1,586 @@
+"""Benchmarks for the video processing tools.
+
+Usage (from the `seams` app directory):
+
+    `python -m seams.benchmarks extraction --video /path/to/video.mp4 --n-seconds 5`
+    `python -m seams.benchmarks image-formats --video /path/to/video.mp4 --num-frames 10 --quality 90`
+    `python -m seams.benchmarks decoders --video /path/to/video.mp4 --num-frames 10`
+    `python -m seams.benchmarks frame-selection --video /path/to/video.mp4 --n-seconds 5 --min-hamming-distance 10`
+    `python -m seams.benchmarks point-sampling --width 1920 --height 1080 --n-points 10 100 1000 5000`
+    `python -m seams.benchmarks suite --videos-dir /tmp/seams_videos --codecs h264 hevc --resolutions 720p 1080p --minutes 1 5 --output results.json`
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import argparse
+import threading
+import subprocess
+import numpy as np
+from PIL import Image
+from seams.video_tools import get_video_info, extract_frames_every_n_seconds, get_keyframe_index, grab_frames, \
+    sample_frame_numbers, convert_codec, IMAGE_FORMATS, get_candidate_frames, select_random_frames
+from seams.frame_hashes import get_frame_hashes
+from seams.markers import POINT_SAMPLERS, sample_points
+from seams.decoders import get_available_decoders, get_decoder
+from seams.jobs import APP_DIRPATH, get_python_env
+
+
+# encoder options of the synthetic test videos
+SYNTHETIC_CODECS = {
+    'h264': ['-c:v', 'libx264', '-tag:v', 'avc1'],
+    'hevc': ['-c:v', 'libx265', '-tag:v', 'hvc1', '-x265-params', 'log-level=error'],
+    }
+SYNTHETIC_RESOLUTIONS = {
+    '720p': '1280x720',
+    '1080p': '1920x1080',
+    '1440p': '2560x1440',
+    '4k': '3840x2160',
+    }
+SUITE_OPERATIONS = ('get_video_info', 'extract_frames_every_n_seconds', 'convert_codec')
+
+
+def timeit(func, *args, **kwargs)->tuple:
+    """Calls `func` and measures the wall time.
+
+    Returns:
+        tuple: (elapsed seconds, value returned by `func`)
+    """
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    return time.perf_counter() - start, value
+
+
+def benchmark_frame_extraction(video_path:str, n_seconds:int = 5, modes:tuple = ('single_pass', 'per_frame'))->dict:
+    """Compares the frame extraction modes of `extract_frames_every_n_seconds` on the same video.
+
+    Each mode writes the frames in its own temporary directory which is removed afterwards.
+
+    Args:
+        video_path (str): path to the video file.
+        n_seconds (int, optional): sampling interval in seconds. Defaults to 5.
+        modes (tuple, optional): extraction modes to compare. Defaults to ('single_pass', 'per_frame').
+
+    Returns:
+        dict: Keys as extraction mode and values with the elapsed seconds and number of frames extracted.
+    """
+    video_info = get_video_info(video_path=video_path)
+    results = {}
+    for mode in modes:
+        output_dir = tempfile.mkdtemp(prefix=f'seams_bench_{mode}_')
+        try:
+            elapsed, frames = timeit(
+                extract_frames_every_n_seconds,
+                video_path=video_path,
+                output_dir=output_dir,
+                n_seconds=n_seconds,
+                total_frames=video_info['frame_count'],
+                fps=video_info['fps'],
+                mode=mode)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        results[mode] = {
+            'seconds': elapsed,
+            'frames': len(frames),
+            'frames_per_second': len(frames) / elapsed if elapsed > 0 else None
+            }
+    return results
+
+
+def benchmark_image_formats(
+    video_path:str, 
+    num_frames:int = 10, 
+    image_formats:tuple = IMAGE_FORMATS, 
+    quality:int = 90)->dict:
+    """Compares the frame image formats on the same sampled frames of a video.
+
+    The encode time is the time `grab_frames` takes to write the frames. The video decoding is 
+    the same for every format, so the differences come from the image encoder. The decode time is 
+    the time to open the frames with PIL, as `dotpoints_grid` does.
+
+    Args:
+        video_path (str): path to the video file.
+        num_frames (int, optional): number of frames sampled uniformly over the video. Defaults to 10.
+        image_formats (tuple, optional): image formats to compare. Defaults to IMAGE_FORMATS.
+        quality (int, optional): quality of the lossy image formats. Defaults to 90.
+
+    Returns:
+        dict: Keys as image format and values with the encode and decode seconds and the size of the frames.
+    """
+    video_info = get_video_info(video_path=video_path)
+    frame_numbers = sample_frame_numbers(
+        total_frames=video_info['frame_count'], 
+        fps=video_info['fps'], 
+        num_frames=num_frames, 
+        strategy='uniform')
+    keyframe_index = get_keyframe_index(video_path=video_path)
+
+    results = {}
+    for image_format in image_formats:
+        output_dir = tempfile.mkdtemp(prefix=f'seams_bench_{image_format}_')
+        try:
+            encode_seconds, frames = timeit(
+                grab_frames,
+                video_path=video_path,
+                frame_numbers=frame_numbers,
+                output_dir=output_dir,
+                keyframe_index=keyframe_index,
+                image_format=image_format,
+                quality=quality)
+
+            def decode_frames():
+                for filepath in frames.values():
+                    with Image.open(filepath) as image:
+                        image.load()
+
+            decode_seconds, _ = timeit(decode_frames)
+            sizes = [os.path.getsize(filepath) for filepath in frames.values()]
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        results[image_format] = {
+            'frames': len(frames),
+            'encode_seconds': encode_seconds,
+            'decode_seconds': decode_seconds,
+            'total_bytes': sum(sizes),
+            'mean_bytes_per_frame': sum(sizes) / len(sizes) if sizes else None
+            }
+    return results
+
+
+def benchmark_decoders(video_path:str, num_frames:int = 10, decoder_backends:tuple = None)->dict:
+    """Compares the decoder backends decoding the same sampled frames of a video to NumPy arrays.
+
+    `grab_frames` writing PNG files with the `ffmpeg` CLI is timed too, as the reference 
+    of the subprocess and temporary files path.
+
+    Args:
+        video_path (str): path to the video file.
+        num_frames (int, optional): number of frames sampled uniformly over the video. Defaults to 10.
+        decoder_backends (tuple, optional): decoders to compare. Defaults to every available decoder.
+
+    Returns:
+        dict: Keys as decoder backend and values with the elapsed seconds and number of frames decoded.
+    """
+    video_info = get_video_info(video_path=video_path)
+    frame_numbers = sample_frame_numbers(
+        total_frames=video_info['frame_count'], 
+        fps=video_info['fps'], 
+        num_frames=num_frames, 
+        strategy='uniform')
+    keyframe_index = get_keyframe_index(video_path=video_path)
+
+    results = {}
+    for decoder_backend in decoder_backends or get_available_decoders():
+        decoder = get_decoder(decoder_backend)
+        elapsed, frames = timeit(lambda: [n for n, _ in decoder(video_path, frame_numbers, keyframe_index=keyframe_index)])
+        results[decoder_backend] = {
+            'seconds': elapsed,
+            'frames': len(frames),
+            'frames_per_second': len(frames) / elapsed if elapsed > 0 else None
+            }
+
+    output_dir = tempfile.mkdtemp(prefix='seams_bench_grab_frames_')
+    try:
+        elapsed, frames = timeit(
+            grab_frames, 
+            video_path=video_path, 
+            frame_numbers=frame_numbers, 
+            output_dir=output_dir, 
+            keyframe_index=keyframe_index)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    results['grab_frames_png'] = {
+        'seconds': elapsed,
+        'frames': len(frames),
+        'frames_per_second': len(frames) / elapsed if elapsed > 0 else None
+        }
+    return results
+
+
+def benchmark_frame_selection(
+    video_path:str, 
+    n_seconds:int = 5, 
+    num_frames:int = 10, 
+    min_hamming_distance:int = 10)->dict:
+    """Times the near duplicate rejection of `select_random_frames` over the candidate frames of a video.
+
+    The candidate frames every `n_seconds` are extracted in a temporary directory, then hashed
+    twice (the second time from the hash cache) and selected.
+
+    Returns:
+        dict: number of candidates, seconds of the hashing, cached hashing and selection, and the selected frames.
+    """
+    video_info = get_video_info(video_path=video_path)
+    candidates = get_candidate_frames(total_frames=video_info['frame_count'], fps=video_info['fps'], n_seconds=n_seconds)
+    output_dir = tempfile.mkdtemp(prefix='seams_bench_frame_selection_')
+    try:
+        frames = grab_frames(video_path=video_path, frame_numbers=candidates, output_dir=output_dir, image_format='jpeg')
+        hash_seconds, _ = timeit(get_frame_hashes, frames)
+        cached_hash_seconds, hashes = timeit(get_frame_hashes, frames)
+        select_seconds, selected = timeit(
+            select_random_frames, 
+            frames, 
+            num_frames=num_frames, 
+            min_hamming_distance=min_hamming_distance, 
+            hashes=hashes, 
+            seed=0)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        'candidates': len(frames),
+        'hash_seconds': hash_seconds,
+        'cached_hash_seconds': cached_hash_seconds,
+        'select_seconds': select_seconds,
+        'selected_frames': sorted(selected)
+        }
+
+
+def benchmark_point_sampling(
+    width:int = 1920, 
+    height:int = 1080, 
+    n_points:tuple = (10, 100, 1000, 5000), 
+    strategies:tuple = None, 
+    repeat:int = 5)->dict:
+    """Times every dotpoint sampling strategy of `markers.POINT_SAMPLERS` per number of points.
+
+    Returns:
+        dict: per strategy and number of points the best `seconds` of `repeat` runs, the `points` 
+            returned and their `min_distance` in pixels.
+    """
+    results = {}
+    for strategy in strategies or POINT_SAMPLERS:
+        results[strategy] = {}
+        for n in n_points:
+            elapsed = []
+            for seed in range(repeat):
+                seconds, points = timeit(sample_points, width=width, height=height, n_points=n, strategy=strategy, seed=seed)
+                elapsed.append(seconds)
+            # nearest neighbour distance in chunks, bounded memory for thousands of points
+            min_distance = None
+            if len(points) > 1:
+                min_distance = min(
+                    float(np.sqrt(np.partition(((points[i:i + 500, None] - points[None]) ** 2).sum(axis=2), 1, axis=1)[:, 1].min()))
+                    for i in range(0, len(points), 500))
+            results[strategy][n] = {'seconds': min(elapsed), 'points': len(points), 'min_distance': min_distance}
+    return results
+
+
+def generate_synthetic_video(
+    videos_dirpath:str, 
+    codec:str = 'h264', 
+    resolution:str = '1080p', 
+    minutes:float = 1, 
+    fps:int = 25)->str:
+    """Generates with the `ffmpeg` `testsrc2` source a test video, reused if it already exists.
+
+    `testsrc2` has moving patterns and a frame counter, the encoder cannot skip frames as with a still image.
+
+    Args:
+        videos_dirpath (str): directory of the test videos.
+        codec (str, optional): `h264` or `hevc`, see `SYNTHETIC_CODECS`. Defaults to 'h264'.
+        resolution (str, optional): key of `SYNTHETIC_RESOLUTIONS` or `<width>x<height>`. Defaults to '1080p'.
+        minutes (float, optional): duration in minutes. Defaults to 1.
+        fps (int, optional): frames per second. Defaults to 25.
+
+    Returns:
+        str: path to the test video.
+    """
+    size = SYNTHETIC_RESOLUTIONS.get(resolution, resolution)
+    video_filepath = os.path.join(videos_dirpath, f'synthetic_{codec}_{size}_{minutes:g}min_{fps}fps.mp4')
+    if os.path.isfile(video_filepath):
+        return video_filepath
+
+    os.makedirs(videos_dirpath, exist_ok=True)
+    temp_filepath = f'{os.path.splitext(video_filepath)[0]}.partial.mp4'
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', 
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}:duration={minutes * 60:g}',
+        *SYNTHETIC_CODECS[codec], '-preset', 'ultrafast', '-g', str(2 * fps), '-pix_fmt', 'yuv420p',
+        '-y', temp_filepath], check=True)
+    os.replace(temp_filepath, video_filepath)
+    return video_filepath
+
+
+def get_peak_rss_mb()->float:
+    """Peak resident memory in MB of this process."""
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1024**2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def get_descendant_pids(pid:int)->list:
+    """Pids of the child processes of `pid` and of their children, from `/proc` (Linux only)."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # the process name in parentheses may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    descendants, pending = [], list(children.get(pid, []))
+    while pending:
+        child = pending.pop()
+        descendants.append(child)
+        pending.extend(children.get(child, []))
+    return descendants
+
+
+def get_peak_rss_kb(pid:int)->int:
+    """`VmHWM` (peak resident memory) in KB of a process, `None` if it exited."""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class ChildrenMemoryMonitor:
+    """Peak resident memory of the child processes (i.e. `ffmpeg`) polled from `/proc`.
+
+    `RUSAGE_CHILDREN` is not used: its peak includes the memory of the Python process the 
+    children were forked from. `VmHWM` of a child counts only the program it executes,
+    growth after the last poll of a child is missed. Not available outside Linux.
+
+    Usage:
+    ```
+    with ChildrenMemoryMonitor() as monitor:
+        convert_codec(...)
+    monitor.peak_rss_mb
+    ```
+    """
+    def __init__(self, poll_interval:float = 0.02):
+        self.poll_interval = poll_interval
+        self.available = os.path.isdir('/proc/self')
+        self.peak_kb = {}
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.poll, daemon=True)
+
+    def poll(self):
+        pid = os.getpid()
+        while not self.stop_event.is_set():
+            for child in get_descendant_pids(pid):
+                peak_kb = get_peak_rss_kb(child)
+                if peak_kb is not None:
+                    self.peak_kb[child] = max(peak_kb, self.peak_kb.get(child, 0))
+            self.stop_event.wait(self.poll_interval)
+
+    @property
+    def peak_rss_mb(self)->float:
+        """Largest peak in MB of a single child process, 0 without children, `None` if not available."""
+        if not self.available:
+            return None
+        return max(self.peak_kb.values(), default=0) / 1024
+
+    def __enter__(self):
+        if self.available:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.available:
+            self.stop_event.set()
+            self.thread.join()
+
+
+def run_operation(operation:str, video_path:str, output_dir:str)->dict:
+    """Runs and times one video operation. Called in a fresh process by `benchmark_operation`.
+
+    Returns:
+        dict: `seconds`, the peak RSS in MB of the process and of its largest child process.
+    """
+    with ChildrenMemoryMonitor() as monitor:
+        elapsed = time_operation(operation=operation, video_path=video_path, output_dir=output_dir)
+    return {'seconds': elapsed, 'peak_rss_mb': {'python': get_peak_rss_mb(), 'children': monitor.peak_rss_mb}}
+
+
+def time_operation(operation:str, video_path:str, output_dir:str)->float:
+    if operation == 'get_video_info':
+        elapsed, _ = timeit(get_video_info, video_path=video_path)
+    elif operation == 'extract_frames_every_n_seconds':
+        video_info = get_video_info(video_path=video_path)
+        elapsed, _ = timeit(
+            extract_frames_every_n_seconds,
+            video_path=video_path,
+            output_dir=output_dir,
+            n_seconds=5,
+            total_frames=video_info['frame_count'],
+            fps=video_info['fps'])
+    elif operation == 'convert_codec':
+        elapsed, _ = timeit(
+            convert_codec,
+            input_file=video_path,
+            output_file=os.path.join(output_dir, 'converted.mp4'),
+            method='transcode',
+            preset='veryfast')
+    else:
+        raise ValueError(f'Unknown operation `{operation}`. Use one of {SUITE_OPERATIONS}')
+    return elapsed
+
+
+def benchmark_operation(operation:str, video_path:str)->dict:
+    """Times a video operation in a separate process, so the peak RSS is the one of that operation only.
+
+    Returns:
+        dict: `seconds`, `frames_per_second`, `mb_per_second`, `peak_rss_mb_python` of the Python process and
+            `peak_rss_mb_children` of its largest child process (i.e. `ffmpeg`), see `ChildrenMemoryMonitor`.
+    """
+    video_info = get_video_info(video_path=video_path)
+    output_dir = tempfile.mkdtemp(prefix=f'seams_bench_{operation}_')
+    try:
+        result = subprocess.run([
+            sys.executable, '-m', 'seams.benchmarks', 'operation', 
+            '--operation', operation, '--video', video_path, '--output-dir', output_dir],
+            cwd=APP_DIRPATH, env=get_python_env(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f'exit code {result.returncode}'}
+
+    measure = json.loads(result.stdout.strip().splitlines()[-1])
+    seconds = measure['seconds']
+    return {
+        'seconds': seconds,
+        'frames_per_second': video_info['frame_count'] / seconds if seconds > 0 else None,
+        'mb_per_second': video_info['size'] / 1024**2 / seconds if seconds > 0 else None,
+        'peak_rss_mb_python': measure['peak_rss_mb']['python'],
+        'peak_rss_mb_children': measure['peak_rss_mb']['children'],
+        }
+
+
+def benchmark_suite(
+    videos_dirpath:str, 
+    codecs:tuple = ('h264', 'hevc'), 
+    resolutions:tuple = ('720p', '1080p', '4k'), 
+    minutes:tuple = (1,), 
+    operations:tuple = SUITE_OPERATIONS)->dict:
+    """Times every video operation on synthetic videos of every codec, resolution and duration.
+
+    Args:
+        videos_dirpath (str): directory of the synthetic videos, generated once and reused.
+        codecs (tuple, optional): codecs of the videos. Defaults to ('h264', 'hevc').
+        resolutions (tuple, optional): resolutions of the videos. Defaults to ('720p', '1080p', '4k').
+        minutes (tuple, optional): durations of the videos in minutes. Defaults to (1,).
+        operations (tuple, optional): operations to time, see `SUITE_OPERATIONS`. Defaults to SUITE_OPERATIONS.
+
+    Returns:
+        dict: `machine` description and `results`, one per video and operation.
+    """
+    results = []
+    for codec in codecs:
+        for resolution in resolutions:
+            for duration in minutes:
+                video_path = generate_synthetic_video(
+                    videos_dirpath=videos_dirpath, codec=codec, resolution=resolution, minutes=duration)
+                video_info = get_video_info(video_path=video_path)
+                for operation in operations:
+                    result = {
+                        'codec': codec,
+                        'resolution': resolution,
+                        'minutes': duration,
+                        'frame_count': video_info['frame_count'],
+                        'size_mb': video_info['size'] / 1024**2,
+                        'operation': operation,
+                        }
+                    result.update(benchmark_operation(operation=operation, video_path=video_path))
+                    results.append(result)
+                    print(json.dumps(result), file=sys.stderr)
+    return {
+        'machine': {'cpu_count': os.cpu_count(), 'platform': sys.platform, 'python': sys.version.split()[0]},
+        'results': results
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SEAMS video tools benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    extraction_parser = subparsers.add_parser('extraction', help='single pass vs per frame extraction')
+    extraction_parser.add_argument('--video', required=True, help='path to the video file')
+    extraction_parser.add_argument('--n-seconds', type=int, default=5, help='sampling interval in seconds')
+
+    image_formats_parser = subparsers.add_parser('image-formats', help='encode time, decode time and size per frame image format')
+    image_formats_parser.add_argument('--video', required=True, help='path to the video file')
+    image_formats_parser.add_argument('--num-frames', type=int, default=10, help='number of sampled frames')
+    image_formats_parser.add_argument('--quality', type=int, default=90, help='quality of the lossy image formats')
+
+    decoders_parser = subparsers.add_parser('decoders', help='ffmpeg CLI vs OpenCV vs PyAV decoding')
+    decoders_parser.add_argument('--video', required=True, help='path to the video file')
+    decoders_parser.add_argument('--num-frames', type=int, default=10, help='number of sampled frames')
+
+    frame_selection_parser = subparsers.add_parser('frame-selection', help='perceptual hashing and near duplicate rejection')
+    frame_selection_parser.add_argument('--video', required=True, help='path to the video file')
+    frame_selection_parser.add_argument('--n-seconds', type=int, default=5, help='interval in seconds between candidate frames')
+    frame_selection_parser.add_argument('--num-frames', type=int, default=10, help='number of selected frames')
+    frame_selection_parser.add_argument('--min-hamming-distance', type=int, default=10, help='minimum Hamming distance between selected frames')
+
+    point_sampling_parser = subparsers.add_parser('point-sampling', help='dotpoint sampling strategies per number of points')
+    point_sampling_parser.add_argument('--width', type=int, default=1920, help='image width in pixels')
+    point_sampling_parser.add_argument('--height', type=int, default=1080, help='image height in pixels')
+    point_sampling_parser.add_argument('--n-points', nargs='+', type=int, default=[10, 100, 1000, 5000])
+    point_sampling_parser.add_argument('--strategies', nargs='+', default=list(POINT_SAMPLERS), choices=list(POINT_SAMPLERS))
+
+    suite_parser = subparsers.add_parser('suite', help='video operations on synthetic videos per codec, resolution and duration')
+    suite_parser.add_argument('--videos-dir', required=True, help='directory of the synthetic videos, reused between runs')
+    suite_parser.add_argument('--codecs', nargs='+', default=['h264', 'hevc'], choices=list(SYNTHETIC_CODECS))
+    suite_parser.add_argument('--resolutions', nargs='+', default=['720p', '1080p', '4k'], help='e.g. 720p 1080p 4k or 1920x1080')
+    suite_parser.add_argument('--minutes', nargs='+', type=float, default=[1], help='durations of the videos in minutes')
+    suite_parser.add_argument('--operations', nargs='+', default=list(SUITE_OPERATIONS), choices=list(SUITE_OPERATIONS))
+    suite_parser.add_argument('--output', help='json file of the results, printed if not given')
+
+    # used by the suite to run each operation in its own process
+    operation_parser = subparsers.add_parser('operation')
+    operation_parser.add_argument('--operation', required=True, choices=list(SUITE_OPERATIONS))
+    operation_parser.add_argument('--video', required=True)
+    operation_parser.add_argument('--output-dir', required=True)
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'extraction':
+        results = benchmark_frame_extraction(video_path=os.path.abspath(args.video), n_seconds=args.n_seconds)
+    elif args.benchmark == 'image-formats':
+        results = benchmark_image_formats(
+            video_path=os.path.abspath(args.video), num_frames=args.num_frames, quality=args.quality)
+    elif args.benchmark == 'decoders':
+        results = benchmark_decoders(video_path=os.path.abspath(args.video), num_frames=args.num_frames)
+    elif args.benchmark == 'frame-selection':
+        results = benchmark_frame_selection(
+            video_path=os.path.abspath(args.video), 
+            n_seconds=args.n_seconds, 
+            num_frames=args.num_frames, 
+            min_hamming_distance=args.min_hamming_distance)
+    elif args.benchmark == 'point-sampling':
+        results = benchmark_point_sampling(
+            width=args.width, height=args.height, n_points=args.n_points, strategies=args.strategies)
+    elif args.benchmark == 'suite':
+        results = benchmark_suite(
+            videos_dirpath=os.path.abspath(args.videos_dir), 
+            codecs=args.codecs, 
+            resolutions=args.resolutions, 
+            minutes=args.minutes, 
+            operations=args.operations)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            return
+    elif args.benchmark == 'operation':
+        results = run_operation(operation=args.operation, video_path=os.path.abspath(args.video), output_dir=args.output_dir)
+        print(json.dumps(results))
+        return
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""Pluggable video decoders handing the decoded frames to Python as NumPy arrays.
+
+Every decoder yields `(frame_number, image)` tuples, `image` being a BGR `uint8` array of
+shape (height, width, 3) as used by OpenCV. Frame numbers are positions in the presentation
+order of the keyframe/PTS index (see `video_tools.get_keyframe_index`), the same numbers used
+by `grab_frames`.
+
+Usage:
+```
+decoder = get_decoder('pyav')
+for frame_number, image in decoder(video_path, frame_numbers=[0, 250, 500]):
+    ...
+```
+"""
+import os
+import bisect
+import shutil
+import subprocess
+from typing import Callable, Iterator
+import cv2
+import numpy as np
+from seams.video_tools import get_keyframe_index, group_frames_by_keyframe, get_seek_time, \
+    get_image_output_options, get_partial_dirpath, probe_video_stream
+from seams.frame_quality import compute_frame_quality, is_usable_frame
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+DECODERS = {}
+
+
+def register_decoder(name:str):
+    """Registers a decoder function under `name`."""
+    def decorator(func:Callable)->Callable:
+        DECODERS[name] = func
+        return func
+    return decorator
+
+
+def get_available_decoders()->list:
+    """Names of the decoders whose dependencies are installed."""
+    return [name for name in DECODERS if name != 'pyav' or av is not None]
+
+
+def get_decoder(name:str)->Callable:
+    """Decoder registered as `name`.
+
+    Raises:
+        ValueError: if the decoder does not exist or its dependency is not installed.
+    """
+    if name not in DECODERS:
+        raise ValueError(f'Unknown decoder backend `{name}`. Use one of {list(DECODERS)}')
+    if name not in get_available_decoders():
+        raise ValueError(f'The decoder backend `{name}` is not available, install `av` (PyAV)')
+    return DECODERS[name]
+
+
+def get_frame_number(pts_time:list, time:float)->int:
+    """Frame number of the frame presented at `time` seconds, the nearest timestamp of the index."""
+    position = bisect.bisect_left(pts_time, time)
+    if position == len(pts_time) or (position > 0 and time - pts_time[position - 1] < pts_time[position] - time):
+        position -= 1
+    return position
+
+
+@register_decoder('ffmpeg')
+def decode_frames_ffmpeg(video_path:str, frame_numbers:list, keyframe_index:dict = None)->Iterator[tuple]:
+    """Decodes with the `ffmpeg` CLI, the frames are read as raw BGR pixels from its stdout.
+
+    Seeks and selects every group of frames like `grab_frames`, without temporary files.
+    """
+    if keyframe_index is None:
+        keyframe_index = get_keyframe_index(video_path=video_path)
+    pts_time = keyframe_index['pts_time']
+    stream = probe_video_stream(video_path=video_path)
+    width, height = int(stream['width']), int(stream['height'])
+    frame_size = width * height * 3
+
+    for group in group_frames_by_keyframe(keyframe_index, [i for i in frame_numbers if 0 <= i < len(pts_time)]):
+        first = group[0]
+        select = '+'.join(['eq(n\\,{})'.format(i - first) for i in group])
+        process = subprocess.Popen([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-noautorotate',
+            '-ss', f'{get_seek_time(pts_time, first):.6f}', '-i', video_path,
+            '-vf', f'select={select}', '-vsync', 'vfr', '-frames:v', str(len(group)),
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            for frame_number in group:
+                buffer = process.stdout.read(frame_size)
+                if len(buffer) < frame_size:
+                    break
+                yield frame_number, np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+
+@register_decoder('opencv')
+def decode_frames_opencv(video_path:str, frame_numbers:list, keyframe_index:dict = None)->Iterator[tuple]:
+    """Decodes with OpenCV `VideoCapture` in this process.
+
+    Inside a group of frames (see `group_frames_by_keyframe`) the capture moves forward with `grab`,
+    which does not convert the skipped frames, and seeks with `CAP_PROP_POS_FRAMES` between groups.
+    """
+    if keyframe_index is None:
+        keyframe_index = get_keyframe_index(video_path=video_path)
+    total_frames = len(keyframe_index['pts_time'])
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        position = 0
+        for group in group_frames_by_keyframe(keyframe_index, [i for i in frame_numbers if 0 <= i < total_frames]):
+            if group[0] != position:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, group[0])
+                position = group[0]
+            for frame_number in group:
+                while position < frame_number and cap.grab():
+                    position += 1
+                ok, image = cap.read()
+                if not ok:
+                    return
+                position += 1
+                yield frame_number, image
+    finally:
+        cap.release()
+
+
+@register_decoder('pyav')
+def decode_frames_pyav(video_path:str, frame_numbers:list, keyframe_index:dict = None)->Iterator[tuple]:
+    """Decodes with PyAV (`libav` bindings) in this process.
+
+    Seeks to the keyframe before every group of frames and identifies each decoded
+    frame by its presentation timestamp, so frames are exact with B-frames or variable frame rate.
+    """
+    if av is None:
+        raise ImportError('PyAV is not installed, install `av` to use the `pyav` decoder backend')
+    if keyframe_index is None:
+        keyframe_index = get_keyframe_index(video_path=video_path)
+    pts_time = keyframe_index['pts_time']
+
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        for group in group_frames_by_keyframe(keyframe_index, [i for i in frame_numbers if 0 <= i < len(pts_time)]):
+            targets = set(group)
+            container.seek(int(pts_time[group[0]] / stream.time_base), stream=stream, backward=True, any_frame=False)
+            for frame in container.decode(stream):
+                if frame.pts is None:
+                    continue
+                frame_number = get_frame_number(pts_time, float(frame.pts * stream.time_base))
+                if frame_number in targets:
+                    targets.discard(frame_number)
+                    yield frame_number, frame.to_ndarray(format='bgr24')
+                if not targets or frame_number > group[-1]:
+                    break
+
+
+def get_imwrite_params(image_format:str, quality:int)->list:
+    """`cv2.imwrite` parameters of the frame image formats, see `video_tools.IMAGE_FORMATS`."""
+    quality = min(max(int(quality), 1), 100)
+    if image_format == 'jpeg':
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif image_format == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return []
+
+
+def write_decoded_frames(
+    decoded_frames:Iterator[tuple],
+    n_frames:int,
+    output_dir:str,
+    prefix:str = 'frame',
+    progress_callback:Callable = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    checkpoint_callback:Callable = None,
+    skip_low_quality:bool = False)->dict:
+    """Writes with OpenCV the `(frame_number, image)` tuples of a decoder as `<prefix><frame_number>.<extension>`.
+
+    Each image is written in a scratch directory and moved to `output_dir` once complete. The quality 
+    metrics of every frame (see `frame_quality`) are computed on the decoded image before writing it.
+
+    Args:
+        decoded_frames (Iterator[tuple]): `(frame_number, image)` tuples of a decoder.
+        n_frames (int): number of frames expected, for the progress.
+        output_dir (str): directory where the frames are saved.
+        prefix (str, optional): prefix of the frame filenames. Defaults to 'frame'.
+        progress_callback (Callable, optional): called with the fraction of frames done. Defaults to None.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        checkpoint_callback (Callable, optional): called with each frame written and its quality metrics 
+            as dicts. Defaults to None.
+        skip_low_quality (bool, optional): frames raising quality flags are not written. Defaults to False.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    prefix = prefix.strip().replace(" ", "_")
+    extension, _ = get_image_output_options(image_format=image_format, quality=quality)
+    imwrite_params = get_imwrite_params(image_format=image_format, quality=quality)
+
+    frames = {}
+    partial_dirpath = get_partial_dirpath(output_dir=output_dir, prefix=prefix)
+    try:
+        for frame_number, image in decoded_frames:
+            metrics = compute_frame_quality(image)
+            if skip_low_quality and not is_usable_frame(metrics):
+                continue
+            filename = f'{prefix}%06d.{extension}' % frame_number
+            temp_file_path = os.path.join(partial_dirpath, filename)
+            if not cv2.imwrite(temp_file_path, image, imwrite_params):
+                print(f'Error occurred while writing frame {frame_number}')
+                continue
+            file_path = os.path.join(output_dir, filename)
+            os.replace(temp_file_path, file_path)
+            frames[frame_number] = file_path
+            if checkpoint_callback is not None:
+                checkpoint_callback({frame_number: file_path}, {frame_number: metrics})
+            if progress_callback is not None:
+                progress_callback(len(frames) / max(1, n_frames))
+    finally:
+        shutil.rmtree(partial_dirpath, ignore_errors=True)
+
+    return frames
+
+
+def grab_frames_in_process(
+    video_path:str,
+    frame_numbers:list,
+    output_dir:str,
+    decoder_backend:str = 'opencv',
+    prefix:str = 'frame',
+    keyframe_index:dict = None,
+    progress_callback:Callable = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    checkpoint_callback:Callable = None,
+    skip_low_quality:bool = False)->dict:
+    """Same as `video_tools.grab_frames` decoding with an in-process decoder backend and writing with OpenCV.
+
+    Args:
+        video_path (str): path to the video file.
+        frame_numbers (list): frame numbers to extract.
+        output_dir (str): directory where the frames are saved.
+        decoder_backend (str, optional): name of the decoder, see `DECODERS`. Defaults to 'opencv'.
+        prefix (str, optional): prefix of the frame filenames. Defaults to 'frame'.
+        keyframe_index (dict, optional): index from `get_keyframe_index`. Built if not given. Defaults to None.
+        progress_callback (Callable, optional): called with the fraction of frames done. Defaults to None.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        checkpoint_callback (Callable, optional): called with each frame written and its quality metrics 
+            as dicts. Defaults to None.
+        skip_low_quality (bool, optional): frames raising quality flags are not written. Defaults to False.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    decoder = get_decoder(decoder_backend)
+    return write_decoded_frames(
+        decoded_frames=decoder(video_path, frame_numbers, keyframe_index=keyframe_index),
+        n_frames=len(frame_numbers),
+        output_dir=output_dir,
+        prefix=prefix,
+        progress_callback=progress_callback,
+        image_format=image_format,
+        quality=quality,
+        checkpoint_callback=checkpoint_callback,
+        skip_low_quality=skip_low_quality)
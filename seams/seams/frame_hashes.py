@@ -0,0 +1,185 @@
+"""Perceptual hashes (dHash) of the frames to reject near duplicates.
+
+A 64 bit difference hash compares the luminance of neighbouring pixels of the frame reduced
+to 9x8 pixels. Frames of a camera resting on the seafloor have hashes a few bits apart, the
+Hamming distance between two hashes counts the differing bits.
+
+Hashes are cached per frames directory in `frame_hashes.json`, with the size and modification
+time of every frame file, so each frame is hashed once.
+
+Usage:
+```
+hashes = get_frame_hashes(frames)
+distances = hamming_distances(hashes[frame_number], [hashes[i] for i in frames])
+```
+"""
+import os
+import json
+import cv2
+import numpy as np
+
+
+HASH_SIZE = 8
+HASHES_FILENAME = 'frame_hashes.json'
+# bits set in every byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def compute_dhash(image:np.ndarray)->int:
+    """64 bit difference hash of a BGR or grayscale `uint8` image."""
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distances(hash:int, hashes:np.ndarray)->np.ndarray:
+    """Hamming distances between `hash` and the `uint64` array `hashes`."""
+    xor = np.asarray(hashes, dtype=np.uint64) ^ np.uint64(hash)
+    return POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def hamming_distance_matrix(hashes:list)->np.ndarray:
+    """Hamming distances between every pair of `hashes`, as a (n, n) array."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    return np.stack([hamming_distances(h, hashes) for h in hashes]) if len(hashes) else np.zeros((0, 0), dtype=int)
+
+
+def select_distinct_frames(frame_numbers:list, hashes:dict, num_frames:int, min_hamming_distance:int)->list:
+    """Selects up to `num_frames` frames at least `min_hamming_distance` bits apart.
+
+    Frames are accepted greedily in the order of `frame_numbers`. If there are not enough distinct
+    frames, the selection is completed with the frames farthest from the ones already selected.
+
+    Args:
+        frame_numbers (list): candidate frame numbers in order of preference.
+        hashes (dict): frame number as key and hash as value, see `get_frame_hashes`. Frames without hash are skipped.
+        num_frames (int): number of frames to select.
+        min_hamming_distance (int): minimum Hamming distance between two selected frames.
+
+    Returns:
+        list: selected frame numbers in order of selection.
+    """
+    frame_numbers = [i for i in frame_numbers if i in hashes]
+    num_frames = min(num_frames, len(frame_numbers))
+    if num_frames <= 0:
+        return []
+    candidate_hashes = np.array([hashes[i] for i in frame_numbers], dtype=np.uint64)
+
+    # distance of every candidate to its nearest selected frame
+    nearest = np.full(len(frame_numbers), HASH_SIZE * HASH_SIZE + 1)
+    selected = []
+    for k in range(len(frame_numbers)):
+        if len(selected) == num_frames:
+            break
+        if nearest[k] >= min_hamming_distance:
+            selected.append(k)
+            nearest = np.minimum(nearest, hamming_distances(candidate_hashes[k], candidate_hashes))
+    while len(selected) < num_frames:
+        candidates = nearest.copy()
+        candidates[selected] = -1
+        k = int(np.argmax(candidates))
+        selected.append(k)
+        nearest = np.minimum(nearest, hamming_distances(candidate_hashes[k], candidate_hashes))
+    return [frame_numbers[k] for k in selected]
+
+
+def load_hashes_cache(dirpath:str)->dict:
+    hashes_filepath = os.path.join(dirpath, HASHES_FILENAME)
+    if os.path.isfile(hashes_filepath):
+        try:
+            with open(hashes_filepath, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f'Error occurred while reading the frame hashes {hashes_filepath}: {e}')
+    return {}
+
+
+def save_hashes_cache(dirpath:str, cache:dict):
+    hashes_filepath = os.path.join(dirpath, HASHES_FILENAME)
+    temp_filepath = f'{hashes_filepath}.tmp'
+    with open(temp_filepath, 'w') as f:
+        json.dump(cache, f)
+    os.replace(temp_filepath, hashes_filepath)
+
+
+def get_frame_hashes(frames:dict)->dict:
+    """dHash of every frame file, read from the cache of its directory or computed and cached.
+
+    Args:
+        frames (dict): frame number as key and filepath as value.
+
+    Returns:
+        dict: frame number as key and hash (int) as value. Frames that cannot be read are left out.
+    """
+    frames_per_dirpath = {}
+    for frame_number, filepath in frames.items():
+        frames_per_dirpath.setdefault(os.path.dirname(filepath), {})[frame_number] = filepath
+
+    hashes = {}
+    for dirpath, dir_frames in frames_per_dirpath.items():
+        cache = load_hashes_cache(dirpath)
+        changed = False
+        for frame_number, filepath in dir_frames.items():
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                continue
+            filename = os.path.basename(filepath)
+            entry = cache.get(filename)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                # JPEG frames are decoded at 1/8 of their size, plenty for a 9x8 thumbnail
+                image = cv2.imread(filepath, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+                if image is None:
+                    print(f'Error occurred while reading the frame {filepath}')
+                    continue
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'dhash': f'{compute_dhash(image):016x}'}
+                cache[filename] = entry
+                changed = True
+            hashes[frame_number] = int(entry['dhash'], 16)
+        if changed:
+            save_hashes_cache(dirpath, cache)
+    return hashes
+
+
+# --- tests
+
+def test_select_distinct_frames():
+    """Test for select_distinct_frames and the dHash of near duplicate frames.
+    """
+    import shutil
+    import tempfile
+
+    # 0 and 1 are one bit apart, 2 and 3 are 16 bits from 0 and 32 bits from each other
+    hashes = {0: 0x0, 1: 0x1, 2: 0xFFFF, 3: 0xFFFF00000000, 4: 0x3}
+    assert select_distinct_frames([0, 1, 2, 3, 4], hashes, num_frames=3, min_hamming_distance=8) == [0, 2, 3]
+    # the order of the candidates is the order of preference
+    assert select_distinct_frames([1, 0, 2, 3, 4], hashes, num_frames=3, min_hamming_distance=8) == [1, 2, 3]
+    # completed with the frames farthest from the selected ones
+    assert select_distinct_frames([0, 1, 2, 3, 4], hashes, num_frames=4, min_hamming_distance=8) == [0, 2, 3, 4]
+    # frames without hash are skipped, no more frames than the candidates
+    assert select_distinct_frames([0, 5, 2], hashes, num_frames=10, min_hamming_distance=0) == [0, 2]
+    assert select_distinct_frames([], hashes, num_frames=3, min_hamming_distance=8) == []
+    assert (hamming_distance_matrix([0x0, 0x1, 0xFFFF]) == [[0, 1, 16], [1, 0, 15], [16, 15, 0]]).all()
+
+    # Frames of a resting camera have close hashes, cached per frames directory
+    temp_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(0)
+        seafloor = cv2.GaussianBlur(rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8), (31, 31), 0)
+        frames = {
+            0: seafloor, 
+            1: cv2.add(seafloor, np.full_like(seafloor, 10)), 
+            2: cv2.GaussianBlur(rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8), (31, 31), 0)}
+        for i, image in frames.items():
+            frames[i] = os.path.join(temp_dir, f'frame{i:06d}.png')
+            cv2.imwrite(frames[i], image)
+        frame_hashes = get_frame_hashes(frames)
+        assert os.path.isfile(os.path.join(temp_dir, HASHES_FILENAME))
+        distances = hamming_distances(frame_hashes[0], [frame_hashes[i] for i in (1, 2)])
+        assert distances[0] <= 4 < 16 <= distances[1]
+        assert select_distinct_frames([0, 1, 2], frame_hashes, num_frames=2, min_hamming_distance=8) == [0, 2]
+        assert get_frame_hashes(frames) == frame_hashes
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,220 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+MANIFEST_FILENAME = 'manifest.json'
+LOCK_FILENAME = 'manifest.json.lock'
+
+
+def get_manifest_filepath(frames_dirpath:str)->str:
+    return os.path.join(frames_dirpath, MANIFEST_FILENAME)
+
+
+def get_video_signature(video_path:str)->dict:
+    """Size and modification time of the video, or the validator of a video url (see `metadata_cache.get_video_validator`).
+    The frames are extracted again if they change."""
+    if os.path.isfile(video_path):
+        return {'size': os.path.getsize(video_path), 'mtime': os.path.getmtime(video_path)}
+    from seams.metadata_cache import get_video_validator
+    return {'validator': get_video_validator(video_path)}
+
+
+def load_frame_manifest(frames_dirpath:str)->dict:
+    """Manifest of the frames extracted from a video in `frames_dirpath`.
+
+    Returns:
+        dict: `video_path`, `video_signature`, `image_format` and `quality` of the last extraction, and `frames`
+            with the frame number (str) as key and the `filename`, `size`, `image_format`, `quality` and 
+            quality `metrics` (see `frame_quality`) of each frame.
+            Empty manifest if the file does not exist or cannot be read.
+    """
+    manifest_filepath = get_manifest_filepath(frames_dirpath)
+    if os.path.isfile(manifest_filepath):
+        try:
+            with open(manifest_filepath, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f'Error occurred while reading the frame manifest {manifest_filepath}: {e}')
+    return {'video_path': None, 'video_signature': None, 'image_format': None, 'quality': None, 'frames': {}}
+
+
+@contextmanager
+def manifest_lock(frames_dirpath:str):
+    """Exclusive lock of the manifest of `frames_dirpath` across processes and threads, 
+    e.g. a job worker and the on-demand extraction writing frames of the same video."""
+    with open(os.path.join(frames_dirpath, LOCK_FILENAME), 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def save_frame_manifest(frames_dirpath:str, manifest:dict):
+    """Writes the manifest to a temporary file first, readers never see a half written manifest."""
+    manifest_filepath = get_manifest_filepath(frames_dirpath)
+    temp_filepath = f'{manifest_filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_filepath, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_filepath, manifest_filepath)
+
+
+def update_frame_manifest(
+    frames_dirpath:str,
+    video_path:str,
+    frames:dict,
+    image_format:str,
+    quality:int,
+    frame_metrics:dict = None)->dict:
+    """Records in the manifest the frames written by an extraction.
+
+    Called after every checkpoint of the extraction, the frames of the manifest are
+    dropped if they were extracted from another video or the video changed.
+
+    Args:
+        frames_dirpath (str): directory of the frames of the video.
+        video_path (str): path to the video the frames were extracted from.
+        frames (dict): frame number as key and filepath as value.
+        image_format (str): image format of the frames.
+        quality (int): quality of the lossy image formats.
+        frame_metrics (dict, optional): frame number as key and quality metrics as value. Defaults to None.
+
+    Returns:
+        dict: the updated manifest.
+    """
+    video_signature = get_video_signature(video_path)
+    frame_metrics = frame_metrics or {}
+    entries = {
+        str(frame_number): {
+            'filename': os.path.basename(filepath),
+            'size': os.path.getsize(filepath),
+            'image_format': image_format,
+            'quality': quality,
+            'metrics': frame_metrics.get(frame_number)
+            } for frame_number, filepath in frames.items()}
+
+    # read, update and write without losing the frames recorded meanwhile by another extraction
+    with manifest_lock(frames_dirpath):
+        manifest = load_frame_manifest(frames_dirpath)
+        if manifest.get('video_path') != video_path or manifest.get('video_signature') != video_signature:
+            manifest['frames'] = {}
+        manifest.update({
+            'video_path': video_path, 
+            'video_signature': video_signature, 
+            'image_format': image_format, 
+            'quality': quality
+            })
+        manifest['frames'].update(entries)
+        save_frame_manifest(frames_dirpath, manifest)
+    return manifest
+
+
+def get_frame_metrics(frames_dirpath:str, frame_number:int)->dict:
+    """Quality metrics of a frame recorded in the manifest, `None` if not recorded."""
+    entry = load_frame_manifest(frames_dirpath)['frames'].get(str(frame_number))
+    return entry.get('metrics') if entry else None
+
+
+def get_valid_frames(
+    frames_dirpath:str, 
+    video_path:str, 
+    frame_numbers:list, 
+    image_format:str, 
+    quality:int)->dict:
+    """Frames of `frame_numbers` already extracted from the video, that do not need to be extracted again.
+
+    A frame is valid if the manifest was written for the same (unchanged) video, the frame has the requested
+    image format and quality, and its file exists with the recorded size (i.e. it was not truncated).
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the valid frames.
+    """
+    manifest = load_frame_manifest(frames_dirpath)
+    if manifest.get('video_path') != video_path or manifest.get('video_signature') != get_video_signature(video_path):
+        return {}
+
+    frames = {}
+    for frame_number in frame_numbers:
+        entry = manifest['frames'].get(str(frame_number))
+        if entry is None or entry['image_format'] != image_format:
+            continue
+        if image_format != 'png' and entry['quality'] != quality:
+            continue
+        filepath = os.path.join(frames_dirpath, entry['filename'])
+        if os.path.isfile(filepath) and os.path.getsize(filepath) == entry.get('size'):
+            frames[frame_number] = filepath
+    return frames
+
+
+# --- tests
+
+def test_extract_frames_resume():
+    """Test for the extraction resumed from a partial frame manifest, only the missing frames are written.
+    """
+    import time
+    import shutil
+    import tempfile
+    import subprocess
+    from seams.video_tools import extract_frames
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        video_path = os.path.join(temp_dir, 'test.mp4')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=25:duration=10',
+            '-c:v', 'libx264', '-g', '50', '-pix_fmt', 'yuv420p', '-y', video_path], check=True)
+        frames_dirpath = os.path.join(temp_dir, 'frames')
+        os.makedirs(frames_dirpath)
+
+        # An extraction interrupted after two frames
+        frames = extract_frames(video_filepath=video_path, frames_dirpath=frames_dirpath, frame_numbers=[0, 50])
+        assert sorted(load_frame_manifest(frames_dirpath)['frames']) == ['0', '50']
+        written = {i: os.stat(filepath).st_mtime_ns for i, filepath in frames.items()}
+
+        # A truncated frame is not valid
+        with open(frames[50], 'r+b') as f:
+            f.truncate(10)
+        assert get_valid_frames(
+            frames_dirpath=frames_dirpath, video_path=video_path, frame_numbers=[0, 50, 100], 
+            image_format='png', quality=90) == {0: frames[0]}
+
+        time.sleep(0.01)
+        frames = extract_frames(video_filepath=video_path, frames_dirpath=frames_dirpath, frame_numbers=[0, 50, 100, 200])
+        assert sorted(frames) == [0, 50, 100, 200]
+        # the valid frame is not written again, the truncated and the missing ones are
+        assert os.stat(frames[0]).st_mtime_ns == written[0]
+        assert os.stat(frames[50]).st_mtime_ns != written[50]
+        manifest = load_frame_manifest(frames_dirpath)
+        assert sorted(manifest['frames'], key=int) == ['0', '50', '100', '200']
+        for frame_number, filepath in frames.items():
+            assert manifest['frames'][str(frame_number)]['size'] == os.path.getsize(filepath)
+
+        # Another image format or a changed video invalidates the frames
+        assert get_valid_frames(
+            frames_dirpath=frames_dirpath, video_path=video_path, frame_numbers=[0, 50], image_format='jpeg', quality=90) == {}
+        os.utime(video_path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        assert get_valid_frames(
+            frames_dirpath=frames_dirpath, video_path=video_path, frame_numbers=[0, 50], image_format='png', quality=90) == {}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
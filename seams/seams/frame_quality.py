@@ -0,0 +1,89 @@
+"""Image quality metrics of the extracted frames, computed on the decoded image during the extraction.
+
+The metrics are measured on a copy of the frame resized to `ANALYSIS_WIDTH` pixels,
+so their thresholds do not depend on the resolution of the video.
+
+- `sharpness`: variance of the Laplacian, low for blurred or out of focus frames.
+- `contrast`: RMS contrast, standard deviation of the luminance in [0, 1].
+- `luminance`: mean luminance in [0, 1], too dark or overexposed frames.
+- `turbidity`: mean of the underwater dark channel (minimum of the blue and green channels
+  over a local window) in [0, 1]. Suspended particles scatter light and lift the dark channel.
+
+Usage:
+```
+metrics = compute_frame_quality(image)
+flags = get_quality_flags(metrics)
+```
+"""
+import cv2
+import numpy as np
+
+
+ANALYSIS_WIDTH = 512
+DARK_CHANNEL_WINDOW = 15
+
+# flags of the benthic interpretation and the metric limits that raise them
+POOR_IMAGE_QUALITY = 'Dålig bildkvalitet'
+POOR_VISIBILITY = 'Dålig sikt/vattenkvalitet'
+QUALITY_THRESHOLDS = {
+    'min_sharpness': 30.0,
+    'min_contrast': 0.06,
+    'min_luminance': 0.08,
+    'max_luminance': 0.92,
+    'max_turbidity': 0.4,
+    }
+
+
+def compute_frame_quality(image:np.ndarray)->dict:
+    """Sharpness, contrast, luminance and turbidity of a BGR `uint8` image, see the module docstring."""
+    height, width = image.shape[:2]
+    if width > ANALYSIS_WIDTH:
+        image = cv2.resize(image, (ANALYSIS_WIDTH, max(1, round(height * ANALYSIS_WIDTH / width))), interpolation=cv2.INTER_AREA)
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    mean, std = cv2.meanStdDev(gray)
+    dark_channel = cv2.erode(
+        np.minimum(image[:, :, 0], image[:, :, 1]),
+        np.ones((DARK_CHANNEL_WINDOW, DARK_CHANNEL_WINDOW), np.uint8))
+    return {
+        'sharpness': round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2),
+        'contrast': round(float(std[0, 0]) / 255, 4),
+        'luminance': round(float(mean[0, 0]) / 255, 4),
+        'turbidity': round(float(dark_channel.mean()) / 255, 4),
+        }
+
+
+def compute_frame_quality_from_file(filepath:str)->dict:
+    """`compute_frame_quality` of an image file, `None` if it cannot be read."""
+    image = cv2.imread(filepath, cv2.IMREAD_COLOR)
+    if image is None:
+        print(f'Error occurred while reading the frame {filepath}')
+        return None
+    return compute_frame_quality(image)
+
+
+def get_quality_flags(metrics:dict, thresholds:dict = None)->list:
+    """Interpretation flags raised by the quality metrics of a frame.
+
+    Args:
+        metrics (dict): metrics from `compute_frame_quality`.
+        thresholds (dict, optional): limits of the metrics. Defaults to `QUALITY_THRESHOLDS`.
+
+    Returns:
+        list: `POOR_IMAGE_QUALITY` and/or `POOR_VISIBILITY`, empty for a usable frame or without metrics.
+    """
+    if not metrics:
+        return []
+    thresholds = {**QUALITY_THRESHOLDS, **(thresholds or {})}
+    flags = []
+    if metrics['sharpness'] < thresholds['min_sharpness'] \
+        or metrics['contrast'] < thresholds['min_contrast'] \
+        or not thresholds['min_luminance'] <= metrics['luminance'] <= thresholds['max_luminance']:
+        flags.append(POOR_IMAGE_QUALITY)
+    if metrics['turbidity'] > thresholds['max_turbidity']:
+        flags.append(POOR_VISIBILITY)
+    return flags
+
+
+def is_usable_frame(metrics:dict, thresholds:dict = None)->bool:
+    return not get_quality_flags(metrics, thresholds=thresholds)
@@ -0,0 +1,521 @@
+"""Local background jobs for long-running video work.
+
+Jobs are stored in a SQLite database and executed by worker processes independent of the
+Streamlit script thread, so they survive reruns, disconnects and app restarts.
+
+Usage:
+```
+job_queue = JobQueue(db_filepath='/path/to/jobs.sqlite')
+start_workers(db_filepath=job_queue.db_filepath, n_workers=2)
+job_id = job_queue.submit(task='convert_codec', params={'input_file': ..., 'output_file': ...})
+job_queue.status(job_id)
+```
+
+Workers can also be started standalone:
+
+    `python -m seams.jobs worker /path/to/jobs.sqlite`
+"""
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import argparse
+import traceback
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+
+# Job status values
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+# Seconds without heartbeat after which a worker is considered dead
+WORKER_TIMEOUT = 30
+
+# Registry of the tasks that can be run as jobs
+TASKS: Dict[str, Callable] = {}
+
+
+class JobCancelled(Exception):
+    """Raised inside a task when the job has been cancelled."""
+
+
+def register_task(name:str):
+    """Decorator to register a function as a job task.
+
+    The function is called as `func(progress=progress, **params)` where `progress(value, message=None)`
+    reports the progress in [0, 1]. Its return value must be json serializable.
+    """
+    def decorator(func:Callable):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def now()->str:
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def is_pid_alive(pid:int)->bool:
+    """Checks if a process with `pid` is running in this machine."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class JobQueue:
+    """Persistent job queue backed by a SQLite database.
+
+    Args:
+        db_filepath (str): path to the SQLite database file. Created if it does not exist.
+    """
+    db_filepath: str
+
+    def __post_init__(self):
+        """Creates the tables of the queue if they do not exist."""
+        with self._connect() as connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    worker_pid INTEGER,
+                    created_at TEXT,
+                    started_at TEXT,
+                    finished_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+                CREATE TABLE IF NOT EXISTS workers (
+                    pid INTEGER PRIMARY KEY,
+                    started_at TEXT,
+                    heartbeat REAL
+                );
+                ''')
+
+    def _connect(self)->sqlite3.Connection:
+        connection = sqlite3.connect(self.db_filepath, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _execute(self, sql:str, params:tuple = ())->sqlite3.Cursor:
+        with self._connect() as connection:
+            return connection.execute(sql, params)
+
+    @staticmethod
+    def _as_dict(row:sqlite3.Row)->dict:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    # -- client calls
+
+    def submit(self, task:str, params:dict)->int:
+        """Adds a job to the queue.
+
+        Args:
+            task (str): registered task name, see `TASKS`.
+            params (dict): json serializable keyword arguments of the task.
+
+        Returns:
+            int: job identifier
+        """
+        if task not in TASKS:
+            raise ValueError(f'Unknown task `{task}`. Available tasks: {list(TASKS)}')
+        cursor = self._execute(
+            'INSERT INTO jobs (task, params, status, created_at) VALUES (?, ?, ?, ?)',
+            (task, json.dumps(params), QUEUED, now()))
+        return cursor.lastrowid
+
+    def status(self, job_id:int)->dict:
+        """Returns the job as dictionary, `None` if the job does not exist."""
+        row = self._execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._as_dict(row) if row is not None else None
+
+    def progress(self, job_id:int)->float:
+        """Returns the progress of the job in [0, 1]."""
+        job = self.status(job_id)
+        return job['progress'] if job is not None else 0.0
+
+    def result(self, job_id:int)->Any:
+        """Returns the result of a job that is done, otherwise `None`."""
+        job = self.status(job_id)
+        return job['result'] if job is not None and job['status'] == DONE else None
+
+    def cancel(self, job_id:int)->bool:
+        """Cancels a job. Queued jobs are cancelled at once, running jobs are stopped by their worker.
+
+        Returns:
+            bool: True if the job was not finished yet.
+        """
+        cursor = self._execute(
+            'UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?',
+            (CANCELLED, now(), job_id, QUEUED))
+        if cursor.rowcount:
+            return True
+        cursor = self._execute(
+            'UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?',
+            (job_id, RUNNING))
+        return bool(cursor.rowcount)
+
+    def list_jobs(self, status:str = None, limit:int = 50)->list:
+        """Lists the most recent jobs, optionally filtered by `status`."""
+        if status is None:
+            rows = self._execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        else:
+            rows = self._execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit)).fetchall()
+        return [self._as_dict(row) for row in rows]
+
+    # -- worker calls
+
+    def claim(self, worker_pid:int)->dict:
+        """Atomically takes the oldest queued job and marks it as running. `None` if the queue is empty."""
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1', (QUEUED,)).fetchone()
+            if row is None:
+                connection.execute('COMMIT')
+                return None
+            connection.execute(
+                'UPDATE jobs SET status = ?, worker_pid = ?, started_at = ? WHERE id = ?',
+                (RUNNING, worker_pid, now(), row['id']))
+            connection.execute('COMMIT')
+        return self.status(row['id'])
+
+    def set_job_pid(self, job_id:int, pid:int):
+        """Records the pid of the process executing the job, used to detect stale jobs."""
+        self._execute('UPDATE jobs SET worker_pid = ? WHERE id = ?', (pid, job_id))
+
+    def set_progress(self, job_id:int, progress:float, message:str = None):
+        self._execute(
+            'UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ?',
+            (min(max(float(progress), 0.0), 1.0), message, job_id))
+
+    def is_cancel_requested(self, job_id:int)->bool:
+        row = self._execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row['cancel_requested']) if row is not None else True
+
+    def finish(self, job_id:int, status:str, result:Any = None, error:str = None):
+        """Marks a running job as finished with `status` done, failed or cancelled."""
+        self._execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, '
+            'progress = CASE WHEN ? = ? THEN 1.0 ELSE progress END WHERE id = ? AND status = ?',
+            (status, json.dumps(result) if result is not None else None, error, now(), status, DONE, job_id, RUNNING))
+
+    def heartbeat(self, worker_pid:int):
+        self._execute(
+            'INSERT INTO workers (pid, started_at, heartbeat) VALUES (?, ?, ?) '
+            'ON CONFLICT(pid) DO UPDATE SET heartbeat = excluded.heartbeat',
+            (worker_pid, now(), time.time()))
+
+    def remove_worker(self, worker_pid:int):
+        self._execute('DELETE FROM workers WHERE pid = ?', (worker_pid,))
+
+    def alive_workers(self)->list:
+        """Pids of the workers with a recent heartbeat. Dead workers are removed."""
+        rows = self._execute('SELECT pid, heartbeat FROM workers').fetchall()
+        alive = []
+        for row in rows:
+            if time.time() - row['heartbeat'] < WORKER_TIMEOUT and is_pid_alive(row['pid']):
+                alive.append(row['pid'])
+            else:
+                self.remove_worker(row['pid'])
+        return alive
+
+    def requeue_stale_jobs(self)->int:
+        """Puts back in the queue the running jobs whose process died, i.e. after a crash or a reboot.
+
+        Returns:
+            int: number of jobs requeued
+        """
+        rows = self._execute('SELECT id, worker_pid FROM jobs WHERE status = ?', (RUNNING,)).fetchall()
+        n_requeued = 0
+        for row in rows:
+            if not is_pid_alive(row['worker_pid']):
+                cursor = self._execute(
+                    'UPDATE jobs SET status = ?, worker_pid = NULL, progress = 0 WHERE id = ? AND status = ?',
+                    (QUEUED, row['id'], RUNNING))
+                n_requeued += cursor.rowcount
+        return n_requeued
+
+
+# The app directory, parent of the `seams` package
+APP_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_python_env()->dict:
+    """Environment for the worker processes with the `seams` package importable."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([APP_DIRPATH] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return env
+
+
+def start_workers(db_filepath:str, n_workers:int = 1)->list:
+    """Starts worker processes until `n_workers` are alive for the queue in `db_filepath`.
+
+    Workers run in their own session, they are not stopped by a Streamlit rerun.
+
+    Returns:
+        list: pids of the alive workers
+    """
+    job_queue = JobQueue(db_filepath=db_filepath)
+    alive = job_queue.alive_workers()
+    for _ in range(max(0, n_workers - len(alive))):
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'seams.jobs', 'worker', os.path.abspath(db_filepath)],
+            env=get_python_env(),
+            cwd=APP_DIRPATH,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True)
+        # register at once, so the next call does not start it again
+        job_queue.heartbeat(process.pid)
+        alive.append(process.pid)
+    return alive
+
+
+def run_job(db_filepath:str, job_id:int):
+    """Executes a job. Called in its own process by the worker."""
+    job_queue = JobQueue(db_filepath=db_filepath)
+    job = job_queue.status(job_id)
+
+    def progress(value:float, message:str = None):
+        job_queue.set_progress(job_id, value, message)
+        if job_queue.is_cancel_requested(job_id):
+            raise JobCancelled()
+
+    try:
+        result = TASKS[job['task']](progress=progress, **job['params'])
+    except JobCancelled:
+        job_queue.finish(job_id, CANCELLED)
+    except Exception as e:
+        job_queue.finish(job_id, FAILED, error=f'{e}\n{traceback.format_exc()}')
+    else:
+        job_queue.finish(job_id, DONE, result=result)
+
+
+def kill_process_group(process:subprocess.Popen):
+    """Stops a job process and its children (i.e. `ffmpeg`)."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, AttributeError):
+        process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def worker_loop(db_filepath:str, poll_interval:float = 1.0):
+    """Takes jobs from the queue and runs each one in a child process that can be killed on cancel."""
+    job_queue = JobQueue(db_filepath=db_filepath)
+    pid = os.getpid()
+    try:
+        while True:
+            job_queue.heartbeat(pid)
+            job_queue.requeue_stale_jobs()
+            job = job_queue.claim(worker_pid=pid)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'seams.jobs', 'run', os.path.abspath(db_filepath), str(job['id'])],
+                env=get_python_env(),
+                cwd=APP_DIRPATH,
+                stdout=subprocess.DEVNULL,
+                start_new_session=True)
+            job_queue.set_job_pid(job['id'], process.pid)
+
+            while process.poll() is None:
+                job_queue.heartbeat(pid)
+                if job_queue.is_cancel_requested(job['id']):
+                    kill_process_group(process)
+                    job_queue.finish(job['id'], CANCELLED)
+                    break
+                time.sleep(poll_interval)
+
+            # the job process died without recording the outcome
+            job_queue.finish(job['id'], FAILED, error=f'Job process exited with code {process.returncode}')
+    finally:
+        job_queue.remove_worker(pid)
+
+
+# -- tasks
+
+@register_task('convert_codec')
+def convert_codec_task(progress:Callable, input_file:str, output_file:str, **kwargs)->dict:
+    from seams.video_tools import convert_codec
+    progress(0.0, message=f'converting {os.path.basename(input_file)}')
+    if not convert_codec(input_file=input_file, output_file=output_file, **kwargs):
+        raise RuntimeError(f'Video codec conversion failed for {input_file}')
+    return {'output_file': output_file}
+
+
+@register_task('extract_frames')
+def extract_frames_task(
+    progress:Callable, 
+    video_filepath:str, 
+    frames_dirpath:str, 
+    frame_numbers:list = None, 
+    image_format:str = 'png', 
+    quality:int = 90,
+    decoder_backend:str = 'ffmpeg',
+    remote_cache_dirpath:str = None,
+    skip_low_quality:bool = False,
+    num_frames:int = None,
+    min_hamming_distance:int = 0)->dict:
+    from seams.video_tools import extract_frames, select_distinct_video_frames
+    progress(0.0, message=f'extracting frames of {os.path.basename(video_filepath)}')
+    frames = extract_frames(
+        video_filepath=video_filepath,
+        frames_dirpath=frames_dirpath,
+        frame_numbers=frame_numbers,
+        progress_callback=progress,
+        image_format=image_format,
+        quality=quality,
+        decoder_backend=decoder_backend,
+        remote_cache_dirpath=remote_cache_dirpath,
+        skip_low_quality=skip_low_quality) or {}
+    if min_hamming_distance and num_frames:
+        # `frame_numbers` are oversampled candidates, see `oversample_frame_numbers`, 
+        # in the extracted `frames` the rejected ones are replaced in place (see `replace_rejected_frames`)
+        frames = select_distinct_video_frames(
+            frames=frames, frame_numbers=list(frames), num_frames=num_frames, min_hamming_distance=min_hamming_distance)
+    # json object keys are strings
+    return {'frames': {str(k): v for k, v in frames.items()}}
+
+
+
+@register_task('generate_proxy')
+def generate_proxy_task(progress:Callable, video_path:str, output_file:str, **kwargs)->dict:
+    from seams.video_tools import generate_proxy
+    progress(0.0, message=f'creating proxy of {os.path.basename(video_path)}')
+    mapping = generate_proxy(video_path=video_path, output_file=output_file, **kwargs)
+    if mapping is None:
+        raise RuntimeError(f'Proxy generation failed for {video_path}')
+    return mapping
+
+
+@register_task('generate_sprites')
+def generate_sprites_task(progress:Callable, video_path:str, output_dir:str, **kwargs)->dict:
+    from seams.video_tools import generate_sprite_sheets
+    progress(0.0, message=f'creating timeline previews of {os.path.basename(video_path)}')
+    sprites_index = generate_sprite_sheets(video_path=video_path, output_dir=output_dir, **kwargs)
+    if sprites_index is None:
+        raise RuntimeError(f'Sprite sheets generation failed for {video_path}')
+    return sprites_index
+
+
+# --- tests
+
+def test_job_queue():
+    """Test for the job queue and its worker processes.
+    """
+    import shutil
+    import tempfile
+
+    temp_dir = tempfile.mkdtemp()
+    job_queue = JobQueue(db_filepath=os.path.join(temp_dir, 'jobs.sqlite'))
+    try:
+        video_path = os.path.join(temp_dir, 'test.mp4')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=25:duration=10',
+            '-c:v', 'libx264', '-g', '50', '-pix_fmt', 'yuv420p', '-y', video_path], check=True)
+        frames_dirpath = os.path.join(temp_dir, 'frames')
+        os.makedirs(frames_dirpath)
+        extract_params = {'video_filepath': video_path, 'frames_dirpath': frames_dirpath, 'frame_numbers': [0, 125]}
+
+        try:
+            job_queue.submit(task='unknown', params={})
+            assert False, 'unknown task submitted'
+        except ValueError:
+            pass
+
+        # Jobs are claimed in submission order
+        extract_id = job_queue.submit(task='extract_frames', params=extract_params)
+        failing_id = job_queue.submit(
+            task='convert_codec', params={'input_file': os.path.join(temp_dir, 'missing.mp4'), 'output_file': video_path})
+        cancelled_id = job_queue.submit(task='extract_frames', params=extract_params)
+        assert job_queue.cancel(cancelled_id)
+        assert job_queue.status(cancelled_id)['status'] == CANCELLED
+
+        # A running job whose process died is queued again
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        assert job_queue.claim(worker_pid=process.pid)['id'] == extract_id
+        assert job_queue.requeue_stale_jobs() == 1
+        assert job_queue.status(extract_id)['status'] == QUEUED
+
+        pids = start_workers(db_filepath=job_queue.db_filepath, n_workers=1)
+        assert len(pids) == 1
+        assert start_workers(db_filepath=job_queue.db_filepath, n_workers=1) == pids
+
+        deadline = time.time() + 120
+        while time.time() < deadline and any(
+                job_queue.status(job_id)['status'] not in FINISHED_STATUSES for job_id in (extract_id, failing_id)):
+            time.sleep(0.5)
+
+        job = job_queue.status(extract_id)
+        assert job['status'] == DONE, job['error']
+        assert job['progress'] == 1.0
+        assert sorted(job['result']['frames']) == ['0', '125']
+        assert all(os.path.isfile(filepath) for filepath in job['result']['frames'].values())
+        job = job_queue.status(failing_id)
+        assert job['status'] == FAILED
+        assert 'conversion failed' in job['error']
+        assert job_queue.status(cancelled_id)['status'] == CANCELLED
+        assert job_queue.result(failing_id) is None
+    finally:
+        for pid in job_queue.alive_workers():
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SEAMS background jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = subparsers.add_parser('worker', help='run a worker of the job queue')
+    worker_parser.add_argument('db_filepath', help='path to the jobs database')
+
+    run_parser = subparsers.add_parser('run', help='run a single job')
+    run_parser.add_argument('db_filepath', help='path to the jobs database')
+    run_parser.add_argument('job_id', type=int, help='job identifier')
+
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        worker_loop(db_filepath=args.db_filepath)
+    elif args.command == 'run':
+        run_job(db_filepath=args.db_filepath, job_id=args.job_id)
+
+
+if __name__ == '__main__':
+    main()
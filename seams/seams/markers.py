@@ -1,11 +1,13 @@
+import json
+import base64
+import secrets
 import numpy as np
+import streamlit.components.v1 as components
 from PIL import Image
 from cv2 import drawMarker, putText, LINE_AA, MARKER_CROSS, FONT_HERSHEY_SIMPLEX
 from shapely import Polygon, Point
-import random
 from dataclasses import dataclass, field
-from itertools import count
-from typing import List
+from typing import Callable
 
 
 def floating_marker(image, dotpoints: list):
@@ -42,6 +44,81 @@ def floating_marker(image, dotpoints: list):
     return Image.fromarray(image)
 
 
+# colours of the dotpoints drawn in the browser, by annotation status
+DOTPOINT_STATUS_COLORS = {'pending': '#00ff00', 'annotated': '#ffd700'}
+
+
+def dotpoints_overlay(
+    image_url:str, 
+    width:int, 
+    height:int, 
+    points:np.ndarray, 
+    annotated_ids:list = None, 
+    component_height:int = 720):
+    """Draws the dotpoints in the browser over the unmodified frame, instead of `floating_marker`.
+
+    The frame is loaded from `image_url` (e.g. the media server) and cached by the browser,
+    only the coordinates and the ids of the annotated dotpoints are sent on every rerun.
+    Frame and markers are one SVG in the pixel coordinates of the frame, so they scale together.
+
+    Args:
+        image_url (str): url of the frame.
+        width (int): width of the frame in pixels.
+        height (int): height of the frame in pixels.
+        points (np.ndarray): (n, 2) coordinates of the dotpoints, the id of a dotpoint is its index + 1.
+        annotated_ids (list, optional): ids of the annotated dotpoints. Defaults to None.
+        component_height (int, optional): height in pixels of the component. Defaults to 720.
+    """
+    payload = {
+        'width': int(width),
+        'height': int(height),
+        'xy': np.asarray(points, dtype=np.int64).ravel().tolist(),
+        'annotated': sorted(int(i) for i in annotated_ids or []),
+        'colors': DOTPOINT_STATUS_COLORS,
+        }
+    components.html("""
+        <style>
+            body { margin: 0; }
+            svg { display: block; width: 100%%; height: %(component_height)spx; }
+            .dotpoint path { fill: none; stroke-width: 2px; vector-effect: non-scaling-stroke; }
+            .dotpoint text { font-family: sans-serif; font-size: 30px; }
+        </style>
+        <svg id="frame" preserveAspectRatio="xMidYMid meet"></svg>
+        <script>
+            const data = %(payload)s;
+            const ns = 'http://www.w3.org/2000/svg';
+            const svg = document.getElementById('frame');
+            svg.setAttribute('viewBox', '0 0 ' + data.width + ' ' + data.height);
+
+            const image = document.createElementNS(ns, 'image');
+            image.setAttribute('href', '%(image_url)s');
+            image.setAttribute('width', data.width);
+            image.setAttribute('height', data.height);
+            svg.appendChild(image);
+
+            // same cross and label as `floating_marker`
+            const annotated = new Set(data.annotated);
+            for (let k = 0; k < data.xy.length / 2; k++) {
+                const id = k + 1, x = data.xy[2 * k], y = data.xy[2 * k + 1];
+                const color = data.colors[annotated.has(id) ? 'annotated' : 'pending'];
+                const group = document.createElementNS(ns, 'g');
+                group.setAttribute('class', 'dotpoint');
+                const cross = document.createElementNS(ns, 'path');
+                cross.setAttribute('d', 'M' + (x - 50) + ' ' + y + 'h100M' + x + ' ' + (y - 50) + 'v100');
+                cross.setAttribute('stroke', color);
+                const label = document.createElementNS(ns, 'text');
+                label.setAttribute('x', x - 50);
+                label.setAttribute('y', y + 50);
+                label.setAttribute('fill', color);
+                label.textContent = id;
+                group.append(cross, label);
+                svg.appendChild(group);
+            }
+        </script>
+        """ % {'image_url': image_url, 'payload': json.dumps(payload), 'component_height': component_height}, 
+        height=component_height)
+
+
 def create_bounding_box(image: Image.Image) -> Polygon:
     """Creates a shapely polygon of the bounding box of an image
 
@@ -56,26 +133,52 @@ def create_bounding_box(image: Image.Image) -> Polygon:
     return Polygon([(0, 0), (width, 0), (width, height), (0, height)])
 
 
-def add_random_noise_to_polygon_centroid(polygon:Polygon, noise_percent: float)->Point:
-    """Adds a random noise 
-    
+def markers_grid_array(
+    width:float, 
+    height:float, 
+    n_rows:int = 3, 
+    n_columns:int | tuple = (3, 4), 
+    noise_percent:float = 0.0, 
+    rng:np.random.Generator = None,
+    seed:int = None,
+    origin:tuple = (0.0, 0.0))->np.ndarray:
+    """Centroids of the cells of a grid over a `width` x `height` box, as one NumPy array.
+
+    The box is divided into `n_rows` rows and each row into columns, the number of columns
+    of row `i` being `n_columns[i % len(n_columns)]` (the default alternates 3 and 4 columns).
+    Random noise moves each centroid up to `noise_percent` of the half cell size, drawn at once
+    from `rng` or a generator seeded with `seed`.
+
     Args:
-        centroid (Point): _description_
-        noise_percent (float, optional): _description_. Defaults to None.
+        width (float): width of the box, e.g. the image width in pixels.
+        height (float): height of the box.
+        n_rows (int, optional): number of rows. Defaults to 3.
+        n_columns (int | tuple, optional): columns of every row, or cycled per row. Defaults to (3, 4).
+        noise_percent (float, optional): amount of `salt and pepper` random noise in [0.0, 1.0]. Defaults to 0.0.
+        rng (np.random.Generator, optional): random generator of the noise. Defaults to None.
+        seed (int, optional): seed of the random generator if `rng` is not given. Defaults to None.
+        origin (tuple, optional): (x, y) of the top left corner of the box. Defaults to (0.0, 0.0).
+
+    Returns:
+        np.ndarray: (n, 2) array of the (x, y) coordinates, row by row.
     """
+    n_columns = np.resize(np.atleast_1d(np.asarray(n_columns, dtype=np.int64)), n_rows)
+    rows = np.repeat(np.arange(n_rows), n_columns)
+    # column of every point within its row
+    columns = np.arange(len(rows)) - np.repeat(np.cumsum(n_columns) - n_columns, n_columns)
 
-    min_x, min_y, _, _ = polygon.bounds
-    centroid = polygon.centroid
+    cell_widths = width / n_columns[rows]
+    cell_height = height / n_rows
+    points = np.empty((len(rows), 2), dtype=np.float64)
+    points[:, 0] = origin[0] + (columns + 0.5) * cell_widths
+    points[:, 1] = origin[1] + (rows + 0.5) * cell_height
 
-    if noise_percent is not None and (noise_percent > 0 and noise_percent <= 1.0):
-        # calculate the noise as percentage of the distance in x and y from the centroid
-        noise_x = noise_percent * (centroid.x - min_x)
-        noise_y = noise_percent * (centroid.y - min_y)
-        # Add random salt and pepper noise to the centroid
-        centroid = Point(centroid.x + random.uniform(-noise_x, noise_x), centroid.y + random.uniform(-noise_y, noise_y))
-    #TODO: Room for improvement to raise and error `if enable_random` and no noise was added.
-    
-    return centroid
+    if noise_percent is not None and 0 < noise_percent <= 1.0:
+        if rng is None:
+            rng = np.random.default_rng(seed)
+        half_sizes = np.column_stack([cell_widths, np.full(len(rows), cell_height)]) / 2
+        points += rng.uniform(-1.0, 1.0, size=points.shape) * noise_percent * half_sizes
+    return points
 
 
 def markers_grid(
@@ -83,69 +186,218 @@ def markers_grid(
     n_rows:int = 3, 
     enable_random:bool = False, 
     noise_percent: float = 0.1, 
- 
+    seed:int = None,
      )->list:
     """Divides a bounding box polygon into a grid with `n_rows`. Each row is divided into columns
-    and the centroids of each new column are calculated.
+    and the centroids of each new column are calculated, see `markers_grid_array`.
 
     Args:
         bbox (Polygon): Bounding box, shapely polygon
         n_rows (int, optional): Number of Rows to divide the bounding box. Defaults to 3.
         enable_random (bool, optional): If `True` random noise is added to the location of the centroids. Defaults to False.
         percentage_noise (float, optional): Amount of `salt and pepper` random noise to be generated in percentage [0.1, 1.0]. Defaults to 0.8.
+        seed (int, optional): seed of the random noise. Defaults to None.
     """
-    
-
-    # Calculate the width and height of the polygon
     min_x, min_y, max_x, max_y = bbox.bounds
-    row_width = max_x - min_x 
-    height = max_y - min_y
+    points = markers_grid_array(
+        width=max_x - min_x, 
+        height=max_y - min_y, 
+        n_rows=n_rows, 
+        noise_percent=noise_percent if enable_random else 0.0, 
+        seed=seed,
+        origin=(min_x, min_y))
+    return [Point(x, y) for x, y in points]
 
-    # Divide the polygon into rows
-    row_height = height / n_rows
-    rows = []
+# Point sampling strategies of the dotpoint grids
+POINT_SAMPLERS = {}
 
-    for i in range(n_rows):
-        y0 = min_y + i * row_height
-        y1 = y0 + row_height
-        rows.append(Polygon([(min_x, y0), (max_x, y0), (max_x, y1), (min_x, y1)]))
 
-    # Divide each row into columns and calculate the centroids
-    centroids = []
-    
-    for i, row in enumerate(rows):
-        min_x, min_y, max_x, max_y = row.bounds
+def register_point_sampler(name:str):
+    """Registers a point sampler under `name`.
+
+    A sampler is called as `sampler(width, height, n_points, rng, noise_percent)` and returns
+    a (n, 2) array of (x, y) coordinates inside the `width` x `height` box.
+    """
+    def decorator(func:Callable)->Callable:
+        POINT_SAMPLERS[name] = func
+        return func
+    return decorator
+
+
+def get_alternating_grid_rows(n_points:int)->int:
+    """Rows of the alternating 3/4 columns grid with the number of points closest to `n_points`."""
+    return max(1, int(round(n_points * 2 / 7)))
+
+
+def get_grid_shape(width:float, height:float, n_points:int)->tuple:
+    """Rows and columns of a grid of about square cells with at least `n_points` cells."""
+    n_columns = max(1, int(round(np.sqrt(n_points * width / height))))
+    n_rows = max(1, int(np.ceil(n_points / n_columns)))
+    return n_rows, n_columns
+
+
+@register_point_sampler('alternating')
+def sample_alternating_points(width:float, height:float, n_points:int, rng:np.random.Generator, noise_percent:float = 0.0)->np.ndarray:
+    """Rows alternating 3 and 4 columns (`markers_grid_array`), the number of rows is chosen from `n_points`."""
+    return markers_grid_array(
+        width=width, height=height, n_rows=get_alternating_grid_rows(n_points), noise_percent=noise_percent, rng=rng)
+
+
+@register_point_sampler('random')
+def sample_random_points(width:float, height:float, n_points:int, rng:np.random.Generator, noise_percent:float = 0.0)->np.ndarray:
+    """Simple random sampling, uniform over the box."""
+    return rng.uniform(0.0, 1.0, size=(n_points, 2)) * (width, height)
+
+
+@register_point_sampler('stratified')
+def sample_stratified_points(width:float, height:float, n_points:int, rng:np.random.Generator, noise_percent:float = 0.0)->np.ndarray:
+    """Stratified random sampling, one uniform point in each of `n_points` cells of a grid."""
+    n_rows, n_columns = get_grid_shape(width, height, n_points)
+    cells = np.sort(rng.choice(n_rows * n_columns, size=n_points, replace=False))
+    rows, columns = np.divmod(cells, n_columns)
+    offsets = rng.uniform(0.0, 1.0, size=(n_points, 2))
+    return np.column_stack([(columns + offsets[:, 0]) * width / n_columns, (rows + offsets[:, 1]) * height / n_rows])
+
+
+@register_point_sampler('hexagonal')
+def sample_hexagonal_points(width:float, height:float, n_points:int, rng:np.random.Generator, noise_percent:float = 0.0)->np.ndarray:
+    """Hexagonal lattice with the spacing giving about `n_points` points, odd rows shifted by half the spacing."""
+    spacing = np.sqrt(2 * width * height / (np.sqrt(3) * n_points))
+    row_spacing = spacing * np.sqrt(3) / 2
+    n_rows = max(1, int(round(height / row_spacing)))
+    n_columns = max(1, int(round(width / spacing)))
+    rows, columns = np.divmod(np.arange(n_rows * n_columns), n_columns)
+    points = np.column_stack([
+        (columns + 0.25 + 0.5 * (rows % 2)) * width / n_columns,
+        (rows + 0.5) * height / n_rows])
+    if noise_percent is not None and 0 < noise_percent <= 1.0:
+        points += rng.uniform(-1.0, 1.0, size=points.shape) * noise_percent * (width / n_columns / 4, height / n_rows / 2)
+    return points
+
+
+@register_point_sampler('poisson_disk')
+def sample_poisson_disk_points(
+    width:float, 
+    height:float, 
+    n_points:int, 
+    rng:np.random.Generator, 
+    noise_percent:float = 0.0, 
+    n_rounds:int = 6)->np.ndarray:
+    """Poisson-disk sampling, random points no closer than a radius chosen from `n_points`.
+
+    Parallel dart throwing on a background grid of cells of side `radius / sqrt(2)`, each holding 
+    at most one point. Cells are thrown in 9 phases (cell row and column modulo 3), the cells of 
+    a phase are at least two cells apart, so their candidates are checked at once against the 
+    points of the 5x5 neighbouring cells. The points are then subsampled to `n_points`.
+    """
+    # radius of a sampling with about 10% more points than required
+    radius = np.sqrt(0.6 * width * height / (1.1 * n_points))
+    cell_size = radius / np.sqrt(2)
+    n_rows, n_columns = int(np.ceil(height / cell_size)), int(np.ceil(width / cell_size))
+    # flat x and y of the point of every cell, padded by 2 cells, NaN for the empty cells
+    stride = n_columns + 4
+    grid_x = np.full((n_rows + 4) * stride, np.nan)
+    grid_y = np.full((n_rows + 4) * stride, np.nan)
+    neighbours = np.array([i * stride + j for i in range(-2, 3) for j in range(-2, 3)])
+
+    # cells of every phase
+    rows, columns = np.divmod(np.arange(n_rows * n_columns), n_columns)
+    phases = (rows % 3) * 3 + columns % 3
+    phase_cells = [(rows[phases == k], columns[phases == k]) for k in range(9)]
+
+    for _ in range(n_rounds):
+        for k, (rows, columns) in enumerate(phase_cells):
+            cells = (rows + 2) * stride + columns + 2
+            empty = np.isnan(grid_x[cells])
+            rows, columns, cells = rows[empty], columns[empty], cells[empty]
+            phase_cells[k] = (rows, columns)
+            if not len(cells):
+                continue
+            x = (columns + rng.uniform(0.0, 1.0, size=len(cells))) * cell_size
+            y = (rows + rng.uniform(0.0, 1.0, size=len(cells))) * cell_size
+            near = cells[:, None] + neighbours
+            # NaN distances of the empty neighbour cells never reject
+            squared_distances = (grid_x.take(near) - x[:, None]) ** 2 + (grid_y.take(near) - y[:, None]) ** 2
+            accepted = ~(squared_distances < radius ** 2).any(axis=1) & (x < width) & (y < height)
+            grid_x[cells[accepted]] = x[accepted]
+            grid_y[cells[accepted]] = y[accepted]
+
+    points = np.column_stack([grid_x, grid_y])
+    points = points[~np.isnan(points[:, 0])]
+    if len(points) > n_points:
+        points = points[np.sort(rng.choice(len(points), size=n_points, replace=False))]
+    return points
+
+
+def sample_points(
+    width:float, 
+    height:float, 
+    n_points:int, 
+    strategy:str = 'alternating', 
+    noise_percent:float = 0.0, 
+    seed:int = None)->np.ndarray:
+    """Dotpoint coordinates of a `width` x `height` image with the sampler registered as `strategy`.
+
+    Raises:
+        ValueError: if the strategy is not registered.
+
+    Returns:
+        np.ndarray: (n, 2) array of the (x, y) coordinates.
+    """
+    if strategy not in POINT_SAMPLERS:
+        raise ValueError(f'Unknown point sampling strategy `{strategy}`. Use one of {list(POINT_SAMPLERS)}')
+    return POINT_SAMPLERS[strategy](width, height, n_points, np.random.default_rng(seed), noise_percent=noise_percent)
 
-        if i % 2 == 0:
-            # Even row: divide into 3
-            col_width = row_width / 3
-            for j in range(3):
-                x0 = min_x + j * col_width
-                x1 = x0 + col_width
-                col = Polygon([(x0, min_y), (x1, min_y), (x1, max_y), (x0, max_y)])
-                
-                if enable_random:
-                    centroid = add_random_noise_to_polygon_centroid(polygon=col, noise_percent=noise_percent)
-                else:
-                    centroid = col.centroid
-
-                centroids.append(centroid)
-        else:
-            # Odd row: divide into 4
-            col_width = row_width / 4
-            for j in range(4):
-                x0 = min_x + j * col_width
-                x1 = x0 + col_width
-                col = Polygon([(x0, min_y), (x1, min_y), (x1, max_y), (x0, max_y)])
-                
-                if enable_random:
-                    centroid = add_random_noise_to_polygon_centroid(polygon=col, noise_percent=noise_percent)
-                else:
-                    centroid = col.centroid
 
-                centroids.append(centroid)
+def new_grid_seed()->int:
+    """Random 32 bit seed of a new dotpoint grid."""
+    return secrets.randbits(32)
+
+
+def generate_dotpoints(
+    width:float, 
+    height:float, 
+    n_rows:int = 3, 
+    enable_random:bool = False, 
+    noise_percent:float = 0.0, 
+    strategy:str = 'alternating', 
+    n_points:int = None, 
+    seed:int = None)->np.ndarray:
+    """Pixel coordinates of the dotpoints of a `width` x `height` frame, the same for the same `seed`.
+
+    The `alternating` grid has `n_rows` rows unless `n_points` is given, the other strategies
+    sample `n_points` points, see `sample_points`.
+
+    Returns:
+        np.ndarray: (n, 2) `int32` array of the (x, y) coordinates.
+    """
+    if strategy == 'alternating' and n_points is None:
+        points = markers_grid_array(
+            width=width, 
+            height=height, 
+            n_rows=n_rows, 
+            noise_percent=noise_percent if enable_random else 0.0,
+            seed=seed)
+    else:
+        points = sample_points(
+            width=width, 
+            height=height, 
+            n_points=n_points, 
+            strategy=strategy, 
+            noise_percent=noise_percent if enable_random else 0.0, 
+            seed=seed)
+    return points.astype(np.int32)
+
+
+def encode_dotpoints(points:np.ndarray)->str:
+    """Compact text of the dotpoint coordinates for the survey datastore, base64 of the little endian `int32` (x, y) pairs."""
+    return base64.b64encode(np.asarray(points, dtype='<i4').tobytes()).decode('ascii')
+
+
+def decode_dotpoints(encoded:str)->np.ndarray:
+    """(n, 2) `int32` array of the coordinates from `encode_dotpoints`."""
+    return np.frombuffer(base64.b64decode(encoded), dtype='<i4').reshape(-1, 2).astype(np.int32)
 
-    return centroids    
 
 @dataclass(kw_only=True)
 class DotPoint:
@@ -164,19 +416,73 @@ def dotpoints_grid(filepath:str,
     enable_random = False,
     noise_percent = 0.0,
     frame_id: int = 1,
+    strategy: str = 'alternating',
+    n_points: int = None,
+    seed: int = None,
+    points: np.ndarray = None,
     ):
 
     dotpoints = []
     image = Image.open(filepath)       
-    # create bounding box polygon
-    bbox = create_bounding_box(image=image)
-    centroids = markers_grid(bbox, n_rows=n_rows, enable_random=enable_random, noise_percent=noise_percent)
-
-    for i, centroid in enumerate(centroids):
-        dotpoint = DotPoint(frame_id=frame_id, x=int(centroid.x), y=int(centroid.y), id=i+1)
+    width, height = image.size
+    # stored coordinates are drawn as they are, see `generate_dotpoints`
+    if points is None:
+        points = generate_dotpoints(
+            width=width, 
+            height=height, 
+            n_rows=n_rows, 
+            enable_random=enable_random, 
+            noise_percent=noise_percent, 
+            strategy=strategy, 
+            n_points=n_points, 
+            seed=seed)
+
+    for i, (x, y) in enumerate(np.asarray(points).tolist()):
+        dotpoint = DotPoint(frame_id=frame_id, x=x, y=y, id=i+1)
         dotpoints.append(dotpoint)
                 
     # Add the floating button to the image
     modified_image = floating_marker(image, dotpoints=dotpoints)
             
     return modified_image
+
+
+# --- tests
+
+def test_markers_grid_array():
+    """Test for markers_grid_array against the grid of shapely polygons it replaces.
+    """
+    def polygons_grid(min_x, min_y, max_x, max_y, n_rows):
+        # centroids of the rows alternating 3 and 4 columns
+        centroids = []
+        row_height = (max_y - min_y) / n_rows
+        for i in range(n_rows):
+            y0 = min_y + i * row_height
+            n_columns = 3 if i % 2 == 0 else 4
+            col_width = (max_x - min_x) / n_columns
+            for j in range(n_columns):
+                x0 = min_x + j * col_width
+                col = Polygon([(x0, y0), (x0 + col_width, y0), (x0 + col_width, y0 + row_height), (x0, y0 + row_height)])
+                centroids.append([col.centroid.x, col.centroid.y])
+        return np.array(centroids)
+
+    for bounds, n_rows in [((0, 0, 1920, 1080), 3), ((0, 0, 1280, 720), 6), ((10, 20, 650, 500), 5), ((0, 0, 3, 7), 1)]:
+        min_x, min_y, max_x, max_y = bounds
+        points = markers_grid_array(width=max_x - min_x, height=max_y - min_y, n_rows=n_rows, origin=(min_x, min_y))
+        assert points.shape == (7 * (n_rows // 2) + 3 * (n_rows % 2), 2)
+        assert np.allclose(points, polygons_grid(*bounds, n_rows))
+        # same points as the shapely points of `markers_grid`
+        grid = markers_grid(Polygon([(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]), n_rows=n_rows)
+        assert np.allclose([[p.x, p.y] for p in grid], points)
+
+    # The noise moves every point within its share of the half cell, the same for the same seed
+    reference = markers_grid_array(width=1920, height=1080, n_rows=4)
+    noisy = markers_grid_array(width=1920, height=1080, n_rows=4, noise_percent=0.5, seed=7)
+    half_cells = np.column_stack([1920 / np.repeat([3, 4, 3, 4], [3, 4, 3, 4]), np.full(14, 1080 / 4)]) / 2
+    assert not np.allclose(noisy, reference)
+    assert (np.abs(noisy - reference) <= 0.5 * half_cells + 1e-9).all()
+    assert np.array_equal(noisy, markers_grid_array(width=1920, height=1080, n_rows=4, noise_percent=0.5, seed=7))
+
+    # Stored dotpoints round trip
+    points = generate_dotpoints(width=1920, height=1080, n_rows=3, enable_random=True, noise_percent=0.3, seed=1)
+    assert np.array_equal(decode_dotpoints(encode_dotpoints(points)), points)
@@ -0,0 +1,304 @@
+import os
+import time
+import sqlite3
+from dataclasses import dataclass, field
+from seams.video_tools import get_converted_video_filename
+
+
+FRAME_EXTENSIONS = ('.png', '.jpg', '.webp')
+
+
+def scan_frames(dirpath:str)->list:
+    """Frame images in the per video subdirectories of the frames directory."""
+    artifacts = []
+    for video_dirname in os.listdir(dirpath):
+        video_dirpath = os.path.join(dirpath, video_dirname)
+        if not os.path.isdir(video_dirpath):
+            continue
+        for filename in os.listdir(video_dirpath):
+            if filename.lower().endswith(FRAME_EXTENSIONS):
+                artifacts.append([os.path.join(video_dirpath, filename)])
+    return artifacts
+
+
+def scan_proxies(dirpath:str)->list:
+    """Proxy videos together with their json frame mapping."""
+    artifacts = []
+    for filename in os.listdir(dirpath):
+        if filename.startswith('PROXY__') and filename.endswith('.mp4'):
+            filepath = os.path.join(dirpath, filename)
+            mapping_filepath = f'{os.path.splitext(filepath)[0]}.json'
+            artifacts.append([filepath] + ([mapping_filepath] if os.path.isfile(mapping_filepath) else []))
+    return artifacts
+
+
+def scan_converted_videos(dirpath:str)->list:
+    """Videos converted by SEAMS (`SEAMS__` prefix) whose original is still in the directory, they can be converted again."""
+    filenames = os.listdir(dirpath)
+    converted = {
+        get_converted_video_filename(filename)
+        for filename in filenames if not filename.startswith('SEAMS__')}
+    return [[os.path.join(dirpath, filename)] for filename in filenames if filename in converted]
+
+
+def scan_sprites(dirpath:str)->list:
+    """Sprite sheets and index of every video, evicted together."""
+    artifacts = []
+    for video_dirname in os.listdir(dirpath):
+        video_dirpath = os.path.join(dirpath, video_dirname)
+        index_filepath = os.path.join(video_dirpath, 'sprites.json')
+        if os.path.isfile(index_filepath):
+            # the index first, its last access is the one of the sprites
+            artifacts.append([index_filepath] + [
+                os.path.join(video_dirpath, filename) for filename in sorted(os.listdir(video_dirpath))
+                if filename != 'sprites.json'])
+    return artifacts
+
+
+def scan_overlays(dirpath:str)->list:
+    """Frames rendered with their dotpoint overlay (see `overlay_cache`)."""
+    return [[os.path.join(dirpath, filename)] for filename in os.listdir(dirpath) if filename.lower().endswith(FRAME_EXTENSIONS)]
+
+
+def scan_remote_chunks(dirpath:str)->list:
+    """Chunk caches of the videos read from urls (see `remote_media.HTTPRangeFile`), one artifact per video."""
+    artifacts = []
+    for key in os.listdir(dirpath):
+        chunks_dirpath = os.path.join(dirpath, key)
+        if os.path.isdir(chunks_dirpath):
+            chunks = sorted(os.listdir(chunks_dirpath))
+            if chunks:
+                artifacts.append([os.path.join(chunks_dirpath, filename) for filename in chunks])
+    return artifacts
+
+
+# kind of derived artifact and the function listing them in its directory
+ARTIFACT_SCANNERS = {
+    'frames': scan_frames,
+    'proxies': scan_proxies,
+    'videos': scan_converted_videos,
+    'sprites': scan_sprites,
+    'remote': scan_remote_chunks,
+    'overlays': scan_overlays,
+    }
+
+
+def get_pinned_paths(survey_data:dict)->set:
+    """Media that must never be evicted.
+
+    The frames selected (`media['frames']`) or interpreted (`media['interpreted']`) in any station
+    of any survey and the current video of the session.
+    """
+    pinned = set()
+    for survey in (survey_data.get('surveys') or {}).values():
+        for station in (survey.get('stations') or {}).values():
+            media = station.get('media') or {}
+            pinned.update((media.get('frames') or {}).values())
+            pinned.update(
+                frame.get('frame_filepath') for frame in (media.get('interpreted') or {}).values()
+                if isinstance(frame, dict))
+    pinned.update((survey_data.get('current_video') or {}).values())
+    return {os.path.realpath(str(path)) for path in pinned if path}
+
+
+def drop_missing_converted_videos(survey_data:dict, videos_dirpath:str)->int:
+    """Removes from the station media the converted videos that were evicted.
+
+    Returns:
+        int: number of references removed.
+    """
+    n_removed = 0
+    for survey in (survey_data.get('surveys') or {}).values():
+        for station in (survey.get('stations') or {}).values():
+            videos = (station.get('media') or {}).get('video') or {}
+            for video_name in [k for k in videos if str(k).startswith('SEAMS__')]:
+                if not os.path.isfile(os.path.join(videos_dirpath, os.path.basename(str(videos[video_name])))):
+                    videos.pop(video_name)
+                    n_removed += 1
+    return n_removed
+
+
+@dataclass
+class MediaCache:
+    """Byte budget for the media derived from the survey videos (frames, proxies, sprites and converted videos).
+
+    The last access of every artifact is kept in a SQLite database. When the derived media is
+    over `max_bytes` the artifacts that are not pinned (see `get_pinned_paths`) are deleted,
+    least recently used first. The originals of the survey are never touched.
+
+    Usage:
+    ```
+    media_cache = MediaCache(
+        db_filepath='/path/to/media_cache.sqlite',
+        directories={'frames': FRAMES_DIRPATH, 'proxies': PROXIES_DIRPATH, 'videos': VIDEOS_DIRPATH},
+        max_bytes=50 * 1024**3)
+    media_cache.touch(frame_filepath)
+    media_cache.enforce_budget(pinned=get_pinned_paths(survey_data))
+    ```
+
+    Args:
+        db_filepath (str): path to the SQLite database file. Created if it does not exist.
+        directories (dict): kind of artifact (see `ARTIFACT_SCANNERS`) as key and its directory as value.
+        max_bytes (int): byte budget of the derived media, 0 disables the eviction.
+    """
+    db_filepath: str
+    directories: dict = field(default_factory=dict)
+    max_bytes: int = 0
+
+    def __post_init__(self):
+        with self._connect() as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS media_access (
+                    path TEXT PRIMARY KEY,
+                    last_access REAL NOT NULL
+                )''')
+
+    def _connect(self)->sqlite3.Connection:
+        return sqlite3.connect(self.db_filepath, timeout=30, isolation_level=None)
+
+    def touch(self, *paths:str):
+        """Records that the media in `paths` was just used."""
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO media_access (path, last_access) VALUES (?, ?)',
+                [(os.path.realpath(str(path)), now) for path in paths if path])
+
+    def get_last_accesses(self)->dict:
+        with self._connect() as connection:
+            return dict(connection.execute('SELECT path, last_access FROM media_access').fetchall())
+
+    def scan(self)->list:
+        """Every derived artifact in the cache directories.
+
+        Returns:
+            list: dictionaries with the `kind`, `path`, `files`, `size` (bytes) and `last_access` of each artifact.
+                The last access is the modification time for artifacts never touched.
+        """
+        last_accesses = self.get_last_accesses()
+        artifacts = []
+        for kind, dirpath in self.directories.items():
+            if kind not in ARTIFACT_SCANNERS or not os.path.isdir(dirpath):
+                continue
+            for files in ARTIFACT_SCANNERS[kind](dirpath):
+                files = [os.path.realpath(f) for f in files]
+                try:
+                    size = sum(os.path.getsize(f) for f in files)
+                    last_access = last_accesses.get(files[0]) or os.path.getmtime(files[0])
+                except FileNotFoundError:
+                    # deleted while scanning
+                    continue
+                artifacts.append({
+                    'kind': kind,
+                    'path': files[0],
+                    'files': files,
+                    'size': size,
+                    'last_access': last_access
+                    })
+        return artifacts
+
+    def usage(self)->dict:
+        """Bytes and number of artifacts per kind."""
+        usage = {kind: {'bytes': 0, 'artifacts': 0} for kind in self.directories}
+        for artifact in self.scan():
+            usage[artifact['kind']]['bytes'] += artifact['size']
+            usage[artifact['kind']]['artifacts'] += 1
+        return usage
+
+    def prune(self)->int:
+        """Removes the access records of media that no longer exists.
+
+        Returns:
+            int: number of records removed.
+        """
+        dangling = [path for path in self.get_last_accesses() if not os.path.exists(path)]
+        with self._connect() as connection:
+            connection.executemany('DELETE FROM media_access WHERE path = ?', [(path,) for path in dangling])
+        return len(dangling)
+
+    def enforce_budget(self, pinned:set = None, max_bytes:int = None)->dict:
+        """Evicts least recently used artifacts until the derived media fits in the byte budget.
+
+        Args:
+            pinned (set, optional): real paths that must not be evicted. Defaults to None.
+            max_bytes (int, optional): overrides the budget of the cache. Defaults to None.
+
+        Returns:
+            dict: `total_bytes` before the eviction, `freed_bytes` and the `evicted` artifact paths.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        pinned = pinned or set()
+        artifacts = self.scan()
+        total_bytes = sum(a['size'] for a in artifacts)
+        report = {'total_bytes': total_bytes, 'freed_bytes': 0, 'evicted': []}
+        if not max_bytes or total_bytes <= max_bytes:
+            return report
+
+        candidates = sorted(
+            (a for a in artifacts if not pinned.intersection(a['files'])),
+            key=lambda a: a['last_access'])
+        for artifact in candidates:
+            if total_bytes - report['freed_bytes'] <= max_bytes:
+                break
+            for filepath in artifact['files']:
+                try:
+                    os.remove(filepath)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f'Error occurred while evicting {filepath}: {e}')
+                    break
+            else:
+                report['freed_bytes'] += artifact['size']
+                report['evicted'].append(artifact['path'])
+
+        self.prune()
+        return report
+
+
+# --- tests
+
+def test_media_cache_eviction():
+    """Test for the least recently used eviction of the media cache, the selected frames are never evicted.
+    """
+    import shutil
+    import tempfile
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        frames_dirpath = os.path.join(temp_dir, 'frames')
+        os.makedirs(os.path.join(frames_dirpath, 'video.mp4'))
+        frames = {}
+        for i in range(4):
+            frames[i] = os.path.join(frames_dirpath, 'video.mp4', f'frame{i:06d}.png')
+            with open(frames[i], 'wb') as f:
+                f.write(b'\0' * 1000)
+        media_cache = MediaCache(db_filepath=os.path.join(temp_dir, 'media_cache.sqlite'), directories={'frames': frames_dirpath})
+
+        # frame 0 is the least recently used, but selected in a station
+        for i in range(4):
+            media_cache.touch(frames[i])
+            time.sleep(0.01)
+        survey_data = {'surveys': {'survey': {'stations': {'1': {'media': {'frames': {0: frames[0]}}}}}}}
+        pinned = get_pinned_paths(survey_data)
+        assert pinned == {os.path.realpath(frames[0])}
+        assert media_cache.usage()['frames'] == {'bytes': 4000, 'artifacts': 4}
+
+        # No budget, nothing is evicted
+        assert media_cache.enforce_budget(pinned=pinned)['evicted'] == []
+
+        report = media_cache.enforce_budget(pinned=pinned, max_bytes=2500)
+        assert report['total_bytes'] == 4000
+        assert report['freed_bytes'] == 2000
+        assert report['evicted'] == [os.path.realpath(frames[1]), os.path.realpath(frames[2])]
+        assert os.path.isfile(frames[0]) and os.path.isfile(frames[3])
+        # the records of the evicted frames are pruned
+        assert sorted(media_cache.get_last_accesses()) == sorted(os.path.realpath(frames[i]) for i in (0, 3))
+
+        # Over the budget the pinned frame is kept
+        report = media_cache.enforce_budget(pinned=pinned, max_bytes=500)
+        assert report['evicted'] == [os.path.realpath(frames[3])]
+        assert os.path.isfile(frames[0])
+        assert media_cache.usage()['frames'] == {'bytes': 1000, 'artifacts': 1}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
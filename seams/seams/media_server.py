@@ -0,0 +1,212 @@
+"""Small HTTP server streaming the survey media to the browser.
+
+Streamlit sends `st.video` bytes through the websocket, which means reading the whole video in
+memory. This server serves the files from disk with HTTP Range support instead, so the browser
+only fetches the bytes it plays and seeks with partial requests.
+
+The server has no login of its own: every url starts with a random token of the Streamlit session
+(`/<token>/<prefix>/<path>`), requests without a registered token are answered with `404`.
+It listens on `127.0.0.1` by default, set the `host` and `public_url` of the `[media_server]`
+section of `seams.toml` to reach it from other machines (e.g. Docker).
+
+Usage:
+```
+base_url = start_media_server(directories={'videos': VIDEOS_DIRPATH}, port=8502, token=new_media_token())
+st.video(get_media_url(base_url, 'videos', video_filepath))
+```
+"""
+import os
+import re
+import secrets
+import mimetypes
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, quote, urlparse
+
+
+CHUNK_SIZE = 1024 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# running servers per (host, port), they live as long as the Streamlit process
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def parse_range(range_header:str, file_size:int)->tuple:
+    """First byte and last byte (inclusive) requested by a `Range` header.
+
+    Only single ranges are supported, `bytes=start-end`, `bytes=start-` and `bytes=-suffix_length`.
+
+    Returns:
+        tuple: (start, end), `None` if the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # last `end` bytes
+        start, end = max(0, file_size - int(end)), file_size - 1
+    else:
+        start, end = int(start), min(int(end), file_size - 1) if end else file_size - 1
+    if start >= file_size or start > end:
+        return None
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serves `GET` and `HEAD` requests of `/<token>/<prefix>/<path>` from the directory registered for `prefix`."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # keep the Streamlit console clean
+        pass
+
+    def get_filepath(self)->str:
+        """Path of the requested file, `None` if the token or the prefix is unknown or the file does not exist."""
+        parts = unquote(urlparse(self.path).path).strip('/').split('/')
+        if len(parts) < 3 or parts[0] not in self.server.tokens:
+            return None
+        parts = parts[1:]
+        directory = self.server.directories.get(parts[0])
+        if directory is None:
+            return None
+        # no path traversal outside the registered directory
+        directory = os.path.realpath(directory)
+        filepath = os.path.realpath(os.path.join(directory, *parts[1:]))
+        if os.path.commonpath([directory, filepath]) != directory or not os.path.isfile(filepath):
+            return None
+        return filepath
+
+    def send_common_headers(self, filepath:str, content_length:int):
+        self.send_header('Content-Type', mimetypes.guess_type(filepath)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(content_length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Cache-Control', 'private, max-age=3600')
+        self.send_header('Last-Modified', self.date_time_string(int(os.path.getmtime(filepath))))
+
+    def do_HEAD(self):
+        self.serve_file(send_body=False)
+
+    def do_GET(self):
+        self.serve_file(send_body=True)
+
+    def serve_file(self, send_body:bool):
+        filepath = self.get_filepath()
+        if filepath is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        file_size = os.path.getsize(filepath)
+        range_header = self.headers.get('Range')
+        if range_header:
+            byte_range = parse_range(range_header, file_size)
+            if byte_range is None:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{file_size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+        else:
+            start, end = 0, file_size - 1
+            self.send_response(HTTPStatus.OK)
+
+        self.send_common_headers(filepath, content_length=end - start + 1)
+        self.end_headers()
+        if not send_body:
+            return
+
+        try:
+            with open(filepath, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                # constant memory whatever the size of the file
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # the browser cancels requests while seeking
+            pass
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address:tuple, directories:dict):
+        self.directories = dict(directories)
+        # url tokens of the Streamlit sessions
+        self.tokens = set()
+        super().__init__(server_address, MediaRequestHandler)
+
+
+def new_media_token()->str:
+    """Random url token of a Streamlit session, see `start_media_server`."""
+    return secrets.token_urlsafe(16)
+
+
+def start_media_server(
+    directories:dict, 
+    host:str = '127.0.0.1', 
+    port:int = 8502, 
+    public_url:str = '', 
+    token:str = None)->str:
+    """Starts once per process the media server in a background thread and registers the media directories.
+
+    Calling it again (on every Streamlit rerun) only adds the directories and the token to the running server.
+
+    Args:
+        directories (dict): url prefix as key and directory served under it as value, e.g. `{'videos': VIDEOS_DIRPATH}`.
+        host (str, optional): interface the server listens on, `0.0.0.0` for every interface. Defaults to '127.0.0.1'.
+        port (int, optional): port the server listens on. Defaults to 8502.
+        public_url (str, optional): base url of the server as reached from the browser.
+            Defaults to '' for `http://localhost:<port>`.
+        token (str, optional): url token of the session, see `new_media_token`. Defaults to None for a new token.
+
+    Returns:
+        str: base url of the media server with the token, `None` if it could not be started.
+    """
+    token = token or new_media_token()
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is None:
+            try:
+                server = MediaServer((host, port), directories=directories)
+            except OSError as e:
+                print(f'Error occurred while starting the media server on {host}:{port}: {e}')
+                return None
+            threading.Thread(target=server.serve_forever, name='seams-media-server', daemon=True).start()
+            _servers[(host, port)] = server
+        else:
+            server.directories.update(directories)
+        server.tokens.add(token)
+    return f"{(public_url or f'http://localhost:{port}').rstrip('/')}/{token}"
+
+
+def get_media_url(base_url:str, prefix:str, filepath:str, directory:str = None)->str:
+    """Url of a file of the media directory registered as `prefix`.
+
+    Args:
+        base_url (str): base url with the token returned by `start_media_server`.
+        prefix (str): prefix of the media directory.
+        filepath (str): path to the file.
+        directory (str, optional): the media directory, required for files in its subdirectories. Defaults to None.
+    """
+    relative_path = os.path.relpath(filepath, directory) if directory else os.path.basename(filepath)
+    return f'{base_url}/{prefix}/{quote(relative_path.replace(os.sep, "/"))}'
+
+
+def stop_media_servers():
+    with _servers_lock:
+        for server in _servers.values():
+            server.shutdown()
+            server.server_close()
+        _servers.clear()
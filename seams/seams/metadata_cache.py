@@ -0,0 +1,96 @@
+import os
+import json
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from seams.video_tools import get_video_info, get_url_headers, is_url, plan_codec_conversion
+
+
+def get_video_validator(video_path:str)->str:
+    """Value that changes whenever the video changes.
+
+    Size and modification time for local files, `ETag` (or `Last-Modified` and size) for urls.
+
+    Raises:
+        FileNotFoundError: if the video is not a local file nor an url.
+    """
+    if os.path.isfile(video_path):
+        stat = os.stat(video_path)
+        return f'{stat.st_size}:{stat.st_mtime_ns}'
+    elif is_url(video_path):
+        headers = get_url_headers(video_path)
+        if headers.get('ETag'):
+            return headers['ETag']
+        return f'{headers.get("Content-Length", "")}:{headers.get("Last-Modified", "")}'
+    else:
+        raise FileNotFoundError(f'Video {video_path} does not exist')
+
+
+@dataclass
+class VideoInfoCache:
+    """Persistent cache of `get_video_info` results, so a video is not reopened on every rerun.
+
+    Entries are keyed by the video path (or url) and invalidated when the size and modification
+    time (or the `ETag` of an url) change.
+
+    Usage:
+    ```
+    video_info_cache = VideoInfoCache(db_filepath='/path/to/video_info.sqlite')
+    video_info = video_info_cache.get_video_info(video_path='/path/to/video.mp4')
+    ```
+
+    Args:
+        db_filepath (str): path to the SQLite database file. Created if it does not exist.
+    """
+    db_filepath: str
+
+    def __post_init__(self):
+        with self._connect() as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS video_info (
+                    video_path TEXT PRIMARY KEY,
+                    validator TEXT NOT NULL,
+                    info TEXT NOT NULL,
+                    updated_at TEXT
+                )''')
+
+    def _connect(self)->sqlite3.Connection:
+        return sqlite3.connect(self.db_filepath, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _key(video_path:str)->str:
+        return video_path if is_url(video_path) else os.path.abspath(video_path)
+
+    def get(self, video_path:str, validator:str)->dict:
+        """Cached video info, `None` if missing or if the video changed since it was cached."""
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT validator, info FROM video_info WHERE video_path = ?',
+                (self._key(video_path),)).fetchone()
+        if row is None or row[0] != validator:
+            return None
+        return json.loads(row[1])
+
+    def put(self, video_path:str, validator:str, video_info:dict):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO video_info (video_path, validator, info, updated_at) VALUES (?, ?, ?, ?)',
+                (self._key(video_path), validator, json.dumps(video_info), datetime.now().isoformat(timespec='seconds')))
+
+    def invalidate(self, video_path:str):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM video_info WHERE video_path = ?', (self._key(video_path),))
+
+    def get_video_info(self, video_path:str)->dict:
+        """Same as `video_tools.get_video_info`, the video is only opened if it is not cached or has changed.
+
+        For local files the `conversion_method` from `plan_codec_conversion` is cached too.
+        """
+        validator = get_video_validator(video_path=video_path)
+        video_info = self.get(video_path=video_path, validator=validator)
+        if video_info is None:
+            video_info = get_video_info(video_path=video_path)
+            if os.path.isfile(video_path):
+                video_info['conversion_method'] = plan_codec_conversion(video_path=video_path)
+            self.put(video_path=video_path, validator=validator, video_info=video_info)
+        return video_info
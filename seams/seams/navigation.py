@@ -0,0 +1,262 @@
+"""Positions of the extracted frames from the navigation log of a towed or drifting video.
+
+The navigation log is a CSV file with a timestamp, latitude, longitude and (optionally) depth per fix.
+Each frame is timed from the start of the video and joined to the nearest fix with a sorted as-of
+merge (`pandas.merge_asof`), so logs with millions of fixes are joined without Python loops.
+
+Usage:
+```
+navigation = load_navigation_log('/path/to/navigation.csv')
+frames_navigation = join_frames_to_navigation(
+    frame_numbers=[0, 125, 250],
+    frame_times=get_frame_times([0, 125, 250], fps=25),
+    start_time=get_video_start_time('/path/to/video.mp4'),
+    navigation=navigation)
+```
+"""
+import csv
+import json
+import subprocess
+import numpy as np
+import pandas as pd
+from seams.bgs_tools import get_h3_geohash
+
+
+# accepted column names (case insensitive) of the navigation log fields
+NAVIGATION_COLUMN_ALIASES = {
+    'timestamp': ('timestamp', 'time', 'datetime', 'date_time', 'eventtime', 'utc'),
+    'decimalLatitude': ('decimallatitude', 'latitude', 'lat'),
+    'decimalLongitude': ('decimallongitude', 'longitude', 'lon', 'lng', 'long'),
+    'depth': ('depth', 'depthinmeters', 'z'),
+    }
+
+
+def get_navigation_columns(columns:list)->dict:
+    """Column of the navigation log for every field, see `NAVIGATION_COLUMN_ALIASES`.
+
+    Raises:
+        ValueError: if the timestamp, latitude or longitude column is missing.
+    """
+    lower_columns = {str(c).strip().lower(): c for c in columns}
+    navigation_columns = {}
+    for field, aliases in NAVIGATION_COLUMN_ALIASES.items():
+        column = next((lower_columns[a] for a in aliases if a in lower_columns), None)
+        if column is not None:
+            navigation_columns[field] = column
+    missing = [f for f in ('timestamp', 'decimalLatitude', 'decimalLongitude') if f not in navigation_columns]
+    if missing:
+        raise ValueError(f'Missing navigation columns {missing}, found {list(columns)}')
+    return navigation_columns
+
+
+def parse_timestamps(values:pd.Series)->pd.Series:
+    """UTC timestamps from date strings (timezone naive values are taken as UTC) or epoch seconds."""
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_datetime(values, unit='s', utc=True)
+    return pd.to_datetime(values, utc=True)
+
+
+def to_utc_timestamp(value)->pd.Timestamp:
+    """UTC timestamp of a date string or datetime, timezone naive values are taken as UTC."""
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+
+def load_navigation_log(
+    filepath_or_buffer,
+    delimiter:str = None,
+    decimal:str = '.',
+    encoding:str = 'utf-8')->pd.DataFrame:
+    """Reads a navigation log as a DataFrame sorted by time.
+
+    Args:
+        filepath_or_buffer: path to the CSV file or file object.
+        delimiter (str, optional): column delimiter, sniffed from the header if not given. Defaults to None.
+        decimal (str, optional): decimal separator. Defaults to '.'.
+        encoding (str, optional): encoding of the file. Defaults to 'utf-8'.
+
+    Returns:
+        pd.DataFrame: `timestamp` (UTC), `decimalLatitude`, `decimalLongitude` and `depth` (NaN if not in the log),
+            fixes without time or position are dropped.
+    """
+    if delimiter is None:
+        delimiter = sniff_delimiter(filepath_or_buffer, encoding=encoding)
+    header = pd.read_csv(filepath_or_buffer, delimiter=delimiter, encoding=encoding, nrows=0)
+    navigation_columns = get_navigation_columns(header.columns)
+    if hasattr(filepath_or_buffer, 'seek'):
+        filepath_or_buffer.seek(0)
+
+    df = pd.read_csv(
+        filepath_or_buffer,
+        delimiter=delimiter,
+        decimal=decimal,
+        encoding=encoding,
+        usecols=list(navigation_columns.values()))
+    df = df.rename(columns={column: field for field, column in navigation_columns.items()})
+    if 'depth' not in df:
+        df['depth'] = np.nan
+    df['timestamp'] = parse_timestamps(df['timestamp'])
+    df = df.dropna(subset=['timestamp', 'decimalLatitude', 'decimalLongitude'])
+    return df[['timestamp', 'decimalLatitude', 'decimalLongitude', 'depth']].sort_values('timestamp', ignore_index=True)
+
+
+def sniff_delimiter(filepath_or_buffer, encoding:str = 'utf-8')->str:
+    """Delimiter (`,`, `;` or tab) of a CSV file from its first line."""
+    if hasattr(filepath_or_buffer, 'read'):
+        sample = filepath_or_buffer.read(4096)
+        filepath_or_buffer.seek(0)
+        if isinstance(sample, bytes):
+            sample = sample.decode(encoding, errors='ignore')
+    else:
+        with open(filepath_or_buffer, 'r', encoding=encoding, errors='ignore') as f:
+            sample = f.read(4096)
+    try:
+        return csv.Sniffer().sniff(sample.splitlines()[0], delimiters=',;\t').delimiter
+    except (csv.Error, IndexError):
+        return ','
+
+
+def get_video_start_time(video_path:str)->pd.Timestamp:
+    """Recording start of the video from the `creation_time` tag of its container or video stream.
+
+    Returns:
+        pd.Timestamp: UTC start time, `None` if the video has no creation time.
+    """
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'format_tags=creation_time:stream_tags=creation_time', '-of', 'json', video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        print(f'Error occurred while reading the creation time of {video_path}: {result.stderr.strip()}')
+        return None
+    probe = json.loads(result.stdout or '{}')
+    creation_time = (probe.get('format', {}).get('tags') or {}).get('creation_time') \
+        or next(((s.get('tags') or {}).get('creation_time') for s in probe.get('streams', [])), None)
+    if not creation_time:
+        return None
+    return to_utc_timestamp(creation_time)
+
+
+def get_frame_times(frame_numbers:list, fps:float, pts_time:list = None)->np.ndarray:
+    """Seconds from the start of the video of every frame.
+
+    Args:
+        frame_numbers (list): frame numbers.
+        fps (float): frames per second, used if `pts_time` is not given.
+        pts_time (list, optional): presentation time of every frame, see `video_tools.get_keyframe_index`.
+            Exact with variable frame rate. Defaults to None.
+    """
+    frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+    if pts_time is not None:
+        pts_time = np.asarray(pts_time, dtype=np.float64)
+        return pts_time[np.clip(frame_numbers, 0, len(pts_time) - 1)] - pts_time[0]
+    return frame_numbers / fps
+
+
+def join_frames_to_navigation(
+    frame_numbers:list,
+    frame_times:np.ndarray,
+    start_time:pd.Timestamp,
+    navigation:pd.DataFrame,
+    tolerance_seconds:float = None,
+    h3_resolution:int = 12)->pd.DataFrame:
+    """Joins every frame to the nearest fix of the navigation log.
+
+    Args:
+        frame_numbers (list): frame numbers.
+        frame_times (np.ndarray): seconds from the start of the video of every frame, see `get_frame_times`.
+        start_time (pd.Timestamp): UTC recording start of the video, see `get_video_start_time`.
+        navigation (pd.DataFrame): navigation log from `load_navigation_log`.
+        tolerance_seconds (float, optional): frames farther in time from any fix get no position. Defaults to None.
+        h3_resolution (int, optional): resolution of the H3 cell of the frame positions. Defaults to 12.
+
+    Returns:
+        pd.DataFrame: per frame the `frame_number`, `timestamp`, `decimalLatitude`, `decimalLongitude`, `depth`,
+            `h3` cell and `fix_offset_seconds` (time from the frame to its navigation fix), sorted by frame number.
+    """
+    frames_df = pd.DataFrame({
+        'frame_number': np.asarray(frame_numbers, dtype=np.int64),
+        'timestamp': pd.Timestamp(start_time) + pd.to_timedelta(np.asarray(frame_times, dtype=np.float64), unit='s'),
+        }).sort_values('timestamp')
+    navigation = navigation.assign(fix_timestamp=navigation['timestamp'])
+    # same datetime resolution on both sides of the merge
+    frames_df['timestamp'] = frames_df['timestamp'].astype(navigation['timestamp'].dtype)
+
+    joined = pd.merge_asof(
+        frames_df,
+        navigation,
+        on='timestamp',
+        direction='nearest',
+        tolerance=pd.Timedelta(seconds=tolerance_seconds) if tolerance_seconds is not None else None)
+    joined['fix_offset_seconds'] = (joined['fix_timestamp'] - joined['timestamp']).dt.total_seconds()
+
+    # H3 cells only of the frames, not of the fixes
+    joined['h3'] = [
+        get_h3_geohash(latitude, longitude, resolution=h3_resolution) if not np.isnan(latitude) else None
+        for latitude, longitude in zip(joined['decimalLatitude'], joined['decimalLongitude'])]
+    return joined.drop(columns='fix_timestamp').sort_values('frame_number', ignore_index=True)
+
+
+def frames_navigation_to_dict(frames_navigation:pd.DataFrame)->dict:
+    """Frame positions as plain values for the survey datastore, frames without position are left out.
+
+    Returns:
+        dict: frame number as key and `timestamp` (ISO 8601), `decimalLatitude`, `decimalLongitude`,
+            `depth`, `h3` and `fix_offset_seconds` as value.
+    """
+    records = {}
+    for row in frames_navigation.dropna(subset=['decimalLatitude']).itertuples(index=False):
+        records[int(row.frame_number)] = {
+            'timestamp': row.timestamp.isoformat(),
+            'decimalLatitude': float(row.decimalLatitude),
+            'decimalLongitude': float(row.decimalLongitude),
+            'depth': None if pd.isna(row.depth) else float(row.depth),
+            'h3': row.h3,
+            'fix_offset_seconds': float(row.fix_offset_seconds)
+            }
+    return records
+
+
+# --- tests
+
+def test_join_frames_to_navigation():
+    """Test for join_frames_to_navigation against the nearest fix found frame by frame.
+    """
+    import io
+
+    # fixes every second for a minute, in a log with `;` delimiter and aliased columns
+    start = pd.Timestamp('2023-06-01T10:00:00', tz='UTC')
+    lines = ['time;lat;lon;z']
+    for k in range(60):
+        lines.append(f'{(start + pd.Timedelta(seconds=k)).isoformat()};{57.0 + k * 1e-4};{11.0 + k * 1e-4};{20 + k}')
+    navigation = load_navigation_log(io.StringIO('\n'.join(lines)))
+    assert len(navigation) == 60
+    assert list(navigation.columns) == ['timestamp', 'decimalLatitude', 'decimalLongitude', 'depth']
+
+    # the video starts 0.4 s after the first fix, frames not sorted
+    frame_numbers = [250, 0, 1000, 1488, 5000]
+    frames_navigation = join_frames_to_navigation(
+        frame_numbers=frame_numbers,
+        frame_times=get_frame_times(frame_numbers, fps=25),
+        start_time=start + pd.Timedelta(seconds=0.4),
+        navigation=navigation,
+        tolerance_seconds=5)
+    assert frames_navigation['frame_number'].tolist() == sorted(frame_numbers)
+
+    for row in frames_navigation.itertuples(index=False):
+        frame_time = start + pd.Timedelta(seconds=0.4 + row.frame_number / 25)
+        offsets = (navigation['timestamp'] - frame_time).dt.total_seconds()
+        nearest = offsets.abs().idxmin()
+        if abs(offsets[nearest]) > 5:
+            assert np.isnan(row.decimalLatitude) and pd.isna(row.h3)
+            continue
+        assert row.decimalLatitude == navigation['decimalLatitude'][nearest]
+        assert row.depth == navigation['depth'][nearest]
+        assert np.isclose(row.fix_offset_seconds, offsets[nearest])
+        assert row.h3 == get_h3_geohash(row.decimalLatitude, row.decimalLongitude, resolution=12)
+
+    # frame 5000 is 200 s in, beyond the log and the tolerance
+    records = frames_navigation_to_dict(frames_navigation)
+    assert sorted(records) == [0, 250, 1000, 1488]
+    assert records[250]['depth'] == 30.0
+    assert np.isclose(records[0]['fix_offset_seconds'], -0.4)
@@ -0,0 +1,224 @@
+"""Cache of the frames rendered with their dotpoint overlay.
+
+Every Streamlit rerun of the interpretation page renders the current frame again, although the
+overlay only changes with the frame or the grid parameters. Rendered overlays are kept encoded
+(ready for `st.image`) in a bounded in-memory LRU shared by the sessions of the process and in
+a directory on disk, under a key of the frame content hash and the grid parameters.
+
+Only deterministic grids can be cached: an unseeded random grid moves on every render.
+
+Usage:
+```
+overlay_cache = get_overlay_cache(cache_dirpath='/path/to/overlays')
+image_bytes = overlay_cache.get_or_render(
+    filepath=frame_filepath,
+    params={'n_rows': 3, 'strategy': 'alternating', 'seed': 1, 'noise_percent': 0.0},
+    render=lambda: dotpoints_grid(filepath=frame_filepath, n_rows=3))
+```
+"""
+import io
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+from PIL import Image
+
+
+OVERLAY_EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+# frame hashes kept per overlay kept in memory, overlays of several grids share a frame
+FILE_HASHES_PER_ITEM = 4
+
+# caches per directory, they live as long as the Streamlit process
+_overlay_caches = {}
+_overlay_caches_lock = threading.Lock()
+
+
+def get_file_hash(filepath:str)->str:
+    """sha1 of the content of a file."""
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class OverlayCache:
+    """Two tier cache of the rendered overlays, see the module docstring.
+
+    Args:
+        cache_dirpath (str, optional): directory of the on-disk tier, `None` for memory only. Defaults to None.
+        max_memory_items (int, optional): overlays kept in memory. Defaults to 64.
+        image_format (str, optional): encoding of the overlays, `jpeg`, `png` or `webp`. Defaults to 'jpeg'.
+        quality (int, optional): quality from 1 to 100 of `jpeg` and `webp`. Defaults to 90.
+    """
+    cache_dirpath: str = None
+    max_memory_items: int = 64
+    image_format: str = 'jpeg'
+    quality: int = 90
+    memory: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    # content hash of the frames by (path, size, modification time), bounded as `memory`
+    file_hashes: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.cache_dirpath:
+            os.makedirs(self.cache_dirpath, exist_ok=True)
+
+    def get_frame_hash(self, filepath:str)->str:
+        stat = os.stat(filepath)
+        file_key = (os.path.realpath(filepath), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if file_key in self.file_hashes:
+                self.file_hashes.move_to_end(file_key)
+                return self.file_hashes[file_key]
+        # hashed outside the lock, a frame hashed twice meanwhile gets the same value
+        file_hash = get_file_hash(filepath)
+        with self.lock:
+            self.file_hashes[file_key] = file_hash
+            while len(self.file_hashes) > self.max_memory_items * FILE_HASHES_PER_ITEM:
+                self.file_hashes.popitem(last=False)
+        return file_hash
+
+    def get_key(self, filepath:str, params:dict)->str:
+        """Key of the overlay of a frame, changes with the frame content and the grid parameters."""
+        key = {'frame': self.get_frame_hash(filepath), 'params': params, 'encoding': [self.image_format, self.quality]}
+        return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_filepath(self, key:str)->str:
+        return os.path.join(self.cache_dirpath, f'{key}.{OVERLAY_EXTENSIONS[self.image_format]}')
+
+    def get(self, key:str)->bytes:
+        """Encoded overlay from memory or disk, `None` if not cached."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        if self.cache_dirpath:
+            filepath = self.get_filepath(key)
+            try:
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            # last access for the media cache eviction
+            os.utime(filepath)
+            self.put_memory(key, data)
+            return data
+        return None
+
+    def put_memory(self, key:str, data:bytes):
+        with self.lock:
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_items:
+                self.memory.popitem(last=False)
+
+    def put(self, key:str, data:bytes):
+        self.put_memory(key, data)
+        if self.cache_dirpath:
+            filepath = self.get_filepath(key)
+            temp_filepath = f'{filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                with open(temp_filepath, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_filepath, filepath)
+            except OSError as e:
+                print(f'Error occurred while writing the overlay {filepath}: {e}')
+
+    def encode(self, image:Image.Image)->bytes:
+        buffer = io.BytesIO()
+        if self.image_format == 'png':
+            image.save(buffer, format='PNG')
+        else:
+            image.convert('RGB').save(buffer, format=self.image_format.upper(), quality=self.quality)
+        return buffer.getvalue()
+
+    def get_or_render(self, filepath:str, params:dict, render:Callable, cacheable:bool = True)->bytes:
+        """Encoded overlay of a frame, rendered with `render()` (returning a PIL image) only if not cached.
+
+        Args:
+            filepath (str): path to the frame.
+            params (dict): every parameter of the rendered grid, part of the key.
+            render (Callable): renders the overlay as a PIL image.
+            cacheable (bool, optional): `False` for non deterministic overlays, rendered every time. Defaults to True.
+
+        Returns:
+            bytes: the encoded overlay, `None` if `render` returned `None`.
+        """
+        key = self.get_key(filepath, params) if cacheable else None
+        if key is not None:
+            data = self.get(key)
+            if data is not None:
+                return data
+        image = render()
+        if image is None:
+            return None
+        data = self.encode(image)
+        if key is not None:
+            self.put(key, data)
+        return data
+
+
+def get_overlay_cache(cache_dirpath:str = None, max_memory_items:int = 64, image_format:str = 'jpeg', quality:int = 90)->OverlayCache:
+    """Overlay cache of `cache_dirpath`, created once per process so its memory tier outlives the reruns."""
+    with _overlay_caches_lock:
+        key = (cache_dirpath, max_memory_items, image_format, quality)
+        if key not in _overlay_caches:
+            _overlay_caches[key] = OverlayCache(
+                cache_dirpath=cache_dirpath, max_memory_items=max_memory_items, image_format=image_format, quality=quality)
+        return _overlay_caches[key]
+
+
+# --- tests
+
+def test_overlay_cache_keys():
+    """Test for the keys of the overlay cache, an overlay is rendered once per frame content and grid parameters.
+    """
+    import shutil
+    import tempfile
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        frame_filepath = os.path.join(temp_dir, 'frame000000.png')
+        Image.new('RGB', (64, 48), 'blue').save(frame_filepath)
+        renders = []
+
+        def render():
+            renders.append(1)
+            return Image.open(frame_filepath)
+
+        overlay_cache = OverlayCache(cache_dirpath=os.path.join(temp_dir, 'overlays'), max_memory_items=2)
+        params = {'n_rows': 3, 'strategy': 'alternating', 'seed': 1, 'noise_percent': 0.0}
+        data = overlay_cache.get_or_render(filepath=frame_filepath, params=params, render=render)
+        assert overlay_cache.get_or_render(filepath=frame_filepath, params=dict(params), render=render) == data
+        assert len(renders) == 1
+
+        # Other grid parameters or encoding are other overlays
+        overlay_cache.get_or_render(filepath=frame_filepath, params={**params, 'seed': 2}, render=render)
+        assert len(renders) == 2
+        assert OverlayCache(image_format='png').get_key(frame_filepath, params) != overlay_cache.get_key(frame_filepath, params)
+
+        # The key follows the content of the frame, not its path
+        copy_filepath = os.path.join(temp_dir, 'copy.png')
+        shutil.copy(frame_filepath, copy_filepath)
+        assert overlay_cache.get_key(copy_filepath, params) == overlay_cache.get_key(frame_filepath, params)
+        key = overlay_cache.get_key(frame_filepath, params)
+        Image.new('RGB', (64, 48), 'red').save(frame_filepath)
+        assert overlay_cache.get_key(frame_filepath, params) != key
+
+        # The disk tier outlives the memory tier, bounded to `max_memory_items`
+        assert len(overlay_cache.memory) == 2
+        new_overlay_cache = OverlayCache(cache_dirpath=overlay_cache.cache_dirpath)
+        assert new_overlay_cache.get_or_render(filepath=copy_filepath, params=params, render=render) == data
+        assert len(renders) == 2
+
+        # Non deterministic overlays are rendered every time
+        overlay_cache.get_or_render(filepath=copy_filepath, params=params, render=render, cacheable=False)
+        overlay_cache.get_or_render(filepath=copy_filepath, params=params, render=render, cacheable=False)
+        assert len(renders) == 4
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
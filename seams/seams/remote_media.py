@@ -0,0 +1,355 @@
+"""Frame extraction from videos on HTTP(S) servers (e.g. an object store) without downloading them.
+
+The video is read through `HTTPRangeFile`, a seekable file object fetching fixed size chunks
+with HTTP Range requests and keeping them in a local chunk cache. PyAV demuxes and decodes from it,
+so only the container index and the GOPs of the requested frames are transferred.
+
+Usage:
+```
+frames = grab_remote_frames(
+    url='https://objectstore.example.org/survey/video.mp4',
+    frame_numbers=[250, 500],
+    output_dir='/path/to/frames',
+    cache_dirpath='/path/to/remote_cache')
+```
+"""
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator
+from urllib.request import urlopen, Request
+from seams.metadata_cache import get_video_validator
+from seams.video_tools import get_url_headers, get_sampled_frame_numbers, remove_stale_partial_dirs, drop_low_quality_frames
+from seams.frame_manifest import update_frame_manifest, get_valid_frames
+from seams.decoders import write_decoded_frames
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """Read-only seekable file over HTTP(S) Range requests with a chunk cache.
+
+    Chunks are kept in memory (LRU of `max_memory_chunks`) and, if `cache_dirpath` is given, on disk
+    under a key of the url and its validator (`ETag` or size and `Last-Modified`), so a changed
+    object is never read from stale chunks.
+
+    Args:
+        url (str): url of the file, the server must support Range requests.
+        chunk_size (int, optional): bytes per request. Defaults to 1 MiB.
+        cache_dirpath (str, optional): directory of the on-disk chunk cache. Defaults to None.
+        max_memory_chunks (int, optional): chunks kept in memory. Defaults to 16.
+        timeout (float, optional): seconds to wait for the server. Defaults to 30.
+
+    Raises:
+        OSError: if the server does not report the size of the file.
+    """
+
+    def __init__(
+        self,
+        url:str,
+        chunk_size:int = CHUNK_SIZE,
+        cache_dirpath:str = None,
+        max_memory_chunks:int = 16,
+        timeout:float = 30):
+        super().__init__()
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_memory_chunks = max_memory_chunks
+        self.timeout = timeout
+
+        headers = get_url_headers(url, timeout=timeout)
+        if not headers.get('Content-Length'):
+            raise OSError(f'The server does not report the size of {url}')
+        self.size = int(headers['Content-Length'])
+
+        self.chunks_dirpath = None
+        if cache_dirpath:
+            key = hashlib.sha1(f'{url}|{get_video_validator(url)}|{chunk_size}'.encode('utf-8')).hexdigest()
+            self.chunks_dirpath = os.path.join(cache_dirpath, key)
+            os.makedirs(self.chunks_dirpath, exist_ok=True)
+
+        self.position = 0
+        self.memory_chunks = OrderedDict()
+        self.lock = threading.Lock()
+        # transfer statistics
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self)->bool:
+        return True
+
+    def seekable(self)->bool:
+        return True
+
+    def tell(self)->int:
+        return self.position
+
+    def seek(self, offset:int, whence:int = io.SEEK_SET)->int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f'Invalid whence {whence}')
+        if position < 0:
+            raise ValueError('Negative seek position')
+        self.position = position
+        return self.position
+
+    def readinto(self, buffer)->int:
+        if self.position >= self.size:
+            return 0
+        index, start = divmod(self.position, self.chunk_size)
+        chunk = self.get_chunk(index)
+        n = min(len(buffer), len(chunk) - start)
+        buffer[:n] = chunk[start:start + n]
+        self.position += n
+        return n
+
+    def get_chunk(self, index:int)->bytes:
+        """Chunk `index` from memory, disk or the server, in that order."""
+        with self.lock:
+            if index in self.memory_chunks:
+                self.memory_chunks.move_to_end(index)
+                return self.memory_chunks[index]
+
+        chunk = None
+        chunk_length = min(self.chunk_size, self.size - index * self.chunk_size)
+        chunk_filepath = os.path.join(self.chunks_dirpath, f'{index}.chunk') if self.chunks_dirpath else None
+        if chunk_filepath and os.path.isfile(chunk_filepath):
+            with open(chunk_filepath, 'rb') as f:
+                chunk = f.read()
+            if len(chunk) != chunk_length:
+                chunk = None
+        if chunk is None:
+            chunk = self.fetch_chunk(index)
+            if chunk_filepath:
+                temp_filepath = f'{chunk_filepath}.{os.getpid()}.tmp'
+                with open(temp_filepath, 'wb') as f:
+                    f.write(chunk)
+                os.replace(temp_filepath, chunk_filepath)
+
+        with self.lock:
+            self.memory_chunks[index] = chunk
+            while len(self.memory_chunks) > self.max_memory_chunks:
+                self.memory_chunks.popitem(last=False)
+        return chunk
+
+    def fetch_chunk(self, index:int)->bytes:
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        request = Request(self.url, headers={'Range': f'bytes={start}-{end}'})
+        with urlopen(request, timeout=self.timeout) as response:
+            if response.status != 206 and not (response.status == 200 and start == 0 and end == self.size - 1):
+                raise OSError(f'The server does not support range requests for {self.url}')
+            chunk = response.read()
+        if len(chunk) != end - start + 1:
+            raise OSError(f'Incomplete range {start}-{end} of {self.url}')
+        self.requests += 1
+        self.bytes_fetched += len(chunk)
+        return chunk
+
+
+def require_av():
+    if av is None:
+        raise ImportError('PyAV is not installed, install `av` to extract frames from remote videos')
+
+
+def probe_remote_video(url:str, cache_dirpath:str = None)->dict:
+    """Reads the stream properties of a remote video. Only the container header and index are fetched.
+
+    Returns:
+        dict: `codec`, `fps`, `frame_count`, `duration`, `width`, `height` and `start_time` (seconds).
+    """
+    require_av()
+    with HTTPRangeFile(url, cache_dirpath=cache_dirpath) as f, av.open(f) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate)
+        start_time = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+        if stream.duration is not None:
+            duration = float(stream.duration * stream.time_base)
+        else:
+            duration = container.duration / av.time_base if container.duration else 0.0
+        return {
+            'codec': stream.codec_context.name,
+            'fps': fps,
+            'frame_count': stream.frames or int(round(duration * fps)),
+            'duration': duration,
+            'width': stream.codec_context.width,
+            'height': stream.codec_context.height,
+            'start_time': start_time
+            }
+
+
+def decode_remote_frames(
+    url:str,
+    frame_numbers:list,
+    cache_dirpath:str = None,
+    max_forward_seconds:float = 2.0)->Iterator[tuple]:
+    """Decodes frames of a remote video with PyAV, yielding `(frame_number, image)` like `decoders`.
+
+    Frame numbers are converted to time with the average frame rate (constant frame rate). For every frame
+    the demuxer seeks to the previous keyframe with the container index, unless the frame is less than
+    `max_forward_seconds` after the last decoded one, then decoding just continues.
+    """
+    require_av()
+    with HTTPRangeFile(url, cache_dirpath=cache_dirpath) as f, av.open(f) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        fps = float(stream.average_rate or stream.guessed_rate)
+        start_time = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+        tolerance = 0.5 / fps
+
+        frames = None
+        last_time = None
+        for frame_number in sorted(set(frame_numbers)):
+            target = start_time + frame_number / fps
+            if frames is None or last_time is None or not (last_time < target - tolerance <= last_time + max_forward_seconds):
+                container.seek(int(target / stream.time_base), stream=stream, backward=True, any_frame=False)
+                frames = container.decode(stream)
+            for frame in frames:
+                if frame.time is None:
+                    continue
+                last_time = frame.time
+                if frame.time >= target - tolerance:
+                    yield frame_number, frame.to_ndarray(format='bgr24')
+                    break
+
+
+def grab_remote_frames(
+    url:str,
+    frame_numbers:list,
+    output_dir:str,
+    prefix:str = 'frame',
+    cache_dirpath:str = None,
+    progress_callback:Callable = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    checkpoint_callback:Callable = None,
+    skip_low_quality:bool = False)->dict:
+    """Same as `video_tools.grab_frames` for a video on an HTTP(S) server, see `decode_remote_frames`.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    return write_decoded_frames(
+        decoded_frames=decode_remote_frames(url=url, frame_numbers=frame_numbers, cache_dirpath=cache_dirpath),
+        n_frames=len(frame_numbers),
+        output_dir=output_dir,
+        prefix=prefix,
+        progress_callback=progress_callback,
+        image_format=image_format,
+        quality=quality,
+        checkpoint_callback=checkpoint_callback,
+        skip_low_quality=skip_low_quality)
+
+
+def extract_remote_frames(
+    url:str,
+    frames_dirpath:str,
+    frame_numbers:list = None,
+    cache_dirpath:str = None,
+    progress_callback:Callable = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    skip_low_quality:bool = False)->dict:
+    """`video_tools.extract_frames` for a video url, resumable with the frame manifest of `frames_dirpath`.
+
+    Without `frame_numbers` a frame every 5 seconds is extracted.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    remove_stale_partial_dirs(frames_dirpath)
+    if frame_numbers is None:
+        probe = probe_remote_video(url=url, cache_dirpath=cache_dirpath)
+        frame_numbers = get_sampled_frame_numbers(n_seconds=5, total_frames=probe['frame_count'], fps=probe['fps'])
+
+    def checkpoint(new_frames:dict, frame_metrics:dict = None):
+        update_frame_manifest(
+            frames_dirpath=frames_dirpath, video_path=url,
+            frames=new_frames, image_format=image_format, quality=quality, frame_metrics=frame_metrics)
+
+    frames = get_valid_frames(
+        frames_dirpath=frames_dirpath, video_path=url,
+        frame_numbers=frame_numbers, image_format=image_format, quality=quality)
+    missing_frames = [i for i in frame_numbers if i not in frames]
+    if missing_frames:
+        frames.update(grab_remote_frames(
+            url=url,
+            frame_numbers=missing_frames,
+            output_dir=frames_dirpath,
+            cache_dirpath=cache_dirpath,
+            progress_callback=progress_callback,
+            image_format=image_format,
+            quality=quality,
+            checkpoint_callback=checkpoint,
+            skip_low_quality=skip_low_quality))
+    if skip_low_quality:
+        frames = drop_low_quality_frames(frames, frames_dirpath=frames_dirpath)
+    return {i: frames[i] for i in frame_numbers if i in frames}
+
+
+# --- tests
+
+def test_grab_remote_frames():
+    """Test for grab_remote_frames against a local HTTP server with range support.
+    """
+    import cv2
+    import shutil
+    import tempfile
+    import subprocess
+    from seams.media_server import start_media_server, get_media_url, stop_media_servers
+    from seams.decoders import decode_frames_pyav
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # Create a 20 s test video with a keyframe every 2 s
+        video_path = os.path.join(temp_dir, 'test.mp4')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=25:duration=20',
+            '-c:v', 'libx264', '-g', '50', '-pix_fmt', 'yuv420p', '-y', video_path], check=True)
+        base_url = start_media_server(directories={'test': temp_dir}, host='127.0.0.1', port=8597)
+        url = get_media_url(base_url, 'test', video_path)
+
+        probe = probe_remote_video(url=url)
+        assert probe['frame_count'] == 500
+        assert probe['fps'] == 25
+
+        # Only part of the file is transferred for two frames
+        cache_dirpath = os.path.join(temp_dir, 'cache')
+        with HTTPRangeFile(url, chunk_size=64 * 1024, cache_dirpath=cache_dirpath) as f, av.open(f) as container:
+            stream = container.streams.video[0]
+            container.seek(int(10 / stream.time_base), stream=stream)
+            next(container.decode(stream))
+            assert 0 < f.bytes_fetched < os.path.getsize(video_path)
+
+        output_dir = os.path.join(temp_dir, 'frames')
+        os.makedirs(output_dir)
+        frames = grab_remote_frames(url=url, frame_numbers=[10, 260], output_dir=output_dir, cache_dirpath=cache_dirpath)
+        assert sorted(frames) == [10, 260]
+
+        # Same images as the frames decoded from the local file
+        remote_frames = dict(decode_remote_frames(url=url, frame_numbers=[10, 260], cache_dirpath=cache_dirpath))
+        reference = dict(decode_frames_pyav(video_path, [10, 260]))
+        for frame_number in (10, 260):
+            assert (remote_frames[frame_number] == reference[frame_number]).all()
+            assert (cv2.imread(frames[frame_number]) == reference[frame_number]).all()
+
+        # Frames recorded in the manifest are not fetched again
+        frames = extract_remote_frames(url=url, frames_dirpath=output_dir, frame_numbers=[10, 260, 400], cache_dirpath=cache_dirpath)
+        assert sorted(frames) == [10, 260, 400]
+        assert extract_remote_frames(url=url, frames_dirpath=output_dir, frame_numbers=[10, 260, 400]) == frames
+    finally:
+        stop_media_servers()
+        shutil.rmtree(temp_dir, ignore_errors=True)
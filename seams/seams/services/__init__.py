@@ -0,0 +1,134 @@
+"""Streamlit pages of the app, run by `app.py` with the `seams.toml` configuration in the session state."""
+import os
+
+
+SERVICES_DIRPATH = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- tests
+
+def run_page(page:str, data_dirpath:str):
+    """Runs a page once with streamlit `AppTest`, with the default `seams.toml` and the app paths
+    of `app.initialize_seams` in `data_dirpath`."""
+    import toml
+    from streamlit.testing.v1 import AppTest
+
+    app_dirpath = os.path.dirname(os.path.dirname(SERVICES_DIRPATH))
+    app_test = AppTest.from_file(os.path.join(SERVICES_DIRPATH, page), default_timeout=60)
+    app_test.session_state['APP_DIRPATH'] = app_dirpath
+    app_test.session_state['DATA_DIRPATH'] = data_dirpath
+    app_test.session_state['SERVICES_DIRPATH'] = SERVICES_DIRPATH
+    app_test.session_state['ASSETS_DIRPATH'] = os.path.join(app_dirpath, 'assets')
+    app_test.session_state['APP_SERVICES_YAML'] = os.path.join(app_dirpath, 'app_services.yaml')
+    app_test.session_state['USERS_FILEPATH'] = os.path.join(data_dirpath, 'users.yaml')
+    for section, config in toml.load(os.path.join(os.path.dirname(SERVICES_DIRPATH), 'seams.toml')).items():
+        app_test.session_state[section] = config
+    return app_test.run()
+
+
+def test_benthic_interpretation_page():
+    """Smoke test of the benthic interpretation page with the default `seams.toml`: the page loads,
+    draws the dotpoints of the frame and stores the seeded grid of the frame."""
+    import shutil
+    import tempfile
+    import yaml
+    from PIL import Image
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        frames_dirpath = os.path.join(temp_dir, 'survey', 'frames', 'video.mp4')
+        os.makedirs(frames_dirpath)
+        frame_filepath = os.path.join(frames_dirpath, 'frame_000125.jpg')
+        Image.new('RGB', (640, 360), 'blue').save(frame_filepath)
+        survey = {
+            'current_surveyID': 'survey',
+            'current_station': 'station',
+            'surveys': {'survey': {'stations': {'station': {'media': {'frames': {125: frame_filepath}}}}}},
+            }
+        survey_filepath = os.path.join(temp_dir, 'survey.yaml')
+        with open(survey_filepath, 'w') as f:
+            yaml.safe_dump(survey, f)
+
+        app_test = run_page('benthic_interpretation.py', data_dirpath=temp_dir)
+        assert not app_test.exception, app_test.exception
+        assert len(app_test.get('image')) == 1
+
+        with open(survey_filepath, 'r') as f:
+            interpreted = yaml.safe_load(f)['surveys']['survey']['stations']['station']['media']['interpreted']
+        assert interpreted[1]['frame_id'] == 125
+        assert interpreted[1]['dotpoints']['seed'] is not None
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def test_prep_station_replacement_frames():
+    """Frames added to the selection are extracted by a background job and stored in the survey once it is done."""
+    import time
+    import shutil
+    import signal
+    import tempfile
+    import subprocess
+    import yaml
+    from seams.jobs import JobQueue, DONE, FAILED
+
+    temp_dir = tempfile.mkdtemp()
+    jobs_filepath = os.path.join(temp_dir, 'jobs.sqlite')
+    try:
+        videos_dirpath = os.path.join(temp_dir, 'survey', 'videos')
+        os.makedirs(videos_dirpath)
+        os.makedirs(os.path.join(temp_dir, 'survey', 'frames'))
+        video_filepath = os.path.join(videos_dirpath, 'video.mp4')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=25:duration=60',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-y', video_filepath], check=True)
+        survey = {
+            'current_surveyID': 'survey',
+            'current_station': 'station',
+            'surveys': {'survey': {'stations': {'station': {'media': {'video': {'video.mp4': video_filepath}}}}}},
+            }
+        survey_filepath = os.path.join(temp_dir, 'survey.yaml')
+        with open(survey_filepath, 'w') as f:
+            yaml.safe_dump(survey, f)
+
+        def load_frames()->dict:
+            with open(survey_filepath, 'r') as f:
+                return yaml.safe_load(f)['surveys']['survey']['stations']['station']['media'].get('frames') or {}
+
+        def wait_for_jobs():
+            job_queue = JobQueue(db_filepath=jobs_filepath)
+            for _ in range(120):
+                jobs = job_queue.list_jobs()
+                if all(job['status'] in (DONE, FAILED) for job in jobs):
+                    assert all(job['status'] == DONE for job in jobs), [job['error'] for job in jobs]
+                    return
+                time.sleep(0.5)
+            raise TimeoutError(f'jobs not done {jobs}')
+
+        app_test = run_page('prep_station.py', data_dirpath=temp_dir)
+        assert not app_test.exception, app_test.exception
+        app_test.button(key='FormSubmitter:extract_frames_form-extract 10 sampled video frames').click().run()
+        wait_for_jobs()
+        app_test.run()
+        sampled_frames = load_frames()
+        assert len(sampled_frames) == 10
+
+        # replace the first frame by a frame not sampled
+        selection = app_test.multiselect(key='key_frames_survey_station_video.mp4')
+        replacement = next(i for i in selection.options if int(i.split()[0]) not in sampled_frames)
+        selection.unselect(selection.value[0]).select(replacement).run()
+        assert load_frames() == sampled_frames
+        wait_for_jobs()
+        app_test.run()
+        assert not app_test.exception, app_test.exception
+
+        frames = load_frames()
+        assert len(frames) == 10 and int(replacement.split()[0]) in frames
+        assert min(sampled_frames) not in frames
+        assert all(os.path.isfile(filepath) for filepath in frames.values())
+        # the selection survives the reruns
+        app_test.run()
+        assert sorted(app_test.multiselect(key='key_frames_survey_station_video.mp4').value) == sorted(frames)
+    finally:
+        for pid in JobQueue(db_filepath=jobs_filepath).alive_workers() if os.path.isfile(jobs_filepath) else []:
+            os.killpg(pid, signal.SIGTERM)
+        shutil.rmtree(temp_dir, ignore_errors=True)
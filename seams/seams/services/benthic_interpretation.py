@@ -1,10 +1,52 @@
 import os
 import streamlit as st 
+from PIL import Image
 from seams.bgs_tools import create_subdirectory
 from seams.video_tools import get_video_info, convert_codec, extract_frames, video_player, select_random_frames
 from seams.datastorage import DataStore, YamlStorage
 from seams.seafloor import substrates, phytobenthosCommonTaxa
-from seams.markers import dotpoints_grid
+from seams.markers import dotpoints_grid, dotpoints_overlay, POINT_SAMPLERS, generate_dotpoints, new_grid_seed, encode_dotpoints, decode_dotpoints
+from seams.media_server import start_media_server, get_media_url, new_media_token
+from seams.overlay_cache import get_overlay_cache
+from seams.media_cache import MediaCache
+from seams.frame_manifest import get_frame_metrics
+from seams.frame_quality import get_quality_flags, POOR_IMAGE_QUALITY, POOR_VISIBILITY
+
+
+def is_served_from_localhost()->bool:
+    """`True` if the browser reaches the app on localhost, `False` if unknown (Streamlit without `st.context`)."""
+    headers = getattr(getattr(st, 'context', None), 'headers', None) or {}
+    hostname = headers.get('Host', '').rsplit(':', 1)[0].strip('[]')
+    return hostname in ('localhost', '127.0.0.1', '::1')
+
+
+def get_frame_grid(frame:dict, grid_params:dict)->tuple:
+    """Dotpoint grid of an interpreted frame, generated from the seed of the frame and stored with it.
+
+    The grid is generated again, with the same seed, only when the grid parameters change and
+    the frame has no dotpoint annotations yet, so the annotations stay tied to their pixel positions.
+
+    Args:
+        frame (dict): interpreted frame from `media['interpreted']`.
+        grid_params (dict): keyword arguments of `generate_dotpoints` except the seed.
+
+    Returns:
+        tuple: the grid (`seed`, `params`, image `width` and `height` and the encoded `xy` coordinates)
+            and `True` if it was (re)generated and has to be stored.
+    """
+    grid = frame.get('dotpoints') or {}
+    if 'xy' in grid and (grid.get('params') == grid_params or frame.get('dotpoint_annotations')):
+        return grid, False
+    seed = grid.get('seed', new_grid_seed())
+    width, height = Image.open(frame['frame_filepath']).size
+    points = generate_dotpoints(width=width, height=height, seed=seed, **grid_params)
+    frame['dotpoints'] = {
+        'seed': seed, 
+        'params': dict(grid_params), 
+        'width': width, 
+        'height': height, 
+        'xy': encode_dotpoints(points)}
+    return frame['dotpoints'], True
 
 
 # Globals
@@ -23,11 +65,39 @@ if 'SURVEY_FILEPATH' not in st.session_state:
 VIDEOS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'videos')
 PHOTOS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'photos')
 FRAMES_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'frames')
+OVERLAYS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'overlays')
 
 #
 ds_survey = DataStore(YamlStorage(file_path=SURVEY_FILEPATH))
 
-#
+# last access of the frames for the media cache eviction
+media_cache = MediaCache(db_filepath=os.path.join(DATA_DIRPATH, 'media_cache.sqlite'))
+
+# frames rendered with their dotpoints, reused across reruns and sessions
+interpretation_config = st.session_state.get('interpretation', {})
+overlay_cache = get_overlay_cache(
+    cache_dirpath=OVERLAYS_DIRPATH, 
+    max_memory_items=interpretation_config.get('overlay_memory_items', 64),
+    image_format=interpretation_config.get('overlay_image_format', 'jpeg'),
+    quality=interpretation_config.get('overlay_quality', 90))
+
+# `client`: the frame is served as it is and the dotpoints are drawn by the browser, 
+# `raster`: the dotpoints are drawn on the frame by the server
+RENDER_MODE = interpretation_config.get('render_mode', 'raster')
+media_server_config = st.session_state.get('media_server', {})
+# media urls of the session, see `seams.media_server`
+if 'MEDIA_TOKEN' not in st.session_state:
+    st.session_state['MEDIA_TOKEN'] = new_media_token()
+MEDIA_BASE_URL = start_media_server(
+    directories={'frames': FRAMES_DIRPATH},
+    host=media_server_config.get('host', '127.0.0.1'),
+    port=media_server_config.get('port', 8502),
+    public_url=media_server_config.get('public_url', ''),
+    token=st.session_state['MEDIA_TOKEN'])
+# without a `public_url` the media server is only reachable at http://localhost:<port>
+MEDIA_SERVER_REACHABLE = MEDIA_BASE_URL is not None \
+    and (bool(media_server_config.get('public_url')) or is_served_from_localhost())
+
 
 current_surveyID = ds_survey.storage_strategy.data['current_surveyID']
 current_station = ds_survey.storage_strategy.data['current_station']
@@ -52,6 +122,8 @@ if 'interpreted' not in media:
 
 
 frame_filepath = None
+frame_metrics = None
+frame_grid = None
 
 with st.expander(
     label='**Benthic interpretation**',
@@ -68,12 +140,23 @@ with st.expander(
             )
         if current_frame:
             frame_filepath = media['interpreted'][current_frame]['frame_filepath']
+            media_cache.touch(frame_filepath)
+            # quality metrics measured during the frame extraction
+            frame_metrics = get_frame_metrics(
+                frames_dirpath=os.path.dirname(frame_filepath), 
+                frame_number=media['interpreted'][current_frame]['frame_id'])
 
     with header_col2:
-        n_rows = st.slider(label='***n*** dotpoint rows', 
-                           min_value=3, 
-                           max_value=5, 
-                           disabled=False,)
+        sampling_strategy = st.selectbox(label='**dotpoint sampling**', options=list(POINT_SAMPLERS))
+        n_points = None
+        if sampling_strategy == 'alternating':
+            n_rows = st.slider(label='***n*** dotpoint rows', 
+                               min_value=3, 
+                               max_value=5, 
+                               disabled=False,)
+        else:
+            n_rows = None
+            n_points = st.number_input(label='***n*** dotpoints', min_value=1, max_value=5000, value=10, step=1)
     with header_col3:
         enable_random = st.checkbox(label='enable random', value=False)
         enable_ai = st.checkbox(label='enable AI', value=False, disabled=True)
@@ -103,17 +186,49 @@ if frame_filepath:
             # Select the image file
             with st.spinner("Creating dotpoints over image frame"):
                     
-                modified_image = dotpoints_grid(
-                    
-                    filepath=frame_filepath,
-                    n_rows=n_rows,
-                    enable_random=enable_random,
-                    noise_percent=noise_percent
-                    )
+                grid_params = {
+                    'n_rows': n_rows,
+                    'enable_random': enable_random,
+                    'noise_percent': noise_percent,
+                    'strategy': sampling_strategy,
+                    'n_points': n_points,
+                    }
+                frame_grid, grid_changed = get_frame_grid(media['interpreted'][current_frame], grid_params)
+                if grid_changed:
+                    ds_survey.store_data(data=ds_survey.storage_strategy.data)
+                frame_points = decode_dotpoints(frame_grid['xy'])
+                # frames outside the served directory are drawn by the server
+                client_rendering = RENDER_MODE == 'client' and MEDIA_SERVER_REACHABLE \
+                    and os.path.commonpath([os.path.realpath(FRAMES_DIRPATH), os.path.realpath(frame_filepath)]) == os.path.realpath(FRAMES_DIRPATH)
+                modified_image = None
+                if not client_rendering:
+                    # seeded grids are the same on every render and always cacheable
+                    modified_image = overlay_cache.get_or_render(
+                        filepath=frame_filepath,
+                        params={**frame_grid['params'], 'seed': frame_grid['seed']},
+                        render=lambda: dotpoints_grid(
+                            filepath=frame_filepath, 
+                            frame_id=media['interpreted'][current_frame]['frame_id'], 
+                            points=frame_points)
+                        )
+                if RENDER_MODE == 'client' and not client_rendering:
+                    st.caption(
+                        'The media server is not reachable from this browser, the dotpoints are drawn by the server. '
+                        'Set `public_url` in the `[media_server]` section of `seams.toml`.')
+                if frame_grid['params'] != grid_params:
+                    st.caption('The frame has dotpoint annotations, its stored grid is kept.')
                 
             with vcol1:
 
-                if modified_image is not None:
+                if client_rendering:
+                    dotpoints_overlay(
+                        image_url=get_media_url(MEDIA_BASE_URL, 'frames', frame_filepath, directory=FRAMES_DIRPATH),
+                        width=frame_grid['width'],
+                        height=frame_grid['height'],
+                        points=frame_points,
+                        annotated_ids=media['interpreted'][current_frame].get('dotpoint_annotations', {}).keys(),
+                        component_height=interpretation_config.get('component_height', 720))
+                elif modified_image is not None:
                     st.image(
                         modified_image, 
                         use_column_width=True,
@@ -135,7 +250,7 @@ if frame_filepath:
                     with st.container():                    
                         selected_dotPoints = st.multiselect(
                             'dotPoint presence', 
-                            options= media['interpreted'].keys())
+                            options=list(range(1, len(frame_points) + 1)))
                           
                         
                         is_all = st.checkbox(
@@ -156,7 +271,12 @@ if frame_filepath:
                         shells = st.selectbox(label='SGU Limecola baltica shell', options={'no':0, 'förekommande':1, 'måttligt':2,'rikligt':3})
                         krypspar = st.selectbox(label='Krypspår', options={'no':0, 'förekommande':1, 'måttligt > 10%':2,'rikligt > 50%':3})
                         sandwave = st.number_input(label='Sandwave (cm)',min_value=-1.0, max_value=500.0, step=1.0, value=-1.0)
-                        frame_flags = st.multiselect(label = 'flags', options=['Dålig bildkvalitet', 'Dålig sikt/vattenkvalitet'])
+                        frame_flags = st.multiselect(
+                            label = 'flags', 
+                            options=[POOR_IMAGE_QUALITY, POOR_VISIBILITY],
+                            default=get_quality_flags(frame_metrics))
+                        if frame_metrics:
+                            st.caption(' | '.join(f'{k}: {v}' for k, v in frame_metrics.items()))
                         
                         fieldNotes = st.text_area(label='Interpretation Notes')
 
@@ -168,11 +288,15 @@ if frame_filepath:
                             'fieldNotes': fieldNotes
                             }
                     if submit_dotpoint:
+                        if is_all:
+                            selected_dotPoints = list(range(1, len(frame_points) + 1))
+                        interpreted_frame = media['interpreted'][current_frame]
+                        # dotpoint ids index the stored grid coordinates
+                        dotpoint_annotations = interpreted_frame.setdefault('dotpoint_annotations', {})
                         for p in selected_dotPoints:
-                            media['interpreted'][p]['taxons'] = taxons
-                            media['interpreted'][p]['substrates'] = substrates
-                            media['interpreted'][p]['overall_in_frame'] = overall_in_frame
-                            media['interpreted'][p]['status'] = 1
+                            dotpoint_annotations[p] = {'taxons': taxons, 'substrates': substrates}
+                        interpreted_frame['overall_in_frame'] = overall_in_frame
+                        interpreted_frame['status'] = 1
                         
                         ds_survey.store_data(data=ds_survey.storage_strategy.data)
 
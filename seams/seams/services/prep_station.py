@@ -1,8 +1,18 @@
 import os
+import pandas as pd
 import streamlit as st 
 from seams.bgs_tools import create_subdirectory
-from seams.video_tools import get_video_info, convert_codec, extract_frames, video_player, select_random_frames
+from seams.video_tools import is_url, video_player, plan_codec_conversion, get_converted_video_filename, \
+    get_candidate_frames, sample_frame_numbers, oversample_frame_numbers, SAMPLING_STRATEGIES, get_proxy_filepath, load_proxy_mapping, \
+    get_sprites_dirpath, load_sprites_index, get_keyframe_index
 from seams.datastorage import DataStore, YamlStorage
+from seams.batch_tools import run_batch_preprocessing, get_max_workers, get_video_filepath
+from seams.metadata_cache import VideoInfoCache
+from seams.jobs import JobQueue, start_workers, QUEUED, RUNNING, DONE, FAILED
+from seams.media_server import start_media_server, get_media_url, new_media_token
+from seams.media_cache import MediaCache, get_pinned_paths, drop_missing_converted_videos
+from seams.navigation import load_navigation_log, get_video_start_time, get_frame_times, join_frames_to_navigation, \
+    frames_navigation_to_dict, to_utc_timestamp
 
 
 # Globals
@@ -21,16 +31,268 @@ if 'SURVEY_FILEPATH' not in st.session_state:
 VIDEOS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'videos')
 PHOTOS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'photos')
 FRAMES_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'frames')
+PROXIES_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'proxies')
+SPRITES_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'sprites')
+NAVIGATION_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'navigation')
+OVERLAYS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'overlays')
+# byte ranges of the videos read from urls (e.g. an object store)
+REMOTE_CACHE_DIRPATH = st.session_state.get('remote_media', {}).get('cache_dirpath') or os.path.join(DATA_DIRPATH, 'survey', 'remote_cache')
+
+# Frames required per station and interval in seconds between candidate frames
+NUM_FRAMES = 10
+N_SECONDS = 5
 
 ds_survey = DataStore(YamlStorage(file_path=SURVEY_FILEPATH))
 
+# Video metadata persisted across sessions
+video_info_cache = VideoInfoCache(db_filepath=os.path.join(DATA_DIRPATH, 'video_info.sqlite'))
+
+# Background jobs for the long-running video work
+JOBS_FILEPATH = os.path.join(DATA_DIRPATH, 'jobs.sqlite')
+job_queue = JobQueue(db_filepath=JOBS_FILEPATH)
+start_workers(db_filepath=JOBS_FILEPATH, n_workers=st.session_state.get('jobs', {}).get('n_workers', 1))
+
+# Byte budget of the frames, proxies and converted videos
+media_cache = MediaCache(
+    db_filepath=os.path.join(DATA_DIRPATH, 'media_cache.sqlite'),
+    directories={
+        'frames': FRAMES_DIRPATH, 'proxies': PROXIES_DIRPATH, 'sprites': SPRITES_DIRPATH, 
+        'videos': VIDEOS_DIRPATH, 'remote': REMOTE_CACHE_DIRPATH, 'overlays': OVERLAYS_DIRPATH},
+    max_bytes=int(st.session_state.get('media_cache', {}).get('max_gb', 0) * 1024**3))
+
+# Videos streamed to the browser with HTTP range requests
+media_server_config = st.session_state.get('media_server', {})
+# media urls of the session, see `seams.media_server`
+if 'MEDIA_TOKEN' not in st.session_state:
+    st.session_state['MEDIA_TOKEN'] = new_media_token()
+MEDIA_BASE_URL = start_media_server(
+    directories={'videos': VIDEOS_DIRPATH, 'proxies': PROXIES_DIRPATH, 'sprites': SPRITES_DIRPATH},
+    host=media_server_config.get('host', '127.0.0.1'),
+    port=media_server_config.get('port', 8502),
+    public_url=media_server_config.get('public_url', ''),
+    token=st.session_state['MEDIA_TOKEN'])
+
+
+def get_conversion_options()->dict:
+    """`convert_codec` transcode options from the `[video]` section of `seams.toml`."""
+    video_config = st.session_state.get('video', {})
+    return {k: video_config[k] for k in ('preset', 'crf', 'threads') if k in video_config}
+
+
+def get_frame_options()->dict:
+    """Image `image_format`, `quality` and `skip_low_quality` of the extracted frames from the `[frames]` section of `seams.toml`, 
+    the `decoder_backend` from the `[video]` section and the chunk cache of the videos read from urls."""
+    frames_config = st.session_state.get('frames', {})
+    frame_options = {k: frames_config[k] for k in ('image_format', 'quality', 'skip_low_quality') if k in frames_config}
+    if 'decoder_backend' in st.session_state.get('video', {}):
+        frame_options['decoder_backend'] = st.session_state['video']['decoder_backend']
+    frame_options['remote_cache_dirpath'] = REMOTE_CACHE_DIRPATH
+    return frame_options
+
+
+def get_deduplication_options()->dict:
+    """`min_hamming_distance` of the near duplicate rejection and the `oversample` of its candidate frames 
+    from the `[frames]` section of `seams.toml`."""
+    frames_config = st.session_state.get('frames', {})
+    return {k: frames_config[k] for k in ('min_hamming_distance', 'oversample') if k in frames_config}
+
+
+def get_proxy_options()->dict:
+    """`generate_proxy` options from the `[proxy]` section of `seams.toml`."""
+    proxy_config = st.session_state.get('proxy', {})
+    return {k: proxy_config[k] for k in ('height', 'gop_seconds', 'crf', 'preset') if k in proxy_config}
+
+
+def enforce_media_cache_budget(*current_paths:str)->dict:
+    """Evicts the least recently used derived media over the `[media_cache]` budget.
+
+    The selected and interpreted frames of every station and the media in `current_paths` are kept.
+    """
+    data = ds_survey.storage_strategy.data
+    pinned = get_pinned_paths(data) | {os.path.realpath(path) for path in current_paths if path}
+    report = media_cache.enforce_budget(pinned=pinned)
+    if report['evicted'] and drop_missing_converted_videos(survey_data=data, videos_dirpath=VIDEOS_DIRPATH):
+        ds_survey.store_data(data=data)
+    return report
+
+
+def store_selected_frames(surveyID:str, station:str, frames:dict, video_filepath:str)->dict:
+    """Stores the selected frames of the station, the frames no longer selected can be evicted.
+
+    Returns:
+        dict: the selected frames.
+    """
+    data = ds_survey.storage_strategy.data
+    data['surveys'][surveyID]['stations'][station]['media']['frames'] = frames
+    data['current_frames'] = frames
+    ds_survey.store_data(data=data)
+    media_cache.touch(*frames.values())
+    enforce_media_cache_budget(video_filepath)
+    return frames
+
+
+def show_media_cache():
+    """Disk usage of the derived media and eviction on demand."""
+    with st.expander(label='**media cache**', expanded=False):
+        usage = media_cache.usage()
+        total_bytes = sum(u['bytes'] for u in usage.values())
+        budget = f'{media_cache.max_bytes / 1024**3:.1f} GB' if media_cache.max_bytes else 'no budget'
+        st.caption(f'{total_bytes / 1024**3:.2f} GB used | {budget}')
+        st.write({kind: f'{u["artifacts"]} files | {u["bytes"] / 1024**2:.1f} MB' for kind, u in usage.items()})
+        if st.button(label='free space now', disabled=not media_cache.max_bytes):
+            report = enforce_media_cache_budget()
+            st.success(f'{len(report["evicted"])} files evicted, {report["freed_bytes"] / 1024**2:.1f} MB freed')
+
+
+def show_job(job_id:int, label:str)->dict:
+    """Shows the status and progress of a background job, with buttons to refresh or cancel it.
+
+    Returns:
+        dict: the job, `None` if it does not exist
+    """
+    job = job_queue.status(job_id)
+    if job is None:
+        return None
+
+    st.progress(job['progress'])
+    st.caption(f'{label} | job {job_id}: **{job["status"]}** {job["message"] or ""}')
+    if job['status'] in (QUEUED, RUNNING):
+        refresh_col, cancel_col = st.columns(2)
+        with refresh_col:
+            if st.button(label='refresh', key=f'refresh_job_{job_id}'):
+                st.experimental_rerun()
+        with cancel_col:
+            if st.button(label='cancel', key=f'cancel_job_{job_id}'):
+                job_queue.cancel(job_id)
+                st.experimental_rerun()
+    elif job['status'] == FAILED:
+        st.error(f'{label} failed: {job["error"]}')
+    return job
+
+
+def show_video_job(video_jobs:dict, task:str, label:str)->dict:
+    """Shows the background job `task` of a video, the job is forgotten once it is finished.
+
+    Returns:
+        dict: the job, `None` if it does not exist
+    """
+    job = show_job(job_id=video_jobs[task], label=label)
+    if job is None or job['status'] not in (QUEUED, RUNNING):
+        video_jobs.pop(task)
+        ds_survey.store_data(data=ds_survey.storage_strategy.data)
+    return job
+
+
+def show_batch_preprocessing(surveyID:str):
+    """Batch preprocessing of every station video of the survey across a process pool.
+    """
+    max_workers = st.session_state.get('preprocessing', {}).get('max_workers')
 
-def load_video(filepath:str):
-    assert os.path.isfile(filepath)
+    with st.expander(label='**batch preprocessing**', expanded=False):
+        with st.form(key='batch_preprocessing_form', clear_on_submit=False):
+            convert = st.checkbox(label='convert videos to H.264 mp4 when required (remux when possible)', value=False)
+            sampling_strategy = st.selectbox(
+                label='**sampling strategy**',
+                options=SAMPLING_STRATEGIES)
+            submit_batch = st.form_submit_button(
+                label=f'preprocess all stations ({get_max_workers(max_workers)} workers)')
+
+        if submit_batch:
+            progress_bar = st.progress(0)
+            progress_text = st.empty()
+
+            def progress_callback(n_done:int, n_total:int, result:dict):
+                progress_bar.progress(n_done / n_total)
+                status = f'error: {result["error"]}' if result['error'] else f'{len(result["frames"])} frames'
+                progress_text.write(f'{n_done}/{n_total} | station: {result["station"]} | video: {result["video_name"]} | {status}')
+
+            results = run_batch_preprocessing(
+                ds_survey=ds_survey,
+                surveyID=surveyID,
+                videos_dirpath=VIDEOS_DIRPATH,
+                frames_dirpath=FRAMES_DIRPATH,
+                convert=convert,
+                conversion_options=get_conversion_options(),
+                num_frames=NUM_FRAMES,
+                n_seconds=N_SECONDS,
+                strategy=sampling_strategy,
+                seed=0,
+                max_workers=max_workers,
+                **get_frame_options(),
+                **get_deduplication_options(),
+                progress_callback=progress_callback)
+
+            errors = [r for r in results if r['error']]
+            if errors:
+                st.warning(f'{len(errors)} of {len(results)} videos failed')
+                st.write({f'{r["station"]} | {r["video_name"]}': r['error'] for r in errors})
+            else:
+                st.success(f'{len(results)} videos preprocessed')
+
+
+def show_navigation_sync(media:dict, video_name:str, video_filepath:str, video_info:dict)->dict:
+    """Joins the selected frames of the video to the nearest fix of its navigation log.
+
+    The uploaded log is kept in `NAVIGATION_DIRPATH` and the frame positions in `media['navigation'][video_name]`.
+
+    Returns:
+        dict: frame number as key and position as value, see `navigation.frames_navigation_to_dict`.
+    """
+    video_navigation = (media.get('navigation') or {}).get(video_name) or {}
+    with st.expander(label='**navigation log**', expanded=False):
+        navigation_file = st.file_uploader(
+            label='**navigation file** (timestamp, latitude, longitude, depth)', 
+            type=['csv', 'tsv', 'txt'], 
+            key=f'navigation_file_{video_name}')
+        start_time = video_navigation.get('start_time')
+        if start_time is None:
+            creation_time = get_video_start_time(video_filepath)
+            start_time = creation_time.isoformat() if creation_time is not None else ''
+        start_time = st.text_input(label='**video start time** (UTC, ISO 8601)', value=start_time, key=f'navigation_start_{video_name}')
+        tolerance_seconds = st.number_input(
+            label='**maximum seconds to the nearest fix**', min_value=0.0, value=10.0, step=1.0, key=f'navigation_tolerance_{video_name}')
+
+        navigation_filepath = video_navigation.get('navigation_file')
+        if st.button(label='sync frames with navigation', disabled=not media.get('frames') or not start_time, key=f'navigation_btn_{video_name}'):
+            if navigation_file is not None:
+                os.makedirs(NAVIGATION_DIRPATH, exist_ok=True)
+                navigation_filepath = os.path.join(NAVIGATION_DIRPATH, f'{os.path.splitext(video_name)[0]}.csv')
+                with open(navigation_filepath, 'wb') as f:
+                    f.write(navigation_file.getbuffer())
+            if navigation_filepath is None or not os.path.isfile(navigation_filepath):
+                st.warning('Upload the navigation file of the video')
+            else:
+                try:
+                    with st.spinner('joining frames to the navigation log'):
+                        navigation = load_navigation_log(navigation_filepath)
+                        frame_numbers = sorted(media['frames'])
+                        # exact frame times from the index of the extraction if there is one
+                        index_filepath = os.path.join(FRAMES_DIRPATH, video_name, 'keyframe_index.json')
+                        pts_time = None
+                        if os.path.isfile(video_filepath) and os.path.isfile(index_filepath):
+                            pts_time = get_keyframe_index(video_path=video_filepath, index_filepath=index_filepath)['pts_time']
+                        frames_navigation = join_frames_to_navigation(
+                            frame_numbers=frame_numbers,
+                            frame_times=get_frame_times(frame_numbers, fps=video_info['fps'], pts_time=pts_time),
+                            start_time=to_utc_timestamp(start_time),
+                            navigation=navigation,
+                            tolerance_seconds=tolerance_seconds)
+                except (ValueError, OSError) as e:
+                    st.error(f'Error occurred while joining the navigation log: {e}')
+                else:
+                    video_navigation = {
+                        'navigation_file': navigation_filepath,
+                        'start_time': start_time,
+                        'frames': frames_navigation_to_dict(frames_navigation)
+                        }
+                    media.setdefault('navigation', {})[video_name] = video_navigation
+                    ds_survey.store_data(data=ds_survey.storage_strategy.data)
+                    st.success(f'{len(video_navigation["frames"])} of {len(frame_numbers)} frames positioned')
+
+        if video_navigation.get('frames'):
+            st.dataframe(pd.DataFrame.from_dict(video_navigation['frames'], orient='index'))
+    return video_navigation.get('frames') or {}
 
-    video_file = open(filepath, 'rb')
-    video_bytes = video_file.read()
-    return video_bytes
 
 def main():
 
@@ -65,113 +327,260 @@ def main():
                 st.session_state['current_video'] = _current_video
                 #
                 video_name = os.path.basename(media['video'][current_video])
-                
-                video_filepath = os.path.join(VIDEOS_DIRPATH, video_name)
+                # videos on an HTTP(S) server are read in place with range requests
+                video_filepath = get_video_filepath(media['video'][current_video], VIDEOS_DIRPATH)
+                video_is_url = is_url(video_filepath)
                 
 
-                video_info =  get_video_info(video_path=video_filepath)
+                video_info =  video_info_cache.get_video_info(video_path=video_filepath)
+                media_cache.touch(video_filepath)
+                video_jobs = media.setdefault('jobs', {}).setdefault(video_name, {})
                 with st.expander(label='**video info**', expanded=False):
                     if video_info:
                         st.write(video_info)
-                        _vcodec = video_info['codec']
-                        if _vcodec != "avc1":
+                        conversion_method = 'none' if video_is_url else \
+                            video_info.get('conversion_method') or plan_codec_conversion(video_path=video_filepath)
+                        if conversion_method != 'none':
                             with st.form(
                                 key='convert_video_form',
                                 clear_on_submit=True):
                                 convert_video_codec_btn = st.form_submit_button(
-                                    label='convert to video codec H.264',
+                                    label=f'convert to video codec H.264 ({conversion_method})',
                                     )
                                 
                                 if convert_video_codec_btn:
-                                    with st.spinner():
-                                        converted_video_filename = 'SEAMS__{video_name}'
-                                        converted_video_filepath = os.path.join(VIDEOS_DIRPATH, converted_video_filename )
-                                        video_conversion_done = convert_codec(
-                                            input_file=video_filepath,
-                                            output_file=converted_video_filepath
-                                            )
-                                        
-                                        
-                                        if video_conversion_done:
-                                            # TODO: ensure properly error handling
-                                            converted_video = {converted_video_filename: converted_video_filepath}
-                                            st.success(f'Video codec conversion successful. Output file: {converted_video_filepath}')
-                                            data['surveys'][surveyID]['stations'][current_station]['media']['video'][converted_video_filename] = converted_video_filepath
-                                            data['current_video'] = converted_video
-                                            st.session_state['current_video'] = converted_video
-                                            video_filepath = converted_video_filepath
-                                            video_name = converted_video_filename
-                                            _current_video = converted_video
-
-                                            ds_survey.store_data(data=data)
+                                    converted_video_filename = get_converted_video_filename(video_name)
+                                    converted_video_filepath = os.path.join(VIDEOS_DIRPATH, converted_video_filename )
+                                    video_jobs['convert_codec'] = job_queue.submit(
+                                        task='convert_codec',
+                                        params={
+                                            'input_file': video_filepath,
+                                            'output_file': converted_video_filepath,
+                                            'method': conversion_method,
+                                            **get_conversion_options()
+                                            })
+                                    ds_survey.store_data(data=data)
+
+                            if 'convert_codec' in video_jobs:
+                                job = show_job(job_id=video_jobs['convert_codec'], label='video codec conversion')
+                                if job is not None and job['status'] == DONE:
+                                    converted_video_filepath = job['result']['output_file']
+                                    converted_video_filename = os.path.basename(converted_video_filepath)
+                                    st.success(f'Video codec conversion successful. Output file: {converted_video_filepath}')
+                                    data['surveys'][surveyID]['stations'][current_station]['media']['video'][converted_video_filename] = converted_video_filepath
+                                    video_jobs.pop('convert_codec')
+                                    ds_survey.store_data(data=data)
+                                    media_cache.touch(converted_video_filepath)
+                                    enforce_media_cache_budget(video_filepath, converted_video_filepath)
                         else:
                             ds_survey.store_data(data=data)               
-                with st.form(key='extract_frames_form', clear_on_submit=True):
+                with st.form(key='extract_frames_form', clear_on_submit=False):
 
-                    if video_info:                            
-                        submit_extract = st.form_submit_button('extract video frames every 5 sec')
+                    if video_info:
+                        sampling_strategy = st.selectbox(
+                            label='**sampling strategy**',
+                            options=SAMPLING_STRATEGIES)
+                        sampling_seed = st.number_input(
+                            label='**sampling seed**', 
+                            min_value=0, 
+                            value=0, 
+                            step=1)
+                        submit_extract = st.form_submit_button(f'extract {NUM_FRAMES} sampled video frames')
                         if submit_extract:
                             current_video_frames_dirpath = create_subdirectory(FRAMES_DIRPATH, video_name)
                             current_video_frames = {video_name: current_video_frames_dirpath}
+                            # choose the frames up front and extract only those
+                            frame_numbers = sample_frame_numbers(
+                                total_frames=video_info['frame_count'],
+                                fps=video_info['fps'],
+                                num_frames=NUM_FRAMES,
+                                strategy=sampling_strategy,
+                                n_seconds=N_SECONDS,
+                                seed=int(sampling_seed))
+                            deduplication_options = get_deduplication_options()
+                            min_hamming_distance = deduplication_options.get('min_hamming_distance', 0)
+                            if min_hamming_distance:
+                                # extra candidates replace the near duplicate frames
+                                frame_numbers = oversample_frame_numbers(
+                                    frame_numbers=frame_numbers,
+                                    total_frames=video_info['frame_count'],
+                                    fps=video_info['fps'],
+                                    n_seconds=N_SECONDS,
+                                    oversample=deduplication_options.get('oversample', 3),
+                                    seed=int(sampling_seed))
                             
-                            with st.spinner():
-                                    
-                                frames = extract_frames(
-                                    video_filepath=video_filepath, 
-                                    frames_dirpath= current_video_frames_dirpath)
-                                
-                            
-                                ds_survey.storage_strategy.data['current_video_frames'] = current_video_frames
-                                ds_survey.store_data(ds_survey.storage_strategy.data)
-
-                            st.success('frames available in: {}'.format(current_video_frames_dirpath))
-
-                            if frames:
-                                # TODO: deleted all the non random selected frames
-                                random_frames = select_random_frames(
-                                    frames=frames, 
-                                    num_frames=10)
-                                
-                                if random_frames:
-                                    
-                                    ds_survey.store_data(data=ds_survey.storage_strategy.data)
-
-                                    key_frames = st.multiselect(
-                                        label = '**selected random frames:**',
-                                        options= frames,
-                                        default= random_frames
-                                        )
-                                    
-                                    if len(key_frames) < 10:
-                                        st.warning('Less than 10 frames selected. Requirement is 10 frames')
-                                    elif len(key_frames) > 10:
-                                        st.warning('More than 10 frames selected. Requirement is 10 frames')
-                                    else:
-                                        random_frames = key_frames
-
-                                    #TODO: ensure that requirement of 10 frames
-                                    current_frames = {k: frames[k] for k in key_frames }
-                                    ds_survey.storage_strategy.data['surveys'][surveyID]['stations'][current_station]['media']['frames'] = current_frames
-                                    ds_survey.storage_strategy.data['current_frames'] = current_frames
-                                    # saving
-                                    ds_survey.store_data(data=ds_survey.storage_strategy.data)
+                            video_jobs['extract_frames'] = job_queue.submit(
+                                task='extract_frames',
+                                params={
+                                    'video_filepath': video_filepath,
+                                    'frames_dirpath': current_video_frames_dirpath,
+                                    'frame_numbers': frame_numbers,
+                                    'num_frames': NUM_FRAMES,
+                                    'min_hamming_distance': min_hamming_distance,
+                                    **get_frame_options()
+                                    })
+                            ds_survey.storage_strategy.data['current_video_frames'] = current_video_frames
+                            ds_survey.store_data(ds_survey.storage_strategy.data)
                     else:
                         st.warning('Error: no video found in the')
 
-                        
-                        
+                if 'extract_frames' in video_jobs:
+                    job = show_job(job_id=video_jobs['extract_frames'], label='frames extraction')
+                    if job is not None and job['status'] == DONE:
+                        frames = {int(k): v for k, v in job['result']['frames'].items()}
+                        if frames:
+                            ds_survey.storage_strategy.data['surveys'][surveyID]['stations'][current_station]['media']['frames'] = frames
+                            ds_survey.storage_strategy.data['current_frames'] = frames
+                        video_jobs.pop('extract_frames')
+                        ds_survey.store_data(ds_survey.storage_strategy.data)
+                        media_cache.touch(*frames.values())
+                        enforce_media_cache_budget(video_filepath)
+                        st.success('frames available in: {}'.format(os.path.dirname(next(iter(frames.values()), ''))))
+                        if len(frames) < NUM_FRAMES:
+                            st.warning(f'Only {len(frames)} usable frames extracted, select the missing frames below. Requirement is {NUM_FRAMES} frames')
+
+                if video_info and media.get('frames'):
+                    frames = media['frames']
+                    # selection of the annotator kept across the reruns while the replacement frames are extracted
+                    key_frames_key = f'key_frames_{surveyID}_{current_station}_{video_name}'
+
+                    if 'extract_replacement_frames' in video_jobs:
+                        replacement_job = show_video_job(
+                            video_jobs=video_jobs, task='extract_replacement_frames', label='replacement frames extraction')
+                        if replacement_job is not None and replacement_job['status'] == DONE:
+                            frames.update({int(k): v for k, v in replacement_job['result']['frames'].items()})
+                            # the selection submitted with the job
+                            replacement_key_frames = video_jobs.get('replacement_key_frames') or sorted(frames)
+                            not_extracted = [k for k in replacement_key_frames if k not in frames]
+                            if not_extracted:
+                                st.warning(f'Frames {not_extracted} could not be extracted from {video_filepath}')
+                            frames = store_selected_frames(
+                                surveyID=surveyID, 
+                                station=current_station, 
+                                frames={k: frames[k] for k in replacement_key_frames if k in frames}, 
+                                video_filepath=video_filepath)
+                            st.session_state[key_frames_key] = sorted(frames)
+                        if replacement_job is None or replacement_job['status'] not in (QUEUED, RUNNING):
+                            video_jobs.pop('replacement_key_frames', None)
+                            ds_survey.store_data(data=ds_survey.storage_strategy.data)
+
+                    candidate_frames = get_candidate_frames(
+                        total_frames=video_info['frame_count'], 
+                        fps=video_info['fps'], 
+                        n_seconds=N_SECONDS)
+                    if key_frames_key not in st.session_state:
+                        st.session_state[key_frames_key] = sorted(frames)
+
+                    key_frames = st.multiselect(
+                        label = '**selected frames:**',
+                        options= sorted(set(candidate_frames) | set(frames) | set(st.session_state[key_frames_key])),
+                        key=key_frames_key,
+                        format_func=lambda i: f'{i} ({i / video_info["fps"]:.1f} s)'
+                        )
+                    
+                    if len(key_frames) < NUM_FRAMES:
+                        st.warning(f'Less than {NUM_FRAMES} frames selected. Requirement is {NUM_FRAMES} frames')
+                    elif len(key_frames) > NUM_FRAMES:
+                        st.warning(f'More than {NUM_FRAMES} frames selected. Requirement is {NUM_FRAMES} frames')
+
+                    if set(key_frames) != set(frames) and 'extract_replacement_frames' not in video_jobs:
+                        missing_frames = [k for k in key_frames if k not in frames]
+                        if missing_frames:
+                            # extract the replacement frames in the background, the selection is stored once they are done
+                            video_jobs['extract_replacement_frames'] = job_queue.submit(
+                                task='extract_frames',
+                                params={
+                                    'video_filepath': video_filepath,
+                                    'frames_dirpath': create_subdirectory(FRAMES_DIRPATH, video_name),
+                                    'frame_numbers': missing_frames,
+                                    **get_frame_options()
+                                    })
+                            video_jobs['replacement_key_frames'] = list(key_frames)
+                            ds_survey.store_data(data=ds_survey.storage_strategy.data)
+                            st.info('extracting the replacement frames in the background')
+                        else:
+                            store_selected_frames(
+                                surveyID=surveyID, 
+                                station=current_station, 
+                                frames={k: frames[k] for k in key_frames}, 
+                                video_filepath=video_filepath)
+
+                if video_info:
+                    show_navigation_sync(media=media, video_name=video_name, video_filepath=video_filepath, video_info=video_info)
+
+                with st.expander(label='**video player**', expanded=False):
+                    # the browser plays a low bitrate proxy, frame numbers map back to the original video
+                    proxy_filepath = get_proxy_filepath(video_path=video_filepath, proxies_dirpath=PROXIES_DIRPATH)
+                    proxy_mapping = load_proxy_mapping(proxy_path=proxy_filepath)
+                    video_sprites_dirpath = get_sprites_dirpath(video_path=video_filepath, sprites_dirpath=SPRITES_DIRPATH)
+                    sprites_index = load_sprites_index(sprites_dirpath=video_sprites_dirpath)
+                    if MEDIA_BASE_URL is None:
+                        st.error('The media server is not running, check the `[media_server]` section of `seams.toml`')
+                    elif video_info:
+                        if proxy_mapping is not None:
+                            media_cache.touch(proxy_filepath)
+                            video_url = get_media_url(MEDIA_BASE_URL, 'proxies', proxy_filepath)
+                        elif video_is_url:
+                            video_url = video_filepath
+                        else:
+                            video_url = get_media_url(MEDIA_BASE_URL, 'videos', video_filepath)
+                        sprites_url = None
+                        if sprites_index is not None:
+                            media_cache.touch(os.path.join(video_sprites_dirpath, 'sprites.json'))
+                            sprites_url = get_media_url(MEDIA_BASE_URL, 'sprites', video_sprites_dirpath, directory=SPRITES_DIRPATH)
+                        video_player(
+                            video_url=video_url,
+                            duration=video_info['frame_count'] / video_info['fps'],
+                            fps=video_info['fps'],
+                            marker_frame_positions=list(media.get('frames') or []),
+                            sprites_index=sprites_index,
+                            sprites_url=sprites_url)
+                        if proxy_mapping is not None:
+                            st.caption('proxy {}x{} of the original {}x{} video'.format(
+                                *proxy_mapping['proxy_size'], *proxy_mapping['source_size']))
+
+                    proxy_col, sprites_col = st.columns(2)
+                    with proxy_col:
+                        if proxy_mapping is None and 'generate_proxy' not in video_jobs:
+                            if st.button(label='create proxy for browser playback', key='generate_proxy_btn'):
+                                os.makedirs(PROXIES_DIRPATH, exist_ok=True)
+                                video_jobs['generate_proxy'] = job_queue.submit(
+                                    task='generate_proxy',
+                                    params={
+                                        'video_path': video_filepath,
+                                        'output_file': proxy_filepath,
+                                        **get_proxy_options()
+                                        })
+                                ds_survey.store_data(data=data)
+                                st.experimental_rerun()
+                    with sprites_col:
+                        if sprites_index is None and 'generate_sprites' not in video_jobs:
+                            if st.button(label='create timeline previews', key='generate_sprites_btn'):
+                                video_jobs['generate_sprites'] = job_queue.submit(
+                                    task='generate_sprites',
+                                    params={
+                                        'video_path': video_filepath,
+                                        'output_dir': video_sprites_dirpath
+                                        })
+                                ds_survey.store_data(data=data)
+                                st.experimental_rerun()
+
+                    for task, label in (('generate_proxy', 'proxy generation'), ('generate_sprites', 'timeline previews')):
+                        if task in video_jobs:
+                            job = show_video_job(video_jobs=video_jobs, task=task, label=label)
+                            if job is not None and job['status'] == DONE:
+                                enforce_media_cache_budget(video_filepath, proxy_filepath)
+                                st.experimental_rerun()
+
         with col2:
             with st.expander(label='**show station data**', expanded=False):
                 station = data['surveys'][surveyID]['stations'][current_station]
                 st.write(station)
         
 
-    #TODO: show videoplayer here    
-    #if _vcodec == "avc1":
+    show_batch_preprocessing(surveyID=surveyID)
+    show_media_cache()
 
-    #    with st.expander(label='**video player**'):
-    #        pass
-    
     show_data_expander = st.expander(label='**show data**', expanded=False)
     with show_data_expander:
         st.write(ds_survey.storage_strategy.data)
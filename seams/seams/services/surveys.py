@@ -3,6 +3,8 @@ import streamlit as st
 import re
 from seams.datastorage import DataStore, YamlStorage
 from seams.bgs_tools import get_h3_geohash, reproject_coordinates
+from seams.batch_tools import probe_survey_videos
+from seams.metadata_cache import VideoInfoCache
 from typing import Dict, List, Any, Callable
 from itertools import count
 from dataclasses import dataclass, field
@@ -22,8 +24,12 @@ SURVEY_FILEPATH = os.path.join(DATA_DIRPATH, 'survey.yaml')
 if 'SURVEY_FILEPATH' not in st.session_state:
     st.session_state['SURVEY_FILEPATH'] = SURVEY_FILEPATH
 
+#
+VIDEOS_DIRPATH = os.path.join(DATA_DIRPATH, 'survey', 'videos')
+
 #
 ds_survey = DataStore(YamlStorage(file_path=SURVEY_FILEPATH))
+video_info_cache = VideoInfoCache(db_filepath=os.path.join(DATA_DIRPATH, 'video_info.sqlite'))
 
 
 def show_new_user_form(ds_users:DataStore):
@@ -268,6 +274,18 @@ def show_surveyForm(
                             
                             # save to datastore
                             ds_survey.store_data(data=ds_survey.storage_strategy.data)
+
+                            # probe every referenced video up front
+                            with st.spinner('Probing videos ...'):
+                                video_probes = probe_survey_videos(
+                                    videos_dict=videos_dict,
+                                    videos_dirpath=VIDEOS_DIRPATH,
+                                    video_info_cache=video_info_cache,
+                                    max_workers=st.session_state.get('preprocessing', {}).get('max_workers'))
+                            for s, probes in video_probes.items():
+                                ds_survey.storage_strategy.data['surveys'][surveyID]['stations'][s]['media']['video_probe'] = probes
+                            ds_survey.store_data(data=ds_survey.storage_strategy.data)
+                            show_video_probes(video_probes=video_probes)
                             
 
 
@@ -306,6 +324,27 @@ def show_surveyForm(
                 else:
                     st.error("All fields are required.")
                 
+def show_video_probes(video_probes:dict):
+    """Shows the probe of every survey video and flags the missing and unreadable ones."""
+    probes_df = pd.DataFrame([
+        {'station': station, 'video': video_name, **probe}
+        for station, probes in video_probes.items()
+        for video_name, probe in probes.items()])
+    if probes_df.empty:
+        return
+
+    missing_df = probes_df[~probes_df['exists']]
+    unreadable_df = probes_df[probes_df['exists'] & ~probes_df['readable']]
+    if not missing_df.empty:
+        st.error(f'**{len(missing_df)} missing videos:** {", ".join(missing_df["video"])}')
+    if not unreadable_df.empty:
+        st.warning(f'**{len(unreadable_df)} unreadable videos:** {", ".join(unreadable_df["video"])}')
+    if missing_df.empty and unreadable_df.empty:
+        st.success(f'{len(probes_df)} videos found and readable')
+
+    st.dataframe(probes_df[['station', 'video', 'exists', 'readable', 'codec', 'duration', 'error']])
+
+
 def has_all_required_columns(
     file_columns:list, 
     required_colnames: list):
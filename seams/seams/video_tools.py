@@ -1,11 +1,21 @@
 import os
+import json
+import bisect
 import random
 import cv2
+import numpy as np
+import shutil
 import subprocess 
-import tempfile
+from typing import Callable
+from PIL import Image
 from urllib.parse import urlparse
-from urllib.request import urlopen
+from urllib.request import urlopen, Request
 import streamlit as st
+import streamlit.components.v1 as components
+from seams.frame_manifest import load_frame_manifest, update_frame_manifest, get_valid_frames
+from seams.frame_quality import ANALYSIS_WIDTH, compute_frame_quality, compute_frame_quality_from_file, is_usable_frame
+from seams.frame_hashes import get_frame_hashes, select_distinct_frames
+from seams.jobs import is_pid_alive
 
 
 def is_url(url:str):
@@ -26,6 +36,13 @@ def is_url(url:str):
         return False
 
 
+def get_url_headers(url:str, timeout:float = 30)->dict:
+    """Headers of an url from a `HEAD` request, the content is not downloaded.
+    """
+    with urlopen(Request(url, method='HEAD'), timeout=timeout) as response:
+        return dict(response.headers.items())
+
+
 def get_video_info(video_path: str):
     """This function takes the path (or url) of a video and returns a dictionary with fps and duration information
 
@@ -53,7 +70,7 @@ def get_video_info(video_path: str):
     fps = cap.get(cv2.CAP_PROP_FPS)
 
     # prevent issues with missing videos
-    if int(frame_count)|int(fps) == 0:
+    if frame_count <= 0 or fps <= 0:
         raise ValueError(
             f"{video_path} doesn't have any frames, check the path/link is correct."
         )
@@ -62,6 +79,9 @@ def get_video_info(video_path: str):
 
     duration_mins = duration / 60
 
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
     ##### Check codec info ########
     h = int(cap.get(cv2.CAP_PROP_FOURCC))
     codec = (
@@ -70,6 +90,9 @@ def get_video_info(video_path: str):
         + chr((h >> 16) & 0xFF)
         + chr((h >> 24) & 0xFF)
     )
+    # Check that the first frame can be decoded
+    readable, _ = cap.read()
+    cap.release()
   
     # Check if the video is accessible locally
     if os.path.exists(video_path):
@@ -79,7 +102,7 @@ def get_video_info(video_path: str):
     # Check if the path to the video is a url
     elif is_url(video_path):
         # Store the size of the video
-        size = urlopen(video_path).length
+        size = int(get_url_headers(video_path).get('Content-Length', 0))
 
     # Calculate the size:duration ratio
     sizeGB = size / (1024 * 1024 * 1024)
@@ -94,65 +117,676 @@ def get_video_info(video_path: str):
         'sizeGB': sizeGB,
         'size_duration': size_duration,
         'codec': codec,
+        'width': width,
+        'height': height,
+        'readable': bool(readable),
         'video_name': os.path.basename(video_path),
         'video_path': video_path 
         }
 
 
-def extract_frames_every_n_seconds(video_path:str, output_dir:str, n_seconds:int, total_frames:int, fps:float, prefix: str= 'frame')->dict:
+def extract_frames_every_n_seconds(
+    video_path:str, 
+    output_dir:str, 
+    n_seconds:int, 
+    total_frames:int, 
+    fps:float, 
+    prefix: str= 'frame',
+    mode: str = 'single_pass',
+    image_format: str = 'png',
+    quality: int = 90,
+    start_frame: int = 0,
+    checkpoint_callback: Callable = None)->dict:
     """ Extracts video frames every `n_seconds` and save them in `output_dir` temporary directory.
 
     Args:
-        video_path (str): _description_
-        output_dir (str): _description_
-        n_seconds (int): _description_
-        total_frames (int): _description_
-        fps (float): _description_
-        prefix (str, optional): _description_. Defaults to 'frame'.
+        video_path (str): path to the video file.
+        output_dir (str): directory where the frames are saved.
+        n_seconds (int): sampling interval in seconds.
+        total_frames (int): number of frames in the video.
+        fps (float): frames per second of the video.
+        prefix (str, optional): prefix of the frame filenames. Defaults to 'frame'.
+        mode (str, optional): `single_pass` decodes the video once and writes every sampled frame in that pass, 
+            `per_frame` starts one `ffmpeg` process per sampled frame. Defaults to 'single_pass'.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        start_frame (int, optional): first sampled frame to extract, to resume an interrupted extraction. Defaults to 0.
+        checkpoint_callback (Callable, optional): called with the dict of frames written so far, 
+            while the extraction runs. Defaults to None.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    if mode == 'single_pass':
+        return extract_frames_single_pass(
+            video_path=video_path, output_dir=output_dir, n_seconds=n_seconds, 
+            total_frames=total_frames, fps=fps, prefix=prefix, image_format=image_format, quality=quality,
+            start_frame=start_frame, checkpoint_callback=checkpoint_callback)
+    elif mode == 'per_frame':
+        return extract_frames_per_frame(
+            video_path=video_path, output_dir=output_dir, n_seconds=n_seconds, 
+            total_frames=total_frames, fps=fps, prefix=prefix, image_format=image_format, quality=quality,
+            start_frame=start_frame, checkpoint_callback=checkpoint_callback)
+    else:
+        raise ValueError(f'Unknown frame extraction mode `{mode}`. Use `single_pass` or `per_frame`')
+
+
+def get_frame_step(n_seconds:float, fps:float)->int:
+    """Number of frames between two samples taken every `n_seconds`. Never less than 1.
+    """
+    return max(1, int(n_seconds*fps))
+
+
+def get_sampled_frame_numbers(n_seconds:float, total_frames:int, fps:float, start_frame:int = 0)->list:
+    """Frame numbers sampled every `n_seconds`, from the first sample at or after `start_frame`."""
+    step = get_frame_step(n_seconds=n_seconds, fps=fps)
+    return list(range(-(-start_frame // step) * step, total_frames, step))
+
+
+def get_seek_time(pts_time:list, frame_number:int)->float:
+    """Input seek (`-ss`) time to decode from `frame_number`.
+
+    Half a frame before the frame, `ffmpeg` drops every frame presented before that time, 
+    so the first decoded frame is `frame_number`.
+    """
+    frame_duration = pts_time[frame_number] - pts_time[frame_number - 1] if frame_number > 0 else 0
+    return max(0.0, pts_time[frame_number] - pts_time[0] - frame_duration / 2)
+
+
+def get_partial_dirpath(output_dir:str, prefix:str)->str:
+    """Scratch directory where `ffmpeg` writes the frames before they get their final name.
+
+    The name is deterministic per process, leftovers of a process that died are removed 
+    by `remove_stale_partial_dirs`.
+    """
+    partial_dirpath = os.path.join(output_dir, f'.partial_{prefix}_{os.getpid()}')
+    shutil.rmtree(partial_dirpath, ignore_errors=True)
+    os.makedirs(partial_dirpath)
+    return partial_dirpath
+
+
+def remove_stale_partial_dirs(output_dir:str):
+    """Removes the scratch directories left in `output_dir` by extractions that were killed."""
+    if not os.path.isdir(output_dir):
+        return
+    for dirname in os.listdir(output_dir):
+        if dirname.startswith('.partial_'):
+            pid = dirname.rsplit('_', 1)[-1]
+            if pid.isdigit() and not is_pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(output_dir, dirname), ignore_errors=True)
+
+
+def collect_partial_frames(partial_dirpath:str, output_dir:str, frame_numbers:list, prefix:str, extension:str, completed:bool)->dict:
+    """Moves the images written by `ffmpeg` in `partial_dirpath` to their final name in `output_dir`.
+
+    The n-th image written by `ffmpeg` corresponds to the n-th of the `frame_numbers`. While `ffmpeg` 
+    runs (`completed` False) the last image may still be written and is left in place.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the moved frames.
+    """
+    frames = {}
+    filenames = sorted(f for f in os.listdir(partial_dirpath) if f.endswith(f'.{extension}'))
+    if not completed:
+        filenames = filenames[:-1]
+    for filename in filenames:
+        n = int(os.path.splitext(filename)[0])
+        if n < len(frame_numbers):
+            file_path = os.path.join(output_dir, f'{prefix}%06d.{extension}' % frame_numbers[n])
+            os.replace(os.path.join(partial_dirpath, filename), file_path)
+            frames[frame_numbers[n]] = file_path
+    return frames
+
+
+IMAGE_FORMATS = ('png', 'jpeg', 'webp')
+
+
+def get_image_output_options(image_format:str = 'png', quality:int = 90)->tuple:
+    """File extension and `ffmpeg` encoder options of a frame image format.
+
+    Args:
+        image_format (str, optional): `png` (lossless, `quality` is ignored), `jpeg` or `webp`. Defaults to 'png'.
+        quality (int, optional): from 1 (smallest files) to 100 (best quality) for `jpeg` and `webp`. Defaults to 90.
 
     Returns:
-        dict: _description_
+        tuple: (file extension, list of `ffmpeg` output options)
+    """
+    quality = min(max(int(quality), 1), 100)
+    if image_format == 'png':
+        return 'png', ['-c:v', 'png', '-pix_fmt', 'rgb24']
+    elif image_format == 'jpeg':
+        # the mjpeg qscale goes from 2 (best) to 31 (worst)
+        qscale = round(2 + (100 - quality) * 29 / 99)
+        return 'jpg', ['-c:v', 'mjpeg', '-pix_fmt', 'yuvj420p', '-q:v', str(qscale)]
+    elif image_format == 'webp':
+        return 'webp', ['-c:v', 'libwebp', '-pix_fmt', 'yuv420p', '-lossless', '0', '-quality', str(quality)]
+    else:
+        raise ValueError(f'Unknown image format `{image_format}`. Use one of {IMAGE_FORMATS}')
+
+
+def extract_frames_per_frame(
+    video_path:str, 
+    output_dir:str, 
+    n_seconds:int, 
+    total_frames:int, 
+    fps:float, 
+    prefix: str= 'frame', 
+    image_format: str = 'png', 
+    quality: int = 90,
+    start_frame: int = 0,
+    checkpoint_callback: Callable = None)->dict:
+    """ Extracts video frames every `n_seconds` starting one `ffmpeg` process per frame. 
+    
+    Each process decodes the video from the first frame until the selected frame, 
+    kept as reference for benchmarking against `extract_frames_single_pass`.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
     """
 
     temp_frames = {}
-    step = int(n_seconds*fps)
-    for i in range(0, total_frames, step):
-        temp_frames[i] = []
-        temp_file_descriptor, temp_file_path = tempfile.mkstemp(prefix=f'{prefix.strip().replace(" ", "_")}%06d_' % i, suffix=f'.png', dir=output_dir)
-        os.close(temp_file_descriptor)
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-
-        # new_file_path = #os.path.join(output_dir, "frame%06d.jpg" % i )
-        subprocess.call(['ffmpeg', '-i', video_path, '-vf', 'select=gt(n\,{})'.format(i-1), '-pix_fmt', 'yuv420p', '-vframes', '1', '-f', 'image2', temp_file_path]) 
-        temp_frames[i] = temp_file_path
+    prefix = prefix.strip().replace(" ", "_")
+    extension, output_options = get_image_output_options(image_format=image_format, quality=quality)
+    for i in get_sampled_frame_numbers(n_seconds=n_seconds, total_frames=total_frames, fps=fps, start_frame=start_frame):
+        temp_file_path = os.path.join(output_dir, f'{prefix}%06d.{extension}' % i)
+        subprocess.call([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', video_path, 
+            '-vf', 'select=gt(n\\,{})'.format(i-1), *output_options, '-vframes', '1', '-f', 'image2', '-y', temp_file_path]) 
+        if os.path.isfile(temp_file_path):
+            temp_frames[i] = temp_file_path
+            if checkpoint_callback is not None:
+                checkpoint_callback({i: temp_file_path})
 
     return temp_frames
 
 
-def select_random_frames(frames:dict, num_frames:int = 10):
+def extract_frames_single_pass(
+    video_path:str, 
+    output_dir:str, 
+    n_seconds:int, 
+    total_frames:int, 
+    fps:float, 
+    prefix: str= 'frame', 
+    image_format: str = 'png', 
+    quality: int = 90,
+    start_frame: int = 0,
+    keyframe_index: dict = None,
+    checkpoint_callback: Callable = None,
+    checkpoint_interval: float = 1.0)->dict:
+    """ Extracts video frames every `n_seconds` decoding the video only once.
+
+    A single `ffmpeg` process selects every `step` frame with the `select` filter and writes all the 
+    sampled frames as an image sequence. The frames are written to a scratch directory and 
+    moved while `ffmpeg` runs to `<prefix><frame_number>.<extension>` in `output_dir`, so the frames 
+    written before an interruption are kept. With `start_frame` the video is decoded only from the 
+    first sampled frame at or after it.
+
+    Args:
+        video_path (str): path to the video file.
+        output_dir (str): directory where the frames are saved.
+        n_seconds (int): sampling interval in seconds.
+        total_frames (int): number of frames in the video.
+        fps (float): frames per second of the video.
+        prefix (str, optional): prefix of the frame filenames. Defaults to 'frame'.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        start_frame (int, optional): first sampled frame to extract. Defaults to 0.
+        keyframe_index (dict, optional): index from `get_keyframe_index` to seek to `start_frame`. 
+            Built if required and not given. Defaults to None.
+        checkpoint_callback (Callable, optional): called with the dict of frames moved to `output_dir` 
+            every `checkpoint_interval` seconds. Defaults to None.
+        checkpoint_interval (float, optional): seconds between checkpoints. Defaults to 1.0.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    frames = {}
+    extension, output_options = get_image_output_options(image_format=image_format, quality=quality)
+    step = get_frame_step(n_seconds=n_seconds, fps=fps)
+    frame_numbers = get_sampled_frame_numbers(n_seconds=n_seconds, total_frames=total_frames, fps=fps, start_frame=start_frame)
+    if not frame_numbers:
+        return frames
+    prefix = prefix.strip().replace(" ", "_")
+
+    seek_options = []
+    if frame_numbers[0] > 0:
+        if keyframe_index is None:
+            keyframe_index = get_keyframe_index(video_path=video_path)
+        if frame_numbers[0] < len(keyframe_index['pts_time']):
+            seek_options = ['-ss', f'{get_seek_time(keyframe_index["pts_time"], frame_numbers[0]):.6f}']
+
+    def checkpoint(completed:bool):
+        moved = collect_partial_frames(
+            partial_dirpath=partial_dirpath, output_dir=output_dir, frame_numbers=frame_numbers, 
+            prefix=prefix, extension=extension, completed=completed)
+        frames.update(moved)
+        if moved and checkpoint_callback is not None:
+            checkpoint_callback(moved)
+
+    partial_dirpath = get_partial_dirpath(output_dir=output_dir, prefix=prefix)
+    try:
+        # after seeking `n` counts from `start_frame`
+        process = subprocess.Popen([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', *seek_options, '-i', video_path, 
+            '-vf', 'select=not(mod(n\\,{}))'.format(step), '-vsync', 'vfr', 
+            *output_options, '-start_number', '0', '-f', 'image2', 
+            os.path.join(partial_dirpath, f'%06d.{extension}')])
+        try:
+            while True:
+                try:
+                    process.wait(timeout=checkpoint_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    checkpoint(completed=False)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        checkpoint(completed=process.returncode == 0)
+    finally:
+        shutil.rmtree(partial_dirpath, ignore_errors=True)
+
+    return frames
+
+
+def get_keyframe_index(video_path:str, index_filepath:str = None)->dict:
+    """Builds the keyframe/PTS index of the first video stream of `video_path`.
+
+    The index is read with `ffprobe` from the packets of the container, the video is not decoded. 
+    Packets are sorted by presentation timestamp so the position in `pts_time` is the frame number.
+    If `index_filepath` is given the index is stored as json and reused while the size and 
+    modification time of the video do not change.
+
+    Args:
+        video_path (str): path to the video file.
+        index_filepath (str, optional): json file to cache the index. Defaults to None.
+
+    Returns:
+        dict: `pts_time` (list) presentation time in seconds of every frame and 
+            `keyframes` (list) frame numbers of the keyframes.
+    """
+    signature = {'size': os.path.getsize(video_path), 'mtime': os.path.getmtime(video_path)}
+
+    if index_filepath is not None and os.path.isfile(index_filepath):
+        with open(index_filepath, 'r') as f:
+            index = json.load(f)
+        if index.get('signature') == signature:
+            return index
+
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0', 
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=print_section=0', video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+
+    packets = []
+    for line in result.stdout.splitlines():
+        values = line.strip().split(',')
+        if len(values) < 2 or values[0] == 'N/A':
+            continue
+        pts_time, flags = values[0], values[1]
+        # Discarded packets (i.e. outside of the edit list) are never presented
+        if 'D' in flags:
+            continue
+        packets.append((float(pts_time), 'K' in flags))
+    packets.sort()
+
+    index = {
+        'signature': signature,
+        'pts_time': [pts_time for pts_time, _ in packets],
+        'keyframes': [i for i, (_, is_keyframe) in enumerate(packets) if is_keyframe]
+        }
+
+    if index_filepath is not None:
+        with open(index_filepath, 'w') as f:
+            json.dump(index, f)
+
+    return index
+
+
+def get_nearest_keyframe(keyframe_index:dict, frame_number:int)->int:
+    """Frame number of the nearest keyframe before (or at) `frame_number`.
+    """
+    keyframes = keyframe_index['keyframes']
+    position = bisect.bisect_right(keyframes, frame_number) - 1
+    return keyframes[position] if position >= 0 else 0
+
+
+def group_frames_by_keyframe(keyframe_index:dict, frame_numbers:list)->list:
+    """Groups the sorted `frame_numbers` that can be decoded in one run.
+
+    A new group starts whenever there is a keyframe between two consecutive frame numbers, 
+    from there seeking is cheaper than keep decoding forward.
+
+    Returns:
+        list: list of lists of frame numbers
+    """
+    groups = []
+    previous = None
+    for frame_number in sorted(set(frame_numbers)):
+        if previous is None or get_nearest_keyframe(keyframe_index, frame_number) > previous:
+            groups.append([])
+        groups[-1].append(frame_number)
+        previous = frame_number
+    return groups
+
+
+def get_analysis_output_options(select:str, n_frames:int)->tuple:
+    """`ffmpeg` filter graph and output options to pipe the selected frames resized to `ANALYSIS_WIDTH` 
+    along with the frames written as images.
+
+    The `select` filter output is split: `[frames]` to be mapped to the images and a copy downscaled with 
+    area interpolation (as `frame_quality.compute_frame_quality`) piped to stdout as a stream of BMP images, 
+    see `read_bmp_stream`.
+
+    Returns:
+        tuple: (`-filter_complex` graph, list of `ffmpeg` output options of the analysis copy)
+    """
+    filter_complex = (
+        f'[0:v]select={select},split=2[frames][analysis];'
+        f"[analysis]scale=w='min(iw,{ANALYSIS_WIDTH})':h=-2:flags=area[small]")
+    return filter_complex, [
+        '-map', '[small]', '-frames:v', str(n_frames), '-c:v', 'bmp', '-pix_fmt', 'bgr24', '-f', 'image2pipe', 'pipe:1']
+
+
+def read_bmp_stream(data:bytes)->list:
+    """Decodes the BGR images of a stream of concatenated BMP files, the file size is in the header of each one."""
+    images = []
+    offset = 0
+    while offset + 6 <= len(data):
+        size = int.from_bytes(data[offset + 2:offset + 6], 'little')
+        if size <= 0 or offset + size > len(data):
+            break
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8, count=size, offset=offset), cv2.IMREAD_COLOR)
+        if image is None:
+            break
+        images.append(image)
+        offset += size
+    return images
+
+
+def grab_frames(
+    video_path:str, 
+    frame_numbers:list, 
+    output_dir:str, 
+    prefix:str = 'frame', 
+    keyframe_index:dict = None, 
+    progress_callback:Callable = None,
+    image_format:str = 'png',
+    quality:int = 90,
+    checkpoint_callback:Callable = None,
+    measure_quality:bool = False)->dict:
+    """Random access frame grabber. Extracts only the `frame_numbers` of the video without decoding the whole stream.
+
+    For every group of frames (see `group_frames_by_keyframe`) `ffmpeg` seeks on the input side (`-ss`) 
+    to the nearest keyframe before the first frame of the group and decodes forward only from there. 
+    The keyframe/PTS index is used to convert frame numbers to timestamps, so the returned frame is exact 
+    also for videos with B-frames or variable frame rate.
+
+    Args:
+        video_path (str): path to the video file.
+        frame_numbers (list): frame numbers to extract.
+        output_dir (str): directory where the frames are saved.
+        prefix (str, optional): prefix of the frame filenames. Defaults to 'frame'.
+        keyframe_index (dict, optional): index from `get_keyframe_index`. Built if not given. Defaults to None.
+        progress_callback (Callable, optional): called with the fraction of frames done before each group. Defaults to None.
+        image_format (str, optional): image format of the frames, see `IMAGE_FORMATS`. Defaults to 'png'.
+        quality (int, optional): quality from 1 to 100 of the lossy image formats. Defaults to 90.
+        checkpoint_callback (Callable, optional): called with the dict of frames written by each group. Defaults to None.
+        measure_quality (bool, optional): the same `ffmpeg` process also pipes a copy of the decoded frames resized 
+            to `ANALYSIS_WIDTH` (see `get_analysis_output_options`) and the `checkpoint_callback` gets their quality 
+            metrics as second argument, the frames are not decoded again from their file. Defaults to False.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    if keyframe_index is None:
+        keyframe_index = get_keyframe_index(video_path=video_path)
+
+    pts_time = keyframe_index['pts_time']
+    frame_numbers = [i for i in frame_numbers if 0 <= i < len(pts_time)]
+    prefix = prefix.strip().replace(" ", "_")
+    extension, output_options = get_image_output_options(image_format=image_format, quality=quality)
+
+    frames = {}
+    partial_dirpath = get_partial_dirpath(output_dir=output_dir, prefix=prefix)
+    try:
+        for group in group_frames_by_keyframe(keyframe_index, frame_numbers):
+            if progress_callback is not None:
+                progress_callback(len(frames) / max(1, len(frame_numbers)))
+            first = group[0]
+            seek_time = get_seek_time(pts_time, first)
+            select = '+'.join(['eq(n\\,{})'.format(i - first) for i in group])
+            frames_output = [
+                *output_options, '-start_number', '0', '-f', 'image2', 
+                os.path.join(partial_dirpath, f'%06d.{extension}')]
+
+            if not measure_quality:
+                subprocess.call([
+                    'ffmpeg', '-hide_banner', '-loglevel', 'error', '-ss', f'{seek_time:.6f}', '-i', video_path, 
+                    '-vf', f'select={select}', '-vsync', 'vfr', '-frames:v', str(len(group)), *frames_output])
+            else:
+                filter_complex, analysis_output = get_analysis_output_options(select=select, n_frames=len(group))
+                analysis = subprocess.run([
+                    'ffmpeg', '-hide_banner', '-loglevel', 'error', '-ss', f'{seek_time:.6f}', '-i', video_path, 
+                    '-filter_complex', filter_complex, '-vsync', 'vfr', 
+                    '-map', '[frames]', '-frames:v', str(len(group)), *frames_output, *analysis_output],
+                    stdout=subprocess.PIPE)
+
+            group_frames = collect_partial_frames(
+                partial_dirpath=partial_dirpath, output_dir=output_dir, frame_numbers=group, 
+                prefix=prefix, extension=extension, completed=True)
+            frames.update(group_frames)
+            if group_frames and checkpoint_callback is not None and not measure_quality:
+                checkpoint_callback(group_frames)
+            elif group_frames and checkpoint_callback is not None:
+                # the n-th piped image is the n-th frame of the group, as the written images
+                group_metrics = {
+                    frame_number: compute_frame_quality(image) 
+                    for frame_number, image in zip(group, read_bmp_stream(analysis.stdout))}
+                checkpoint_callback(group_frames, {i: group_metrics.get(i) for i in group_frames})
+    finally:
+        shutil.rmtree(partial_dirpath, ignore_errors=True)
+
+    return frames
+
+
+def select_random_frames(
+    frames:dict, 
+    num_frames:int = 10, 
+    min_hamming_distance:int = 0, 
+    hashes:dict = None, 
+    seed:int = None):
     """Randomly selects `num_frames` from the `frames` dictionary
 
+    With `min_hamming_distance` near duplicate frames (e.g. the camera resting on the seafloor) are rejected: 
+    the perceptual hashes of the selected frames differ at least in that many bits out of 64, 
+    see `frame_hashes.select_distinct_frames`.
+
     Args:
         frames (dict): video frames dictionary. Keys as frame number and values contain the filepath of the temporal frames
         num_frames (int): number of frames to sample. Defaults to 10.
+        min_hamming_distance (int, optional): minimum Hamming distance between the dHash of two selected frames, 
+            0 disables the rejection. Defaults to 0.
+        hashes (dict, optional): dHash per frame number, read from the hash cache of the frames if not given. Defaults to None.
+        seed (int, optional): seed of the random generator. Defaults to None.
 
     Returns:
         dict:  Keys as frame number and values contain the filepath of the sampled temporal frames.
     """
-    selected_keys = random.sample(frames.keys(), num_frames)
+    rng = random.Random(seed)
+    if not min_hamming_distance:
+        selected_keys = rng.sample(list(frames), min(num_frames, len(frames)))
+    else:
+        if hashes is None:
+            hashes = get_frame_hashes(frames)
+        selected_keys = select_distinct_frames(
+            frame_numbers=rng.sample(list(frames), len(frames)), 
+            hashes=hashes, 
+            num_frames=num_frames, 
+            min_hamming_distance=min_hamming_distance)
     return {key:frames[key] for key in selected_keys}
 
 
 
+SAMPLING_STRATEGIES = ('uniform', 'stratified', 'random')
+
+
+def get_candidate_frames(total_frames:int, fps:float, n_seconds:int = 5)->list:
+    """Frame numbers every `n_seconds`, the candidates to be sampled for interpretation.
+    """
+    step = get_frame_step(n_seconds=n_seconds, fps=fps)
+    return list(range(0, total_frames, step))
+
+
+def sample_frame_numbers(
+    total_frames:int, 
+    fps:float, 
+    num_frames:int = 10, 
+    strategy:str = 'uniform', 
+    n_seconds:int = 5, 
+    seed:int = None)->list:
+    """Chooses up front `num_frames` frame numbers among the candidate frames every `n_seconds`, 
+    so only those frames need to be decoded and written.
+
+    Args:
+        total_frames (int): number of frames in the video.
+        fps (float): frames per second of the video.
+        num_frames (int, optional): number of frames to sample. Defaults to 10.
+        strategy (str, optional): `uniform` evenly spaced in time, `stratified` one random frame per 
+            equal time interval or `random` simple random sampling. Defaults to 'uniform'.
+        n_seconds (int, optional): interval in seconds between candidate frames. Defaults to 5.
+        seed (int, optional): seed of the random generator for `stratified` and `random`. Defaults to None.
+
+    Returns:
+        list: sorted frame numbers
+    """
+    candidates = get_candidate_frames(total_frames=total_frames, fps=fps, n_seconds=n_seconds)
+    if num_frames >= len(candidates):
+        return candidates
+
+    rng = random.Random(seed)
+    if strategy == 'uniform':
+        positions = [round(k * (len(candidates) - 1) / max(1, num_frames - 1)) for k in range(num_frames)]
+        return [candidates[p] for p in positions]
+    elif strategy == 'stratified':
+        bounds = [round(k * len(candidates) / num_frames) for k in range(num_frames + 1)]
+        return [candidates[rng.randrange(bounds[k], bounds[k + 1])] for k in range(num_frames)]
+    elif strategy == 'random':
+        return sorted(rng.sample(candidates, num_frames))
+    else:
+        raise ValueError(f'Unknown sampling strategy `{strategy}`. Use one of {SAMPLING_STRATEGIES}')
+
+
+def oversample_frame_numbers(
+    frame_numbers:list, 
+    total_frames:int, 
+    fps:float, 
+    n_seconds:int = 5, 
+    oversample:int = 3, 
+    seed:int = None)->list:
+    """Candidates of the near duplicate rejection in order of preference: the sampled `frame_numbers`
+    followed by other candidate frames at random, up to `oversample` times as many frames.
+
+    Returns:
+        list: frame numbers, see `select_distinct_video_frames`.
+    """
+    sampled = set(frame_numbers)
+    others = [i for i in get_candidate_frames(total_frames=total_frames, fps=fps, n_seconds=n_seconds) if i not in sampled]
+    n_others = min(len(others), max(0, oversample - 1) * len(frame_numbers))
+    return list(frame_numbers) + random.Random(seed).sample(others, n_others)
+
+
+def select_distinct_video_frames(frames:dict, frame_numbers:list, num_frames:int, min_hamming_distance:int)->dict:
+    """`num_frames` of the extracted `frames` without near duplicates, preferred in the order of `frame_numbers`
+    (see `oversample_frame_numbers` and `frame_hashes.select_distinct_frames`).
+
+    Returns:
+        dict: frame number as key and filepath as value, sorted by frame number.
+    """
+    frame_numbers = [i for i in frame_numbers if i in frames]
+    hashes = get_frame_hashes({i: frames[i] for i in frame_numbers})
+    selected = select_distinct_frames(
+        frame_numbers=frame_numbers, 
+        hashes=hashes, 
+        num_frames=num_frames, 
+        min_hamming_distance=min_hamming_distance)
+    return {i: frames[i] for i in sorted(selected)}
+
+
+# Conversion methods to get a browser playable H.264 mp4, from cheapest to most expensive
+CONVERSION_METHODS = ('none', 'tag', 'remux', 'transcode')
+
+
+def probe_video_stream(video_path:str)->dict:
+    """Reads with `ffprobe` the codec, codec tag, pixel format and size of the first video stream and the container format.
+
+    Returns:
+        dict: `codec_name`, `codec_tag_string`, `pix_fmt`, `width`, `height` and `format_name`
+    """
+    result = subprocess.run([
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,codec_tag_string,pix_fmt,width,height:format=format_name',
+        '-of', 'json', video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    probe = json.loads(result.stdout)
+    streams = probe.get('streams') or [{}]
+    return {
+        'codec_name': streams[0].get('codec_name'),
+        'codec_tag_string': streams[0].get('codec_tag_string'),
+        'pix_fmt': streams[0].get('pix_fmt'),
+        'width': streams[0].get('width'),
+        'height': streams[0].get('height'),
+        'format_name': probe.get('format', {}).get('format_name', '')
+        }
+
+
+def plan_codec_conversion(video_path:str)->str:
+    """Chooses the cheapest conversion that makes the video playable as H.264 mp4 in the browser.
+
+    - `none`: already H.264 tagged `avc1` in an mp4 container.
+    - `tag`: H.264 in an mp4 container under a different FOURCC, the tag is rewritten.
+    - `remux`: H.264 in another container (i.e. mkv, avi), the stream is copied to mp4.
+    - `transcode`: any other codec or pixel format, full re-encode with `libx264`.
+
+    Returns:
+        str: one of `CONVERSION_METHODS`
+    """
+    stream = probe_video_stream(video_path=video_path)
+    if stream['codec_name'] != 'h264' or stream['pix_fmt'] not in ('yuv420p', 'yuvj420p'):
+        return 'transcode'
+    if 'mp4' not in stream['format_name'].split(','):
+        return 'remux'
+    if stream['codec_tag_string'] != 'avc1':
+        return 'tag'
+    return 'none'
+
+
+def get_converted_video_filename(video_name:str)->str:
+    """Filename of the H.264 mp4 version of a video created by SEAMS."""
+    return f'SEAMS__{os.path.splitext(video_name)[0]}.mp4'
+
+
 st.cache_data(show_spinner=True)
-def convert_codec(input_file, output_file)->bool:
+def convert_codec(
+    input_file, 
+    output_file, 
+    method:str = None, 
+    preset:str = 'medium', 
+    crf:int = 23, 
+    threads:int = 0)->bool:
     """
-    Converts video codec from 'hvc1' to 'h264' using FFmpeg.
+    Converts a video to a browser playable H.264 mp4 using FFmpeg.
+
+    Stream copy (`tag` or `remux`) is used when the video stream is already H.264, so the 
+    conversion takes seconds. Other codecs (i.e. 'hvc1') are transcoded with `libx264`.
 
     Args:
         input_file (str): The path to the input video file.
         output_file (str): The path to the output video file.
+        method (str, optional): one of `CONVERSION_METHODS`, chosen with `plan_codec_conversion` if None. Defaults to None.
+        preset (str, optional): `libx264` speed/quality preset of a transcode, from 'ultrafast' to 'veryslow'. Defaults to 'medium'.
+        crf (int, optional): `libx264` constant rate factor of a transcode, lower is better quality. Defaults to 23.
+        threads (int, optional): number of encoding threads of a transcode, 0 lets FFmpeg choose. Defaults to 0.
     
     Returns:
         True if successful else False
@@ -161,7 +795,7 @@ def convert_codec(input_file, output_file)->bool:
     # Check if FFmpeg is installed
     try:
         subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, FileNotFoundError):
         print('FFmpeg is not installed or is not in PATH')
         return False
 
@@ -170,9 +804,25 @@ def convert_codec(input_file, output_file)->bool:
         print(f'Input file {input_file} does not exist')
         return False
 
+    if method is None:
+        method = plan_codec_conversion(video_path=input_file)
+
+    if method == 'transcode':
+        codec_args = [
+            '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-threads', str(threads), 
+            '-pix_fmt', 'yuv420p']
+    elif method in ('none', 'tag', 'remux'):
+        # the video stream is already H.264, copy it and only rewrite the tag and container
+        codec_args = ['-c:v', 'copy', '-tag:v', 'avc1']
+    else:
+        raise ValueError(f'Unknown conversion method `{method}`. Use one of {CONVERSION_METHODS}')
+
     # Execute FFmpeg command
     try:
-        subprocess.run(['ffmpeg', '-i', input_file, '-vcodec', 'libx264', '-acodec', 'copy', '-y', output_file], check=True)
+        subprocess.run(
+            ['ffmpeg', '-hide_banner', '-i', input_file, '-map', '0:v:0', '-map', '0:a?'] + codec_args + 
+            ['-c:a', 'copy', '-movflags', '+faststart', '-y', output_file], 
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
     except subprocess.CalledProcessError as e:
         print(f'Error occurred while converting the file: {e.stderr.decode("utf-8")}')
         return False
@@ -181,109 +831,532 @@ def convert_codec(input_file, output_file)->bool:
         return True
 
     
+def get_proxy_filepath(video_path:str, proxies_dirpath:str)->str:
+    """Filepath of the browser playback proxy of a video. Its frame mapping is saved next to it as `.json`."""
+    return os.path.join(proxies_dirpath, f'PROXY__{os.path.splitext(os.path.basename(video_path))[0]}.mp4')
+
+
+def generate_proxy(
+    video_path:str, 
+    output_file:str, 
+    height:int = 480, 
+    gop_seconds:float = 1.0, 
+    crf:int = 28, 
+    preset:str = 'veryfast')->dict:
+    """Creates a small H.264 proxy of a video for browser playback and scrubbing.
+
+    The proxy is downscaled to `height` (never upscaled), has a keyframe every `gop_seconds` 
+    for fast seeking, no audio and the `moov` atom at the start of the file (faststart). 
+    Frames and timestamps are passed through, so a proxy frame is the same instant as the source frame.
+    The mapping back to the original video is saved as json next to the proxy.
+
+    Args:
+        video_path (str): path to the original video.
+        output_file (str): path to the proxy mp4 file.
+        height (int, optional): maximum height in pixels of the proxy. Defaults to 480.
+        gop_seconds (float, optional): seconds between keyframes. Defaults to 1.0.
+        crf (int, optional): `libx264` constant rate factor. Defaults to 28.
+        preset (str, optional): `libx264` preset. Defaults to 'veryfast'.
+
+    Returns:
+        dict: proxy mapping, see `load_proxy_mapping`. `None` if the proxy could not be created.
+    """
+    video_info = get_video_info(video_path=video_path)
+    gop = max(1, round(video_info['fps'] * gop_seconds))
+
+    try:
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-i', video_path, '-map', '0:v:0', 
+            '-vf', f'scale=-2:min(ih\\,{height})', '-vsync', 'passthrough',
+            '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-an', '-movflags', '+faststart', '-y', output_file],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f'Error occurred while creating the proxy: {e.stderr.decode("utf-8")}')
+        return None
+
+    proxy_info = get_video_info(video_path=output_file)
+    mapping = {
+        'source_path': video_path,
+        'proxy_path': output_file,
+        'source_fps': video_info['fps'],
+        'proxy_fps': proxy_info['fps'],
+        'source_frame_count': video_info['frame_count'],
+        'proxy_frame_count': proxy_info['frame_count'],
+        'source_size': [video_info['width'], video_info['height']],
+        'proxy_size': [proxy_info['width'], proxy_info['height']],
+        'gop': gop
+        }
+    with open(f'{os.path.splitext(output_file)[0]}.json', 'w') as f:
+        json.dump(mapping, f, indent=2)
+    return mapping
+
+
+def load_proxy_mapping(proxy_path:str)->dict:
+    """Mapping of a proxy back to its original video, `None` if there is no proxy.
+
+    Returns:
+        dict: `source_path`, `proxy_path`, `source_fps`, `proxy_fps`, `source_frame_count`, 
+            `proxy_frame_count`, `source_size`, `proxy_size` and `gop`.
+    """
+    mapping_path = f'{os.path.splitext(proxy_path)[0]}.json'
+    if not (os.path.isfile(proxy_path) and os.path.isfile(mapping_path)):
+        return None
+    with open(mapping_path, 'r') as f:
+        return json.load(f)
+
+
+def proxy_frame_to_source_frame(proxy_frame:int, mapping:dict)->int:
+    """Frame number in the original video of a proxy frame."""
+    source_frame = round(proxy_frame * mapping['source_fps'] / mapping['proxy_fps'])
+    return min(max(source_frame, 0), mapping['source_frame_count'] - 1)
+
+
+def source_frame_to_proxy_frame(source_frame:int, mapping:dict)->int:
+    """Frame number in the proxy of a frame of the original video."""
+    proxy_frame = round(source_frame * mapping['proxy_fps'] / mapping['source_fps'])
+    return min(max(proxy_frame, 0), mapping['proxy_frame_count'] - 1)
+
+
+def proxy_point_to_source_point(x:float, y:float, mapping:dict)->tuple:
+    """Pixel coordinates in the original resolution of a point in a proxy frame."""
+    (source_width, source_height), (proxy_width, proxy_height) = mapping['source_size'], mapping['proxy_size']
+    return x * source_width / proxy_width, y * source_height / proxy_height
+
+
+SPRITES_INDEX_FILENAME = 'sprites.json'
+
+
+def get_sprites_dirpath(video_path:str, sprites_dirpath:str)->str:
+    """Directory of the sprite sheets of a video."""
+    return os.path.join(sprites_dirpath, os.path.splitext(os.path.basename(video_path))[0])
+
+
+def generate_sprite_sheets(
+    video_path:str, 
+    output_dir:str, 
+    interval_seconds:float = None, 
+    max_thumbnails:int = 200,
+    thumbnail_width:int = 160, 
+    columns:int = 10, 
+    rows:int = 10,
+    quality:int = 75)->dict:
+    """Creates the timeline previews of a video decoding it only once.
+
+    A single `ffmpeg` process takes a frame every `interval_seconds` (`fps` filter), scales it down to 
+    `thumbnail_width` and tiles the thumbnails in JPEG sprite sheets of `columns` x `rows`. 
+    The index saved as `sprites.json` in `output_dir` locates the thumbnail `k` (at `k * interval_seconds`) 
+    in sheet `k // (columns * rows)`, column `k % columns` and row `k // columns % rows`.
+
+    Args:
+        video_path (str): path to the video file.
+        output_dir (str): directory of the sprite sheets of the video.
+        interval_seconds (float, optional): seconds between thumbnails. By default the interval that gives 
+            at most `max_thumbnails` thumbnails over the video (at least 1 second). Defaults to None.
+        max_thumbnails (int, optional): number of thumbnails when `interval_seconds` is not given. Defaults to 200.
+        thumbnail_width (int, optional): width in pixels of the thumbnails. Defaults to 160.
+        columns (int, optional): thumbnails per row of a sheet. Defaults to 10.
+        rows (int, optional): rows per sheet. Defaults to 10.
+        quality (int, optional): JPEG quality from 1 to 100 of the sheets. Defaults to 75.
+
+    Returns:
+        dict: the sprites index, `None` if the sheets could not be created.
+    """
+    video_info = get_video_info(video_path=video_path)
+    duration = video_info['frame_count'] / video_info['fps']
+    if interval_seconds is None:
+        interval_seconds = max(1.0, duration / max_thumbnails)
+    _, output_options = get_image_output_options(image_format='jpeg', quality=quality)
+
+    os.makedirs(output_dir, exist_ok=True)
+    partial_dirpath = get_partial_dirpath(output_dir=output_dir, prefix='sprites')
+    try:
+        try:
+            subprocess.run([
+                'ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', video_path, '-an',
+                '-vf', f'fps=1/{interval_seconds:.6f},scale={thumbnail_width}:-2,tile={columns}x{rows}',
+                '-vsync', 'vfr', *output_options, '-start_number', '0', '-f', 'image2',
+                os.path.join(partial_dirpath, 'sheet%03d.jpg')], 
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        except subprocess.CalledProcessError as e:
+            print(f'Error occurred while creating the sprite sheets: {e.stderr.decode("utf-8")}')
+            return None
+
+        sheets = sorted(os.listdir(partial_dirpath))
+        if not sheets:
+            return None
+        with Image.open(os.path.join(partial_dirpath, sheets[0])) as sheet:
+            sheet_width, sheet_height = sheet.size
+        for filename in sheets:
+            os.replace(os.path.join(partial_dirpath, filename), os.path.join(output_dir, filename))
+    finally:
+        shutil.rmtree(partial_dirpath, ignore_errors=True)
+
+    sprites_index = {
+        'video_path': video_path,
+        'duration': duration,
+        'fps': video_info['fps'],
+        'interval_seconds': interval_seconds,
+        'count': min(max(1, round(duration / interval_seconds)), len(sheets) * columns * rows),
+        'thumbnail_width': sheet_width // columns,
+        'thumbnail_height': sheet_height // rows,
+        'columns': columns,
+        'rows': rows,
+        'sheets': sheets
+        }
+    with open(os.path.join(output_dir, SPRITES_INDEX_FILENAME), 'w') as f:
+        json.dump(sprites_index, f, indent=2)
+    return sprites_index
+
+
+def load_sprites_index(sprites_dirpath:str)->dict:
+    """Index of the sprite sheets in `sprites_dirpath`, `None` if they were not created."""
+    index_filepath = os.path.join(sprites_dirpath, SPRITES_INDEX_FILENAME)
+    if not os.path.isfile(index_filepath):
+        return None
+    with open(index_filepath, 'r') as f:
+        return json.load(f)
+
+
+def drop_low_quality_frames(frames:dict, frames_dirpath:str)->dict:
+    """Frames not raising quality flags (see `frame_quality`) according to the metrics in the frame manifest."""
+    manifest_frames = load_frame_manifest(frames_dirpath)['frames']
+    return {i: v for i, v in frames.items() if is_usable_frame((manifest_frames.get(str(i)) or {}).get('metrics'))}
+
+
+# seconds from a rejected frame of the candidates replacing it, in the order they are tried
+REPLACEMENT_OFFSETS = (1, -1, 2, -2)
+
+
+def replace_rejected_frames(frames:dict, frame_numbers:list, extract:Callable, total_frames:int, fps:float)->dict:
+    """Replaces each of the `frame_numbers` missing from `frames` (i.e. rejected by the quality flags) with a frame nearby.
+
+    The frames `REPLACEMENT_OFFSETS` seconds away from the rejected ones are extracted with `extract` 
+    (a function of the list of frame numbers returning the usable frames) until a usable one is found. 
+    A warning is printed for the rejected frames without usable replacement, the result has then fewer frames.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the frames, in the order of 
+            `frame_numbers` with the replacements in place of the rejected frames.
+    """
+    frames = dict(frames)
+    selected = {i: i for i in frame_numbers if i in frames}
+    tried = set(frame_numbers)
+    for offset in REPLACEMENT_OFFSETS:
+        rejected = [i for i in frame_numbers if i not in selected]
+        candidates = {}
+        for i in rejected:
+            candidate = i + round(offset * fps)
+            if 0 <= candidate < total_frames and candidate not in tried:
+                candidates[i] = candidate
+                tried.add(candidate)
+        if not candidates:
+            continue
+        frames.update(extract(sorted(candidates.values())) or {})
+        selected.update({i: candidate for i, candidate in candidates.items() if candidate in frames})
+
+    rejected = [i for i in frame_numbers if i not in selected]
+    if rejected:
+        print(f'Warning: no usable frame near the rejected frames {rejected}, {len(selected)} of {len(frame_numbers)} frames extracted')
+    return {selected[i]: frames[selected[i]] for i in frame_numbers if i in selected}
+
+
 st.cache_data(show_spinner=True)
-def extract_frames(video_filepath, frames_dirpath):
+def extract_frames(
+    video_filepath, 
+    frames_dirpath, 
+    frame_numbers:list = None, 
+    progress_callback:Callable = None, 
+    image_format:str = 'png', 
+    quality:int = 90,
+    decoder_backend:str = 'ffmpeg',
+    remote_cache_dirpath:str = None,
+    skip_low_quality:bool = False,
+    replace_low_quality:bool = True):
+    """Extracts the frames of a video in `frames_dirpath`.
+
+    If `frame_numbers` is given only those frames are extracted with `grab_frames`, or decoded in this 
+    process with `decoders.grab_frames_in_process` if `decoder_backend` is not `ffmpeg`. 
+    Otherwise a frame every 5 seconds is extracted from the whole video in a single `ffmpeg` pass.
+    The extraction is resumable: frames are recorded in the frame manifest of `frames_dirpath` 
+    as soon as they are written, and the frames already in the manifest (see `get_valid_frames`) 
+    are not extracted again.
+
+    Videos on HTTP(S) servers are read with range requests (see `remote_media.grab_remote_frames`),
+    only the byte ranges of the needed frames are fetched and kept in `remote_cache_dirpath`.
+
+    The quality metrics of every frame (see `frame_quality`) are recorded in the manifest. They are measured 
+    on the decoded image: the in-process decoders measure it before writing, `grab_frames` gets a downscaled 
+    copy from the same `ffmpeg` process. Only the frames of the single pass are measured afterwards from their file.
+    With `skip_low_quality` the frames raising quality flags are left out of the result, and 
+    the in-process decoders do not write them. With `replace_low_quality` each of the `frame_numbers` 
+    left out is replaced by a usable frame nearby, see `replace_rejected_frames`.
+
+    Returns:
+        dict: Keys as frame number and values contain the filepath of the extracted frames.
+    """
+    if skip_low_quality and replace_low_quality and frame_numbers is not None:
+        extraction_options = dict(
+            video_filepath=video_filepath,
+            frames_dirpath=frames_dirpath,
+            progress_callback=progress_callback,
+            image_format=image_format,
+            quality=quality,
+            decoder_backend=decoder_backend,
+            remote_cache_dirpath=remote_cache_dirpath,
+            skip_low_quality=True,
+            replace_low_quality=False)
+        frames = extract_frames(frame_numbers=frame_numbers, **extraction_options)
+        if len(frames) == len(frame_numbers):
+            return frames
+        video_info = get_video_info(video_path=video_filepath)
+        return replace_rejected_frames(
+            frames=frames,
+            frame_numbers=frame_numbers,
+            extract=lambda candidates: extract_frames(frame_numbers=candidates, **extraction_options),
+            total_frames=video_info['frame_count'],
+            fps=video_info['fps'])
+
+    if video_filepath is not None and is_url(video_filepath):
+        from seams.remote_media import extract_remote_frames
+        return extract_remote_frames(
+            url=video_filepath,
+            frames_dirpath=frames_dirpath,
+            frame_numbers=frame_numbers,
+            cache_dirpath=remote_cache_dirpath,
+            progress_callback=progress_callback,
+            image_format=image_format,
+            quality=quality,
+            skip_low_quality=skip_low_quality)
         
     if video_filepath is not None and os.path.isfile(video_filepath):
+        remove_stale_partial_dirs(frames_dirpath)
+
+        def checkpoint(new_frames:dict, frame_metrics:dict = None):
+            if frame_metrics is None:
+                frame_metrics = {i: compute_frame_quality_from_file(filepath) for i, filepath in new_frames.items()}
+            update_frame_manifest(
+                frames_dirpath=frames_dirpath, video_path=video_filepath, 
+                frames=new_frames, image_format=image_format, quality=quality, frame_metrics=frame_metrics)
+
+        keyframe_index = get_keyframe_index(
+            video_path=video_filepath, 
+            index_filepath=os.path.join(frames_dirpath, 'keyframe_index.json'))
+
+        if frame_numbers is not None:
+            frames = get_valid_frames(
+                frames_dirpath=frames_dirpath, video_path=video_filepath, 
+                frame_numbers=frame_numbers, image_format=image_format, quality=quality)
+            missing_frames = [i for i in frame_numbers if i not in frames]
+            if missing_frames and decoder_backend != 'ffmpeg':
+                from seams.decoders import grab_frames_in_process
+                frames.update(grab_frames_in_process(
+                    video_path=video_filepath, 
+                    frame_numbers=missing_frames, 
+                    output_dir=frames_dirpath, 
+                    decoder_backend=decoder_backend,
+                    keyframe_index=keyframe_index,
+                    progress_callback=progress_callback,
+                    image_format=image_format,
+                    quality=quality,
+                    checkpoint_callback=checkpoint,
+                    skip_low_quality=skip_low_quality))
+            elif missing_frames:
+                frames.update(grab_frames(
+                    video_path=video_filepath, 
+                    frame_numbers=missing_frames, 
+                    output_dir=frames_dirpath, 
+                    keyframe_index=keyframe_index,
+                    progress_callback=progress_callback,
+                    image_format=image_format,
+                    quality=quality,
+                    checkpoint_callback=checkpoint,
+                    measure_quality=True))
+            if skip_low_quality:
+                frames = drop_low_quality_frames(frames, frames_dirpath=frames_dirpath)
+            return {i: frames[i] for i in frame_numbers if i in frames}
+
         video_info =  get_video_info(video_path=video_filepath)
-        st.write(video_info)
-        temp_frames = extract_frames_every_n_seconds(
-        video_path=video_filepath, 
-        output_dir=frames_dirpath,
-        n_seconds=5, 
-        total_frames=video_info['frame_count'], 
-        fps=video_info['fps']
-        )
+        sampled_frames = get_sampled_frame_numbers(
+            n_seconds=5, total_frames=video_info['frame_count'], fps=video_info['fps'])
+        temp_frames = get_valid_frames(
+            frames_dirpath=frames_dirpath, video_path=video_filepath, 
+            frame_numbers=sampled_frames, image_format=image_format, quality=quality)
+
+        # frames missing before the last extracted one are grabbed, the rest continues in a single pass
+        last_done = max(temp_frames, default=-1)
+        missing_frames = [i for i in sampled_frames if i not in temp_frames and i < last_done]
+        if missing_frames:
+            temp_frames.update(grab_frames(
+                video_path=video_filepath, 
+                frame_numbers=missing_frames, 
+                output_dir=frames_dirpath, 
+                keyframe_index=keyframe_index,
+                image_format=image_format,
+                quality=quality,
+                checkpoint_callback=checkpoint,
+                measure_quality=True))
+        temp_frames.update(extract_frames_single_pass(
+            video_path=video_filepath, 
+            output_dir=frames_dirpath,
+            n_seconds=5, 
+            total_frames=video_info['frame_count'], 
+            fps=video_info['fps'],
+            image_format=image_format,
+            quality=quality,
+            start_frame=last_done + 1,
+            keyframe_index=keyframe_index,
+            checkpoint_callback=checkpoint))
+        temp_frames = {i: temp_frames[i] for i in sampled_frames if i in temp_frames}
+        if skip_low_quality:
+            temp_frames = drop_low_quality_frames(temp_frames, frames_dirpath=frames_dirpath)
 
-        if temp_frames:
-            st.write(temp_frames)
         return temp_frames
 
 
 def video_player(
-    video_filepath, 
-    marker_frame_positions = [100, 200, 500, 850, 1100, 1500, 2000, 3000, 4000]):
-    """Video player requires video MP4 codec in H.264
-    """
-    #st.set_page_config(page_title="Video Player", page_icon=":film_strip", layout="wide")
-    st.markdown('## Video timeline')
-    # Create the custom component using st.beta_expander
+    video_url:str, 
+    duration:float,
+    fps:float,
+    marker_frame_positions:list = None,
+    sprites_index:dict = None,
+    sprites_url:str = None,
+    height:int = 560):
+    """Video player with a timeline of the marked frames and thumbnail previews on hover.
 
-    with st.expander("Show video frames"):
-        st.write("""
-        <link rel="stylesheet" href="https://cdn.plyr.io/3.6.2/plyr.css" />
-        <video id="player" controls crossorigin playsinline>
-            <source src="{}" type="video/mp4" />
-        </video>
+    The timeline is a single element, markers are placed at their percentage of the duration 
+    and the preview is a window over the sprite sheets (see `generate_sprite_sheets`), 
+    so the page size does not depend on the number of frames of the video.
+    Clicking the timeline or a marker seeks the video.
 
-        <script src="https://cdn.plyr.io/3.6.2/plyr.js"></script>
-        <script>
-            const player = new Plyr('#player');
-        var timeline = document.getElementById("timeline");
-        var markers = document.getElementsByClassName("marker");
-        var currentFrame = 0;
-        var currentTime = 0;
-        var totalFrames = player.duration * player.fps;
-        var totalTime = player.duration;
-
-        // Create the timeline
-        for (var i = 0; i < totalFrames; i++) {{
-            var tick = document.createElement("div");
-            tick.classList.add("tick");
-            timeline.appendChild(tick);
-        }}
-
-        // Create the markers
-        for (var i = 0; i < {}.length; i++) {{
-            var marker = document.createElement("div");
-            marker.classList.add("marker");
-            marker.setAttribute("data-frame", {}[i]);
-            timeline.appendChild(marker);
-        }}
-
-        // Update the timeline and markers position
-        player.on("timeupdate", event => {{
-            currentFrame = Math.round(event.detail.plyr.currentTime * player.fps);
-            currentTime = event.detail.plyr.currentTime;
-            var minutes = Math.floor(currentTime / 60);
-            var seconds = Math.floor(currentTime - minutes * 60);
-            var time = minutes + ":" + seconds;
-            timeline.style.marginLeft = - currentFrame + "px";
-            for (var i = 0; i < markers.length; i++){{
-                if (markers[i].getAttribute("data-frame") == currentFrame) {{
-                    markers[i].innerHTML = currentFrame + "("+time+")";
-                }}
-            }}
-        }});
-        </script>
+    Args:
+        video_url (str): url of the video, H.264 mp4 (e.g. from the media server).
+        duration (float): duration of the video in seconds.
+        fps (float): frames per second used to convert the marker frame numbers to time.
+        marker_frame_positions (list, optional): frame numbers marked in the timeline. Defaults to None.
+        sprites_index (dict, optional): index of the sprite sheets of the video. Defaults to None.
+        sprites_url (str, optional): base url of the sprite sheets. Defaults to None.
+        height (int, optional): height in pixels of the component. Defaults to 560.
+    """
+    payload = {
+        'duration': duration,
+        'markers': [{'frame': int(i), 'time': int(i) / fps} for i in sorted(marker_frame_positions or [])],
+        'sprites': sprites_index if sprites_url else None,
+        'spritesUrl': sprites_url,
+        }
+    components.html("""
         <style>
-            /* Add styles for the timeline and markers here */
-            timeline {{
-                position: relative;
-                width: 100%;
-                height: 20px;
-                overflow: hidden;
-                }}
-                .tick {{
-                    position: absolute;
-                    width: 1px;
-                    height: 20px;
-                    background: #ccc;                    
-                }}
-                .marker {{
-                    position:absolute;
-                    width: 40px;
-                    height: 20px;
-                    background: #ff0000;
-                    color: #fff;
-                    text-align: center;
-                    font-size: 12px;
-                }}
+            body { margin: 0; font-family: sans-serif; }
+            video { width: 100%%; max-height: 440px; background: #000; }
+            #timeline { position: relative; height: 28px; margin: 8px 0 4px 0; background: #e6e6e6; cursor: pointer; }
+            #progress { position: absolute; top: 0; bottom: 0; left: 0; background: #9ecae1; pointer-events: none; }
+            .marker { position: absolute; top: 0; width: 3px; height: 28px; margin-left: -1px; background: #e41a1c; }
+            .marker:hover { width: 5px; margin-left: -2px; }
+            #preview { position: absolute; bottom: 34px; display: none; border: 1px solid #333; background-repeat: no-repeat; pointer-events: none; }
+            #preview span { position: absolute; bottom: 0; left: 0; right: 0; font-size: 11px; color: #fff; background: rgba(0, 0, 0, .5); text-align: center; }
+            #time { font-size: 12px; color: #555; }
         </style>
-        <div id="timeline"></dic>
-        """.format(video_filepath, marker_frame_positions, marker_frame_positions), unsafe_allow_html=True )
+        <video id="player" src="%(video_url)s" controls preload="metadata" playsinline></video>
+        <div id="timeline"><div id="progress"></div><div id="preview"><span></span></div></div>
+        <div id="time"></div>
+        <script>
+            const data = %(payload)s;
+            const player = document.getElementById('player');
+            const timeline = document.getElementById('timeline');
+            const progress = document.getElementById('progress');
+            const preview = document.getElementById('preview');
+            const timeLabel = document.getElementById('time');
+
+            const formatTime = t => Math.floor(t / 60) + ':' + String(Math.floor(t %% 60)).padStart(2, '0');
+
+            // one element per marker, positioned in percentage of the duration
+            data.markers.forEach(m => {
+                const marker = document.createElement('div');
+                marker.className = 'marker';
+                marker.style.left = (100 * m.time / data.duration) + '%%';
+                marker.title = 'frame ' + m.frame + ' (' + formatTime(m.time) + ')';
+                marker.addEventListener('click', e => { e.stopPropagation(); player.currentTime = m.time; });
+                timeline.appendChild(marker);
+            });
+
+            const timeAt = e => {
+                const rect = timeline.getBoundingClientRect();
+                return Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1) * data.duration;
+            };
+
+            timeline.addEventListener('click', e => { player.currentTime = timeAt(e); });
 
+            const sprites = data.sprites;
+            if (sprites) {
+                preview.style.width = sprites.thumbnail_width + 'px';
+                preview.style.height = sprites.thumbnail_height + 'px';
+                const perSheet = sprites.columns * sprites.rows;
+                timeline.addEventListener('mousemove', e => {
+                    const t = timeAt(e);
+                    const k = Math.min(Math.floor(t / sprites.interval_seconds), sprites.count - 1);
+                    const sheet = sprites.sheets[Math.floor(k / perSheet)];
+                    const col = k %% sprites.columns;
+                    const row = Math.floor(k / sprites.columns) %% sprites.rows;
+                    preview.style.backgroundImage = 'url(' + data.spritesUrl + '/' + sheet + ')';
+                    preview.style.backgroundPosition = (-col * sprites.thumbnail_width) + 'px ' + (-row * sprites.thumbnail_height) + 'px';
+                    const rect = timeline.getBoundingClientRect();
+                    const x = Math.min(Math.max(e.clientX - rect.left - sprites.thumbnail_width / 2, 0), rect.width - sprites.thumbnail_width);
+                    preview.style.left = x + 'px';
+                    preview.querySelector('span').textContent = formatTime(t);
+                    preview.style.display = 'block';
+                });
+                timeline.addEventListener('mouseleave', () => { preview.style.display = 'none'; });
+            }
 
+            player.addEventListener('timeupdate', () => {
+                progress.style.width = (100 * player.currentTime / data.duration) + '%%';
+                timeLabel.textContent = formatTime(player.currentTime) + ' / ' + formatTime(data.duration)
+                    + ' | frame ' + Math.round(player.currentTime * %(fps)s);
+            });
+        </script>
+        """ % {'video_url': video_url, 'payload': json.dumps(payload), 'fps': fps}, height=height)
+
+
+# --- tests
+
+def test_extract_frames_quality():
+    """Test for the quality metrics of extract_frames and the replacement of the rejected frames.
+    """
+    import tempfile
+    from seams.frame_quality import compute_frame_quality_from_file
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # 20 s test video, black from 4.5 to 5.5 s and from 9 to 11.5 s
+        video_path = os.path.join(temp_dir, 'test.mp4')
+        subprocess.run([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=25:duration=20',
+            '-vf', "drawbox=x=0:y=0:w=iw:h=ih:color=black:t=fill:enable='between(t,4.5,5.5)+between(t,9,11.5)'",
+            '-c:v', 'libx264', '-g', '50', '-pix_fmt', 'yuv420p', '-y', video_path], check=True)
 
+        # Metrics measured on the piped copy are close to the ones of the written frames
+        frames_dirpath = os.path.join(temp_dir, 'frames')
+        os.makedirs(frames_dirpath)
+        frames = extract_frames(video_filepath=video_path, frames_dirpath=frames_dirpath, frame_numbers=[0, 125, 250, 375])
+        assert sorted(frames) == [0, 125, 250, 375]
+        manifest_frames = load_frame_manifest(frames_dirpath)['frames']
+        for frame_number, filepath in frames.items():
+            metrics = manifest_frames[str(frame_number)]['metrics']
+            reference = compute_frame_quality_from_file(filepath)
+            assert abs(metrics['luminance'] - reference['luminance']) < 0.01
+            assert abs(metrics['sharpness'] - reference['sharpness']) <= 0.05 * reference['sharpness'] + 1
+        assert not is_usable_frame(manifest_frames['125']['metrics'])
 
+        # The black frames are replaced by the nearest usable frame, in place
+        frames = extract_frames(
+            video_filepath=video_path, frames_dirpath=frames_dirpath, frame_numbers=[0, 125, 250, 375], skip_low_quality=True)
+        assert list(frames) == [0, 150, 300, 375]
 
+        # Without replacement the black frames are left out
+        frames = extract_frames(
+            video_filepath=video_path, frames_dirpath=frames_dirpath, frame_numbers=[0, 125, 250, 375], 
+            skip_low_quality=True, replace_low_quality=False)
+        assert list(frames) == [0, 375]
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)